@@ -0,0 +1,111 @@
+"""
+コンパイル済み予測器（src.serving.compiled）のベンチマーク。
+モデル種別ごとに元のモデルのpredict_probaと結果が一致することを確認し、
+1行・1,000行・100,000行の推論レイテンシと、保存した予測器の読み込み時間を比較する。
+
+実行例）
+python -m src.benchmarks.compiled --rows 500000
+"""
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+from src.utils.preprocess import preprocess_pipeline
+from src.train.experiment import split_dataset
+from src.train.trainer import get_model
+from src.serving.compiled import compile_model, load_compiled
+from src.benchmarks.preprocess import make_raw_trips
+
+
+MODEL_PARAMS = {
+    "logistic_regression": {"max_iter": 200},
+    "decision_tree": {"max_depth": 12},
+    "random_forest": {"n_estimators": 50, "max_depth": 10, "n_jobs": 1},
+    "lgbm": {"n_estimators": 100, "verbose": -1},
+    "xgboost": {"n_estimators": 100, "max_depth": 6, "n_jobs": 1},
+}
+
+# 別プロセスで読み込み時間と、重いライブラリをimportしていないことを確認する
+LOAD_SCRIPT = """
+import sys, time
+import numpy
+start = time.perf_counter()
+from src.serving.compiled import load_compiled
+model = load_compiled(sys.argv[1])
+elapsed = time.perf_counter() - start
+heavy = [m for m in ("lightgbm", "xgboost", "mlflow", "sklearn", "pandas") if m in sys.modules]
+print(f"{elapsed * 1000:.1f} ms, heavy imports: {','.join(heavy) or 'none'}")
+"""
+
+
+def check_equivalence(model, compiled, X) -> float:
+    """元のモデルと確率・ラベルが一致することを確認し、確率の最大誤差を返す"""
+    expected = model.predict_proba(X)[:, 1]
+    actual = compiled.predict_proba(X)[:, 1]
+    max_diff = float(np.max(np.abs(expected - actual)))
+    # XGBoostは葉の値をfloat32で合計するため、わずかな丸め誤差を許容する
+    assert max_diff < 1e-5, max_diff
+    assert np.mean((expected > 0.5) == (actual > 0.5)) > 0.9999
+    return max_diff
+
+
+def measure(func, repeat: int) -> float:
+    """funcを複数回実行し、1回あたりの最短時間（秒）を返す"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def measure_load(path: Path) -> str:
+    """新しいプロセスで予測器を読み込み、読み込み時間（NumPyのimportを除く）とimportされた重いライブラリを返す"""
+    result = subprocess.run(
+        [sys.executable, "-c", LOAD_SCRIPT, str(path)],
+        capture_output=True, text=True, check=True, cwd=Path(__file__).resolve().parents[2],
+    )
+    return result.stdout.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compiled predictors")
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--batch-rows", type=int, nargs="+", default=[1, 1_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--models", nargs="+", default=list(MODEL_PARAMS))
+    args = parser.parse_args()
+
+    df = preprocess_pipeline(make_raw_trips(args.rows))
+    X_train, X_test, y_train, y_test = split_dataset(df)
+    X = df.drop("is_member", axis=1)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name in args.models:
+            model = get_model(name, MODEL_PARAMS[name]).fit(X_train, y_train)
+            path = compile_model(model).save(Path(tmp_dir) / f"{name}.npz")
+            compiled = load_compiled(path)
+            max_diff = check_equivalence(model, compiled, X_test)
+
+            print(
+                f"{name:20s} max|diff|={max_diff:.1e}  size {path.stat().st_size / 1024:.1f} KB  "
+                f"load {measure_load(path)}"
+            )
+            for n_rows in args.batch_rows:
+                batch = X.iloc[:n_rows]
+                # 小さなバッチは1回が短いため、回数を増やして計測する
+                repeat = args.repeat * max(1, 1000 // n_rows)
+                native = measure(lambda: model.predict_proba(batch), repeat)
+                fast = measure(lambda: compiled.predict_proba(batch), repeat)
+                print(
+                    f"{'':20s} {n_rows:>9,} rows  native {native * 1e3:9.3f} ms  "
+                    f"compiled {fast * 1e3:9.3f} ms  ({native / fast:5.1f}x)"
+                )
+    print("Equivalence check passed.")
+
+
+if __name__ == "__main__":
+    main()
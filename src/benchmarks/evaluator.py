@@ -0,0 +1,131 @@
+"""
+評価処理のベンチマーク。sklearnのメトリクス関数を個別に呼ぶ旧実装と、
+1回のpredict_proba + bincountで全メトリクスを計算する evaluate_model_train_test を比較する。
+あわせて、月全体を一度に推論する evaluate_model と、バッチごとに推論する
+evaluate_model_batched の実行時間とピークメモリ（tracemalloc）を比較する。
+
+実行例）
+python -m src.benchmarks.evaluator --rows 1000000
+"""
+import argparse
+import time
+import tracemalloc
+import lightgbm as lgb
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, confusion_matrix, roc_auc_score
+from sklearn.metrics import log_loss as sklearn_log_loss
+from src.utils.preprocess import preprocess_pipeline
+from src.train.experiment import split_dataset
+from src.train.evaluator import evaluate_model_train_test, evaluate_model, evaluate_model_batched
+from src.benchmarks.preprocess import make_raw_trips
+
+
+def evaluate_model_train_test_reference(model, X_train, X_test, y_train, y_test):
+    """比較用：predictの後にsklearnのメトリクス関数を個別に呼ぶ旧実装"""
+    y_pred_train = model.predict(X_train)
+    y_pred_test = model.predict(X_test)
+
+    return {
+        "train_accuracy": accuracy_score(y_train, y_pred_train),
+        "train_f1_score": f1_score(y_train, y_pred_train, zero_division=0),
+        "test_accuracy": accuracy_score(y_test, y_pred_test),
+        "test_precision": precision_score(y_test, y_pred_test, zero_division=0),
+        "test_recall": recall_score(y_test, y_pred_test, zero_division=0),
+        "test_f1_score": f1_score(y_test, y_pred_test, zero_division=0),
+        "confusion_matrix": confusion_matrix(y_test, y_pred_test).tolist(),
+    }
+
+
+def check_equivalence(model, X_train, X_test, y_train, y_test):
+    """新旧実装のメトリクスと、確率系メトリクスがsklearnと一致することを確認"""
+    expected = evaluate_model_train_test_reference(model, X_train, X_test, y_train, y_test)
+    actual = evaluate_model_train_test(model, X_train, X_test, y_train, y_test)
+    chunked = evaluate_model_train_test(model, X_train, X_test, y_train, y_test, chunk_size=10_000)
+
+    for key, value in expected.items():
+        if key == "confusion_matrix":
+            assert actual[key] == value, (key, actual[key], value)
+        else:
+            assert np.isclose(actual[key], value, rtol=1e-12), (key, actual[key], value)
+
+    proba = model.predict_proba(X_test)[:, 1]
+    assert np.isclose(actual["test_roc_auc"], roc_auc_score(y_test, proba), rtol=1e-9)
+    assert np.isclose(actual["test_log_loss"], sklearn_log_loss(y_test, proba), rtol=1e-6)
+    assert chunked == actual
+
+    full = evaluate_model(model, X_test, y_test)
+    for n_threads in (1, 4):
+        batched = evaluate_model_batched(model, X_test, y_test, batch_size=10_000, n_threads=n_threads)
+        assert batched["confusion_matrix"] == full["confusion_matrix"]
+        assert np.isclose(batched["f1_score"], full["f1_score"], rtol=1e-12)
+        assert np.isclose(batched["log_loss"], full["log_loss"], rtol=1e-9)
+
+
+def peak_memory(func) -> float:
+    """funcの実行中にPython / NumPyが確保したメモリのピーク（MB）"""
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024 ** 2
+
+
+def measure(func, repeat: int = 3) -> float:
+    """funcを複数回実行し、最短の実行時間（秒）を返す"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark model evaluation")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--train-sample-rows", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=100_000)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    df = preprocess_pipeline(make_raw_trips(args.rows))
+    X_train, X_test, y_train, y_test = split_dataset(df)
+    models = {
+        "logistic_regression": LogisticRegression(max_iter=200).fit(X_train, y_train),
+        "lgbm": lgb.LGBMClassifier(n_estimators=100, verbose=-1).fit(X_train, y_train),
+    }
+
+    for name, model in models.items():
+        check_equivalence(model, X_train, X_test, y_train, y_test)
+    print("Equivalence check passed.")
+
+    for name, model in models.items():
+        results = {
+            "reference (predict + sklearn)": measure(
+                lambda: evaluate_model_train_test_reference(model, X_train, X_test, y_train, y_test), args.repeat),
+            "single pass": measure(
+                lambda: evaluate_model_train_test(model, X_train, X_test, y_train, y_test), args.repeat),
+            f"single pass (train {args.train_sample_rows:,} rows)": measure(
+                lambda: evaluate_model_train_test(
+                    model, X_train, X_test, y_train, y_test, train_sample_rows=args.train_sample_rows,
+                ), args.repeat),
+        }
+        for label, seconds in results.items():
+            print(f"{name:20s} {label:40s} {seconds:8.4f} s")
+
+        # 本番モデルの評価（月全体）
+        X, y = df.drop("is_member", axis=1), df["is_member"]
+        for label, func in {
+            "evaluate_model (full month)": lambda: evaluate_model(model, X, y),
+            "evaluate_model_batched": lambda: evaluate_model_batched(model, X, y, args.batch_size),
+            f"evaluate_model_batched ({args.threads} threads)": lambda: evaluate_model_batched(
+                model, X, y, args.batch_size, n_threads=args.threads),
+        }.items():
+            seconds = measure(func, args.repeat)
+            print(f"{name:20s} {label:40s} {seconds:8.4f} s  peak {peak_memory(func):8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
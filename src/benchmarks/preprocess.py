@@ -0,0 +1,88 @@
+"""
+preprocess_pipeline の実行時間とピークメモリのベンチマーク。
+旧実装（copy + merge + 列ごとのfloat変換）と現行実装を同じデータで比較する。
+
+実行例）
+python -m src.benchmarks.preprocess --rows 1000000
+"""
+import argparse
+import time
+import tracemalloc
+import warnings
+import pandas as pd
+from src.utils.io import RAW_DTYPES, RAW_DATETIME_COLUMNS
+from src.utils.preprocess import (
+    REQUIRED_COLUMNS,
+    preprocess_pipeline,
+    add_time_features,
+    add_target,
+    select_features,
+    convert_to_float,
+)
+from src.benchmarks.synthetic import generate_month
+
+
+def preprocess_pipeline_reference(df_org: pd.DataFrame, max_duration_min: int = 360) -> pd.DataFrame:
+    """比較用：全体copy・merge・列ごとのfloat変換を行う旧実装"""
+    warnings.simplefilter("ignore", pd.errors.SettingWithCopyWarning)
+    df = df_org.copy()
+    df["starttime"] = pd.to_datetime(df["starttime"])
+    df["stoptime"] = pd.to_datetime(df["stoptime"])
+    df["tripduration_min"] = df["tripduration"] / 60
+    df = df[df["tripduration_min"] < max_duration_min]
+    df = add_time_features(df)
+
+    station_usage = df.groupby("start station name", observed=True).size().reset_index(name="station_usage_count")
+    df = df.merge(station_usage, on="start station name", how="left")
+    bike_usage = df.groupby("bikeid", observed=True).size().reset_index(name="bike_usage_count")
+    df = df.merge(bike_usage, on="bikeid", how="left")
+
+    df = add_target(df)
+    df = select_features(df)
+    return convert_to_float(df)
+
+
+def make_raw_trips(n_rows: int, seed: int = 42) -> pd.DataFrame:
+    """
+    preprocess_pipelineが必要とする列だけを持つ1か月分（2014年7月）の生データを合成データ（src.benchmarks.synthetic）から作る。
+    型はload_month_dataで読み込んだ場合と同じにする。
+    """
+    df = generate_month(2014, 7, n_rows, seed)[REQUIRED_COLUMNS]
+    dtypes = {col: dtype for col, dtype in RAW_DTYPES.items() if col in df.columns}
+    dtypes.update({col: "datetime64[ns]" for col in RAW_DATETIME_COLUMNS})
+    return df.astype(dtypes)
+
+
+def profile(func, *args) -> tuple[float, float]:
+    """funcを実行し、(実行時間[秒], ピークメモリ[MB]) を返す"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024**2
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark preprocess_pipeline")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    df_raw = make_raw_trips(args.rows)
+    input_mb = df_raw.memory_usage(deep=True).sum() / 1024**2
+
+    # 新旧実装の出力が一致することを確認
+    pd.testing.assert_frame_equal(preprocess_pipeline(df_raw), preprocess_pipeline_reference(df_raw))
+    print(f"Equivalence check passed. rows={args.rows:,} input={input_mb:.1f} MB")
+
+    for name, func in [
+        ("reference (copy + merge)", preprocess_pipeline_reference),
+        ("preprocess_pipeline", preprocess_pipeline),
+    ]:
+        elapsed, peak_mb = profile(func, df_raw)
+        print(f"{name:26s} {elapsed:8.3f} s  peak {peak_mb:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
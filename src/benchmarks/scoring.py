@@ -0,0 +1,97 @@
+"""
+推論APIの負荷試験。同時リクエストを投げ、レイテンシ（p50 / p99）とスループット（rows/sec）を計測する。
+既定では合成データで学習したLightGBMを使う。--registry を付けるとproductionエイリアスのモデルを使う。
+
+実行例）
+python -m src.benchmarks.scoring --requests 500 --concurrency 32 --rows-per-request 20
+"""
+import argparse
+import asyncio
+import time
+import httpx
+import lightgbm as lgb
+import numpy as np
+from src.utils.io import load_config
+from src.utils.preprocess import preprocess_pipeline, build_usage_tables
+from src.serving.app import create_app
+from src.serving.scorer import ProductionModel
+from src.benchmarks.preprocess import make_raw_trips
+
+
+def make_payloads(n_requests: int, rows_per_request: int) -> list[dict]:
+    """リクエストごとのトリップをJSONにできる形で作成"""
+    df = make_raw_trips(n_requests * rows_per_request, seed=7)
+    df["starttime"] = df["starttime"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    df["stoptime"] = df["stoptime"].dt.strftime("%Y-%m-%d %H:%M:%S")
+    df = df.astype({"start station name": str, "usertype": str, "tripduration": int, "bikeid": int, "gender": int})
+    records = df.to_dict(orient="records")
+    return [
+        {"trips": records[i * rows_per_request:(i + 1) * rows_per_request]}
+        for i in range(n_requests)
+    ]
+
+
+def train_local_model(n_rows: int = 200_000):
+    """ベンチマーク用の小さなLightGBMモデルと、その学習データの利用回数テーブル"""
+    df_raw = make_raw_trips(n_rows)
+    usage_tables = build_usage_tables(df_raw)
+    df = preprocess_pipeline(df_raw, usage_tables=usage_tables)
+    model = lgb.LGBMClassifier(n_estimators=100, verbose=-1)
+    return model.fit(df.drop("is_member", axis=1), df["is_member"]), usage_tables
+
+
+async def load_test(app, payloads: list[dict], concurrency: int) -> tuple[np.ndarray, float]:
+    """concurrency本の同時接続でpayloadsを送り、各リクエストのレイテンシと全体時間を返す"""
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def send(payload):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/predict", json=payload)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        await send(payloads[0])  # ウォームアップ
+        latencies.clear()
+        start = time.perf_counter()
+        await asyncio.gather(*(send(p) for p in payloads))
+        elapsed = time.perf_counter() - start
+
+    return np.array(latencies), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the scoring service")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rows-per-request", type=int, default=20)
+    parser.add_argument("--registry", action="store_true", help="use the production alias from the registry")
+    args = parser.parse_args()
+
+    if args.registry:
+        holder = ProductionModel(load_config()["model_name"], refresh_interval=float("inf"))
+        holder.refresh(force=True)
+    else:
+        model, usage_tables = train_local_model()
+        holder = ProductionModel.from_model(model, usage_tables=usage_tables)
+
+    payloads = make_payloads(args.requests, args.rows_per_request)
+    total_rows = args.requests * args.rows_per_request
+
+    for name, max_batch_rows in [("no micro-batching", 1), ("micro-batching", 16384)]:
+        app = create_app(holder, max_batch_rows=max_batch_rows)
+        latencies, elapsed = asyncio.run(load_test(app, payloads, args.concurrency))
+        p50, p99 = np.percentile(latencies * 1000, [50, 99])
+        print(
+            f"{name:18s} p50 {p50:7.2f} ms  p99 {p99:7.2f} ms  "
+            f"{args.requests / elapsed:8.1f} req/sec  {total_rows / elapsed:10,.0f} rows/sec"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+合成データ（src.benchmarks.synthetic）を使ったパイプライン全体のベンチマーク。
+実データなしで、CLIと各パイプラインのimport時間、読み込み（io）・前処理・モデル種別ごとの学習・評価・MLflowへの記録の
+実行時間・CPU時間・メモリ（tracemallocのピーク）を計測し、JSONに保存する。
+lgbm / xgboost はビン分け済みデータセット（src.train.binned_dataset）の構築と再利用での学習も計測する。
+コミットごとの結果を --compare で比べ、遅くなったステージを確認できる。
+
+データと特徴量キャッシュ・MLflow（ファイルストア）は作業ディレクトリ（--workdir、既定は一時ディレクトリ）に置き、
+リポジトリの data/ や実際のTracking Serverには書き込まない。
+
+実行例）
+python -m src.benchmarks.suite --rows 1000000 --output bench.json
+python -m src.benchmarks.suite --rows 1000000 --compare bench.json --fail-on-regression
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from importlib import metadata
+from pathlib import Path
+import mlflow
+from src.utils.io import (
+    load_month_data, find_month_csvs, get_project_root, PROJECT_ROOT_ENV, DATA_DIR, INTERIM_DIR, CACHE_DIR,
+)
+from src.utils.preprocess import preprocess_pipeline, build_usage_tables, REQUIRED_COLUMNS
+from src.utils.lineage import build_lineage
+from src.utils.profiling import stage, set_profile_mode
+from src.train.experiment import split_dataset, build_dataset_params
+from src.train.trainer import get_model, train_model
+from src.train.binned_dataset import clear_binned_datasets, reuse_xgboost_matrices
+from src.train.evaluator import evaluate_model_train_test
+from src.train.mlflow_logger import log_experiment_to_mlflow
+from src.benchmarks.synthetic import write_month_csvs
+from src.benchmarks.compiled import MODEL_PARAMS
+
+
+BENCHMARK_DIR = "benchmarks"
+BENCHMARK_EXPERIMENT = "benchmark"
+# ビン分け済みデータセットを使う学習を計測するモデルと、そのデータセットのID
+BINNED_MODELS = ["lgbm", "xgboost"]
+BENCHMARK_DATASET_ID = "benchmark"
+PACKAGES = ["numpy", "pandas", "pyarrow", "scikit-learn", "lightgbm", "xgboost", "mlflow"]
+# import時間を計測するモジュール（コマンドの起動時間に相当する）
+IMPORT_MODULES = [
+    "src.cli",
+    "src.train.trainer",
+    "src.pipelines.retrain_pipeline",
+    "src.pipelines.register_best_model",
+    "src.train.sweep",
+    "src.serving.scorer",
+]
+HEAVY_MODULES = ["mlflow", "lightgbm", "xgboost", "sklearn", "scipy", "pandas"]
+# 新しいプロセスでモジュールをimportし、かかった時間とimportされた重いライブラリをJSONで出力する
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+__import__(sys.argv[1])
+elapsed = time.perf_counter() - start
+print(json.dumps({"wall_sec": elapsed, "heavy": [m for m in sys.argv[2:] if m in sys.modules]}))
+"""
+
+
+def run_stage(results: dict, name: str, func, rows: int | None = None, repeat: int = 1,
+              memory: bool = True, setup=None):
+    """
+    funcをrepeat回実行して最短の実行時間を記録し、memory=Trueならもう1回tracemallocを有効にして
+    メモリ確保のピークを記録する。setupは毎回の実行前に呼ぶ（キャッシュの削除など）。
+    最後の実行の戻り値を返す。
+    """
+    best = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with stage(name, rows=rows) as record:
+            result = func()
+        if best is None or record["wall_sec"] < best["wall_sec"]:
+            best = record
+
+    entry = {
+        "wall_sec": best["wall_sec"],
+        "process_cpu_sec": best["process_cpu_sec"],
+        "rows": rows,
+        "rows_per_sec": rows / best["wall_sec"] if rows and best["wall_sec"] > 0 else None,
+        "rss_delta_mb": best["rss_delta_mb"],
+        "process_peak_rss_mb": best["process_peak_rss_mb"],
+        "repeat": repeat,
+    }
+    if memory:
+        if setup is not None:
+            setup()
+        set_profile_mode("tracemalloc")
+        try:
+            with stage(name, rows=rows) as record:
+                result = func()
+        finally:
+            set_profile_mode(None)
+        entry["traced_peak_mb"] = record["traced_peak_mb"]
+
+    results[name] = entry
+    traced = f"  traced {entry['traced_peak_mb']:8.1f} MB" if memory else ""
+    print(f"{name:36s} {entry['wall_sec']:9.3f} s  cpu {entry['process_cpu_sec']:9.3f} s{traced}")
+    return result
+
+
+def measure_import(results: dict, module: str, repeat: int = 1):
+    """
+    moduleを新しいプロセスでrepeat回importし、最短の時間と、そのときimportされていた重いライブラリを記録する
+    """
+    best = None
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT, module, *HEAVY_MODULES],
+            capture_output=True, text=True, check=True, cwd=Path(__file__).resolve().parents[2],
+        ).stdout
+        record = json.loads(output.strip().splitlines()[-1])
+        if best is None or record["wall_sec"] < best["wall_sec"]:
+            best = record
+
+    name = f"import/{module}"
+    results[name] = {"wall_sec": best["wall_sec"], "heavy_imports": best["heavy"], "repeat": repeat}
+    print(f"{name:36s} {best['wall_sec']:9.3f} s  heavy: {','.join(best['heavy']) or 'none'}")
+
+
+def get_git_commit() -> dict:
+    """現在のコミットと、未コミットの変更があるか"""
+    root = Path(__file__).resolve().parents[2]
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=root, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=root, capture_output=True, text=True,
+        ).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+
+def get_environment() -> dict:
+    """結果を比べるときに必要な実行環境の情報"""
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return {
+        **get_git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "packages": versions,
+    }
+
+
+def compare_results(baseline: dict, current: dict, tolerance: float) -> list[str]:
+    """
+    ステージごとの実行時間を比べて表示し、baselineより tolerance（割合）を超えて遅くなったステージ名を返す
+    """
+    print(f"\nCompared with {baseline['environment'].get('commit')} ({baseline['environment'].get('timestamp')})")
+    regressions = []
+    for name, entry in current["stages"].items():
+        old = baseline["stages"].get(name)
+        if old is None:
+            continue
+        ratio = entry["wall_sec"] / old["wall_sec"] if old["wall_sec"] > 0 else float("inf")
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  << slower"
+            regressions.append(name)
+        print(f"{name:36s} {old['wall_sec']:9.3f} s → {entry['wall_sec']:9.3f} s  ({ratio:5.2f}x){flag}")
+    return regressions
+
+
+def run_suite(workdir: Path, year: int, month: int, n_rows: int, n_parts: int, models: list[str],
+              repeat: int, memory: bool, seed: int) -> dict:
+    """合成データを用意し、各ステージを計測した結果を返す"""
+    os.environ[PROJECT_ROOT_ENV] = str(workdir)
+    mlflow.set_tracking_uri((workdir / "mlruns").resolve().as_uri())
+    results: dict[str, dict] = {}
+
+    for module in IMPORT_MODULES:
+        measure_import(results, module, repeat)
+
+    try:
+        csv_paths = find_month_csvs(year, month)
+        print(f"Reusing synthetic data: {', '.join(str(p) for p in csv_paths)}")
+    except FileNotFoundError:
+        run_stage(results, "generate", lambda: write_month_csvs(workdir, year, month, n_rows, n_parts, seed),
+                  rows=n_rows, memory=False)
+
+    def clear_cache():
+        shutil.rmtree(workdir / DATA_DIR / INTERIM_DIR / CACHE_DIR, ignore_errors=True)
+
+    # 読み込み: CSVの解析とParquetキャッシュの作成（cold）、キャッシュからの読み込み（warm）
+    run_stage(results, "io/csv", lambda: load_month_data(year, month, columns=REQUIRED_COLUMNS),
+              rows=n_rows, repeat=repeat, memory=memory, setup=clear_cache)
+    df_raw = run_stage(results, "io/cache", lambda: load_month_data(year, month, columns=REQUIRED_COLUMNS),
+                       rows=n_rows, repeat=repeat, memory=memory)
+
+    df = run_stage(results, "preprocess", lambda: preprocess_pipeline(df_raw),
+                   rows=len(df_raw), repeat=repeat, memory=memory)
+    X_train, X_test, y_train, y_test = split_dataset(df)
+    dataset_info, dataset_params = build_dataset_params([year, month], X_train, X_test, y_train, y_test)
+    usage_tables = build_usage_tables(df_raw)
+    lineage = build_lineage([year, month], df)
+
+    for name in models:
+        params = MODEL_PARAMS[name]
+        model = run_stage(results, f"train/{name}", lambda: train_model(get_model(name, params), X_train, y_train),
+                          rows=len(X_train), repeat=repeat, memory=memory)
+        if name in BINNED_MODELS:
+            # データセットを構築して保存する初回と、保存したものを再利用する2回目以降
+            fit_binned = lambda: train_model(get_model(name, params), X_train, y_train, dataset_id=BENCHMARK_DATASET_ID)
+            with reuse_xgboost_matrices():
+                run_stage(results, f"train_binned_build/{name}", fit_binned, rows=len(X_train), repeat=repeat,
+                          memory=memory, setup=clear_binned_datasets)
+                run_stage(results, f"train_binned/{name}", fit_binned, rows=len(X_train), repeat=repeat, memory=memory)
+        metrics = run_stage(results, f"evaluate/{name}",
+                            lambda: evaluate_model_train_test(model, X_train, X_test, y_train, y_test),
+                            rows=len(X_train) + len(X_test), repeat=repeat, memory=memory)
+        # 記録の送信はバックグラウンドで行われるため、完了まで待って計測する
+        run_stage(results, f"mlflow_log/{name}", lambda: log_experiment_to_mlflow(
+            model, None, dataset_params, metrics, params, dataset_info, X_train, BENCHMARK_EXPERIMENT, name,
+            usage_tables=usage_tables, lineage=lineage, wait=True,
+        ), repeat=repeat, memory=False)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the training pipeline on synthetic data")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="synthetic rows for the month")
+    parser.add_argument("--parts", type=int, default=1, help="CSV files for the month")
+    parser.add_argument("--year", type=int, default=2014)
+    parser.add_argument("--month", type=int, default=7)
+    parser.add_argument("--models", nargs="+", default=list(MODEL_PARAMS), choices=list(MODEL_PARAMS))
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage (the fastest is kept)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run of each stage")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", help="directory for the synthetic data, caches and MLflow (default: temporary)")
+    parser.add_argument("--output", help="result JSON (default: data/interim/benchmarks/<commit>_<time>.json)")
+    parser.add_argument("--compare", help="result JSON of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed slowdown ratio before flagging")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    environment = get_environment()
+    output = Path(args.output) if args.output else (
+        get_project_root() / DATA_DIR / INTERIM_DIR / BENCHMARK_DIR
+        / f"{(environment['commit'] or 'unknown')[:10]}_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    )
+
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="citibike_bench_"))
+    try:
+        stages = run_suite(
+            workdir, args.year, args.month, args.rows, args.parts, args.models,
+            args.repeat, not args.no_memory, args.seed,
+        )
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {"environment": environment, "config": vars(args), "stages": stages}
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved results → {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(json.load(f), result, args.tolerance)
+        if regressions and args.fail_on_regression:
+            raise SystemExit(f"Slower than baseline: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+2014年のCitiBikeトリップデータと同じスキーマの合成データを生成する。
+実データがない環境（CIなど）でも load_month_data / preprocess_pipeline を動かし、性能を測れるようにする。
+
+カーディナリティや分布は notebooks/2014/01_eda.ipynb（2014年1月）に合わせている。
+- 駅は約330か所。利用回数は偏りがあり、最も多い駅で全体の約1%。
+- 自転車ID（bikeid）は 14529〜21076 の約6,500台。
+- 非会員（Customer）の割合は月ごとに変える（1月は約2.4%、夏は約14%）。
+- 非会員は birth year が "\\N"、gender が 0。会員の gender は男性約80%・女性約20%。
+- 利用時間は対数正規分布（中央値約8.5分）で、非会員は会員より長い。ごく一部に数時間の利用がある。
+- 開始時刻は平日は通勤時間帯、休日は日中に多い。
+
+1日単位で生成し、pyarrowでCSVに追記するため、2,000万行でもメモリ使用量は1日分程度で済む。
+
+実行例）
+python -m src.benchmarks.synthetic --root /tmp/citibike --year 2014 --months 1 2 --rows 1000000 --parts 2
+"""
+import argparse
+import calendar
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from src.utils.io import DATA_DIR, RAW_DIR
+
+
+N_STATIONS = 330
+BIKE_ID_MIN, BIKE_ID_MAX = 14529, 21077
+# 月ごとの非会員（Customer）の割合
+CUSTOMER_RATE = {1: 0.024, 2: 0.03, 3: 0.05, 4: 0.09, 5: 0.11, 6: 0.12, 7: 0.14, 8: 0.14, 9: 0.12, 10: 0.09, 11: 0.05, 12: 0.035}
+# 時間帯ごとの利用の多さ（0時〜23時）
+WEEKDAY_HOURLY = np.array([3, 2, 1, 1, 1, 3, 10, 30, 55, 35, 20, 20, 24, 24, 22, 25, 35, 60, 52, 32, 22, 15, 10, 6], dtype="float64")
+WEEKEND_HOURLY = np.array([8, 6, 4, 2, 1, 1, 2, 5, 10, 17, 25, 30, 34, 35, 35, 34, 32, 28, 24, 18, 14, 11, 9, 7], dtype="float64")
+# 休日は平日より利用が少ない
+WEEKEND_DAY_WEIGHT = 0.7
+STREETS = ["W", "E"]
+AVENUES = ["1 Ave", "2 Ave", "3 Ave", "Lexington Ave", "Park Ave", "Broadway", "5 Ave", "6 Ave", "7 Ave", "8 Ave", "9 Ave", "10 Ave", "11 Ave"]
+COLUMNS = [
+    "tripduration", "starttime", "stoptime",
+    "start station id", "start station name", "start station latitude", "start station longitude",
+    "end station id", "end station name", "end station latitude", "end station longitude",
+    "bikeid", "usertype", "birth year", "gender",
+]
+
+
+def make_stations(n_stations: int = N_STATIONS, seed: int = 0) -> pd.DataFrame:
+    """駅の一覧（ID・名前・緯度経度・利用されやすさ）。月をまたいで同じ駅になるよう、seedは月に依存させない。"""
+    rng = np.random.default_rng(seed)
+    ids = np.sort(rng.choice(np.arange(72, 3003), n_stations, replace=False))
+    names = [
+        f"{STREETS[i % 2]} {rng.integers(1, 120)} St & {AVENUES[rng.integers(len(AVENUES))]}"
+        for i in range(n_stations)
+    ]
+    # 同じ名前の駅ができないよう、重複には番号を付ける
+    names = pd.Series(names)
+    names = names.where(~names.duplicated(), names + " " + names.groupby(names).cumcount().astype(str))
+    popularity = rng.lognormal(0.0, 0.7, n_stations)
+    return pd.DataFrame({
+        "id": ids,
+        "name": names.to_numpy(),
+        "latitude": rng.normal(40.735, 0.019, n_stations).round(6),
+        "longitude": rng.normal(-73.990, 0.012, n_stations).round(6),
+        "weight": popularity / popularity.sum(),
+    })
+
+
+def month_day_counts(year: int, month: int, n_rows: int, rng: np.random.Generator) -> np.ndarray:
+    """月の各日の件数（休日は少なめ）"""
+    n_days = calendar.monthrange(year, month)[1]
+    weekday = np.array([calendar.weekday(year, month, day) for day in range(1, n_days + 1)])
+    weights = np.where(weekday >= 5, WEEKEND_DAY_WEIGHT, 1.0)
+    return rng.multinomial(n_rows, weights / weights.sum())
+
+
+def generate_day(year: int, month: int, day: int, n_rows: int, stations: pd.DataFrame,
+                 rng: np.random.Generator) -> pd.DataFrame:
+    """1日分のトリップを開始時刻順に生成する（2014年のCSVと同じ15列）"""
+    weekend = calendar.weekday(year, month, day) >= 5
+    hourly = WEEKEND_HOURLY if weekend else WEEKDAY_HOURLY
+    seconds = rng.choice(24, n_rows, p=hourly / hourly.sum()) * 3600 + rng.integers(0, 3600, n_rows)
+    seconds.sort()
+    starttime = np.datetime64(f"{year}-{month:02d}-{day:02d}", "s") + seconds.astype("timedelta64[s]")
+
+    customer = rng.random(n_rows) < CUSTOMER_RATE[month]
+    # 非会員は利用時間が長く、ごく一部（0.1%）は数時間借りたままになる
+    tripduration = rng.lognormal(np.where(customer, 7.0, 6.25), 0.6, n_rows)
+    long_trips = rng.random(n_rows) < 0.001
+    tripduration[long_trips] = rng.uniform(6 * 3600, 24 * 3600, long_trips.sum())
+    tripduration = np.maximum(tripduration, 60).astype("int64")
+
+    start = rng.choice(len(stations), n_rows, p=stations["weight"].to_numpy())
+    end = rng.choice(len(stations), n_rows, p=stations["weight"].to_numpy())
+    gender = np.where(customer, 0, np.where(rng.random(n_rows) < 0.8, 1, 2))
+    birth_year = np.clip(2014 - rng.normal(39, 11, n_rows).round(), 1944, 1997).astype("int64").astype(str)
+
+    return pd.DataFrame({
+        "tripduration": tripduration,
+        "starttime": starttime,
+        "stoptime": starttime + tripduration.astype("timedelta64[s]"),
+        "start station id": stations["id"].to_numpy()[start],
+        "start station name": stations["name"].to_numpy()[start],
+        "start station latitude": stations["latitude"].to_numpy()[start],
+        "start station longitude": stations["longitude"].to_numpy()[start],
+        "end station id": stations["id"].to_numpy()[end],
+        "end station name": stations["name"].to_numpy()[end],
+        "end station latitude": stations["latitude"].to_numpy()[end],
+        "end station longitude": stations["longitude"].to_numpy()[end],
+        "bikeid": rng.integers(BIKE_ID_MIN, BIKE_ID_MAX, n_rows),
+        "usertype": np.where(customer, "Customer", "Subscriber"),
+        "birth year": np.where(customer, "\\N", birth_year),
+        "gender": gender,
+    }, columns=COLUMNS)
+
+
+def iter_month_trips(year: int, month: int, n_rows: int, seed: int = 42, stations: pd.DataFrame | None = None):
+    """1か月分のトリップを1日ずつ、開始時刻順に返す"""
+    stations = make_stations() if stations is None else stations
+    rng = np.random.default_rng([seed, year, month])
+    for day, count in enumerate(month_day_counts(year, month, n_rows, rng), start=1):
+        yield generate_day(year, month, day, count, stations, rng)
+
+
+def generate_month(year: int, month: int, n_rows: int, seed: int = 42) -> pd.DataFrame:
+    """1か月分のトリップをまとめて返す（小さな行数向け）"""
+    return pd.concat(list(iter_month_trips(year, month, n_rows, seed)), ignore_index=True)
+
+
+def get_month_dir(root: Path, year: int, month: int) -> Path:
+    """実データと同じ data/raw/<年>-citibike-tripdata/<月>_<月名>/ の形式"""
+    return Path(root) / DATA_DIR / RAW_DIR / f"{year}-citibike-tripdata" / f"{month}_{calendar.month_name[month]}"
+
+
+def write_month_csvs(root: Path, year: int, month: int, n_rows: int, n_parts: int = 1, seed: int = 42) -> list[Path]:
+    """
+    1か月分の合成データを root/data/raw/ 以下にCSVで書き出し、書き出したパスを返す。
+    n_parts > 1 の場合は、実データと同じく開始時刻順に複数ファイル（_1, _2, ...）へ分ける。
+    """
+    month_dir = get_month_dir(root, year, month)
+    month_dir.mkdir(parents=True, exist_ok=True)
+    paths = [month_dir / f"{year}{month:02d}-citibike-tripdata_{part}.csv" for part in range(1, n_parts + 1)]
+    rows_per_part = -(-n_rows // n_parts)
+
+    part, written, writer = 0, 0, None
+    written_paths = []
+    try:
+        for df in iter_month_trips(year, month, n_rows, seed):
+            # 1日分をパートの境界で分けながら書き込む
+            while len(df):
+                if writer is None:
+                    writer = pa_csv.CSVWriter(paths[part], pa.Schema.from_pandas(df, preserve_index=False))
+                    written_paths.append(paths[part])
+                n = min(len(df), rows_per_part - written)
+                writer.write_table(pa.Table.from_pandas(df.iloc[:n], preserve_index=False))
+                df, written = df.iloc[n:], written + n
+                if written == rows_per_part and part < n_parts - 1:
+                    writer.close()
+                    part, written, writer = part + 1, 0, None
+    finally:
+        if writer is not None:
+            writer.close()
+    return written_paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic CitiBike trip CSVs")
+    parser.add_argument("--root", required=True, help="project root to write data/raw/ into")
+    parser.add_argument("--year", type=int, default=2014)
+    parser.add_argument("--months", type=int, nargs="+", default=[1])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="rows per month")
+    parser.add_argument("--parts", type=int, default=1, help="CSV files per month")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    for month in args.months:
+        paths = write_month_csvs(Path(args.root), args.year, month, args.rows, args.parts, args.seed)
+        print(f"{args.year}-{month:02d}: {args.rows:,} rows → {', '.join(str(p) for p in paths)}")
+
+
+if __name__ == "__main__":
+    main()
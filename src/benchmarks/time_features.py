@@ -0,0 +1,73 @@
+"""
+add_time_features と日時変換のマイクロベンチマーク。
+
+実行例）
+python -m src.benchmarks.time_features --rows 1000000
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+from src.utils.io import parse_datetime
+from src.utils.preprocess import add_time_features, categorize_time
+
+
+def add_time_features_apply(df: pd.DataFrame) -> pd.DataFrame:
+    """比較用：行ごとにcategorize_timeを呼ぶ旧実装"""
+    df["start_hour"] = df["starttime"].dt.hour
+    df["weekday"] = df["starttime"].dt.weekday
+    df["time_category"] = df["start_hour"].apply(categorize_time)
+    return df
+
+
+def make_starttimes(n_rows: int, seed: int = 42) -> pd.Series:
+    """1か月分に散らばった開始時刻の文字列を生成"""
+    rng = np.random.default_rng(seed)
+    seconds = np.sort(rng.integers(0, 31 * 24 * 3600, n_rows))
+    start = pd.Timestamp("2014-07-01") + pd.to_timedelta(seconds, unit="s")
+    return pd.Series(start.strftime("%Y-%m-%d %H:%M:%S"))
+
+
+def measure(func, repeat: int = 3) -> float:
+    """funcを複数回実行し、最短の実行時間（秒）を返す"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark time feature preprocessing")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    strings = make_starttimes(args.rows)
+    # 2014年9月以降の書式（例: "9/1/2014 00:00:25"）
+    us_strings = pd.Series(pd.to_datetime(strings).dt.strftime("%m/%d/%Y %H:%M:%S"))
+    df = pd.DataFrame({"starttime": pd.to_datetime(strings)})
+
+    # 新旧実装の出力が一致することを確認
+    expected = add_time_features_apply(df.copy())
+    actual = add_time_features(df.copy())
+    pd.testing.assert_frame_equal(actual, expected)
+    pd.testing.assert_series_equal(parse_datetime(strings), pd.to_datetime(strings))
+    pd.testing.assert_series_equal(parse_datetime(us_strings), pd.to_datetime(us_strings))
+    print("Equivalence check passed.")
+
+    results = {
+        "add_time_features (apply)": measure(lambda: add_time_features_apply(df.copy()), args.repeat),
+        "add_time_features (lookup)": measure(lambda: add_time_features(df.copy()), args.repeat),
+        "to_datetime (inferred)": measure(lambda: pd.to_datetime(strings), args.repeat),
+        "to_datetime (explicit format)": measure(lambda: parse_datetime(strings), args.repeat),
+        "to_datetime m/d/Y (inferred)": measure(lambda: pd.to_datetime(us_strings), args.repeat),
+        "to_datetime m/d/Y (explicit)": measure(lambda: parse_datetime(us_strings), args.repeat),
+    }
+    for name, seconds in results.items():
+        print(f"{name:32s} {seconds:8.4f} s  {args.rows / seconds:14,.0f} rows/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+パイプラインのコマンドラインの入口（cronやコンテナから呼び出す）。
+各コマンドの処理は実行時に初めてimportするため、--helpや引数の誤りはすぐに返り、
+MLflow・LightGBM・XGBoostなどは実際に使うコマンドでのみ読み込まれる。
+
+実行例）
+python -m src.cli retrain 2014 2 --mode incremental
+python -m src.cli register
+python -m src.cli sweep 2014 1 logistic_regression 'lgbm:{"n_estimators": 300}' --n-jobs 2
+python -m src.cli score trips.csv predictions.csv --compiled
+python -m src.cli backtest 2014-01 2014-12 lgbm --train-months 3 --horizon 2 --workers 4
+"""
+import argparse
+import json
+
+
+def parse_candidate(value: str) -> tuple[str, dict]:
+    """スイープの候補 "モデル名" または "モデル名:{JSONのパラメータ}" を (モデル名, パラメータ) にする"""
+    model_name, _, params = value.partition(":")
+    try:
+        return model_name, json.loads(params) if params else {}
+    except json.JSONDecodeError as e:
+        raise argparse.ArgumentTypeError(f"Invalid parameters for {model_name}: {e}")
+
+
+def run_retrain(args):
+    from src.pipelines.retrain_pipeline import retrain_if_needed
+
+    retrain_if_needed(
+        args.year, args.month,
+        threshold=args.threshold,
+        mode=args.mode,
+        window_months=args.window_months,
+        incremental_rounds=args.incremental_rounds,
+        compare_with_full=args.compare_with_full,
+        force=args.force,
+        max_duration_min=args.max_duration_min,
+    )
+
+
+def run_register(args):
+    from src.pipelines.register_best_model import register_best_model
+
+    register_best_model()
+
+
+def run_sweep_command(args):
+    from src.utils.io import load_config
+    from src.train.sweep import run_sweep
+
+    experiment_name = args.experiment_name or load_config()["experiment_name"]
+    results = run_sweep(
+        data_info=[args.year, args.month],
+        candidates=args.candidates,
+        experiment_name=experiment_name,
+        n_jobs=args.n_jobs,
+        random_state=args.random_state,
+        max_duration_min=args.max_duration_min,
+    )
+    for result in results:
+        print(f"{result['model_name']:20s} test_f1_score={result['metrics']['test_f1_score']:.4f}  run_id={result['run_id']}")
+
+
+def run_backtest(args):
+    from src.pipelines.backfill import parse_month
+    from src.pipelines.backtest import backtest
+
+    backtest(
+        parse_month(args.start), parse_month(args.end), args.model_name,
+        params=args.params,
+        experiment_name=args.experiment_name,
+        train_months=args.train_months,
+        horizon=args.horizon,
+        window=args.window,
+        step=args.step,
+        n_workers=args.workers,
+        max_duration_min=args.max_duration_min,
+    )
+
+
+def run_score(args):
+    from src.serving.scorer import score_csv
+
+    score_csv(args.input_csv, args.output_csv, alias=args.alias, compiled=args.compiled)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="CitiBike membership model pipelines")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    retrain = commands.add_parser("retrain", help="retrain on a month if the production model got worse")
+    retrain.add_argument("year", type=int)
+    retrain.add_argument("month", type=int)
+    retrain.add_argument("--threshold", type=float, default=0.01)
+    retrain.add_argument("--mode", choices=["full", "incremental"], default="full")
+    retrain.add_argument("--window-months", type=int, default=1)
+    retrain.add_argument("--incremental-rounds", type=int, default=50)
+    retrain.add_argument("--compare-with-full", action="store_true")
+    retrain.add_argument("--force", action="store_true", help="retrain without the drift check")
+    retrain.add_argument("--max-duration-min", type=int, default=360, help="drop trips at least this long (minutes)")
+    retrain.set_defaults(func=run_retrain)
+
+    register = commands.add_parser("register", help="register the best run and move the production alias")
+    register.set_defaults(func=run_register)
+
+    sweep = commands.add_parser("sweep", help="train and evaluate several models in parallel")
+    sweep.add_argument("year", type=int)
+    sweep.add_argument("month", type=int)
+    sweep.add_argument("candidates", nargs="+", type=parse_candidate, help='MODEL or MODEL:{"param": value}')
+    sweep.add_argument("--experiment-name", help="default: experiment_name in the config")
+    sweep.add_argument("--n-jobs", type=int, default=2)
+    sweep.add_argument("--random-state", type=int, default=42)
+    sweep.add_argument("--max-duration-min", type=int, default=360, help="drop trips at least this long (minutes)")
+    sweep.set_defaults(func=run_sweep_command)
+
+    score = commands.add_parser("score", help="score a CSV of trips with the production model")
+    score.add_argument("input_csv")
+    score.add_argument("output_csv")
+    score.add_argument("--alias", default="production")
+    score.add_argument("--compiled", action="store_true", help="use the compiled predictor if available")
+    score.set_defaults(func=run_score)
+
+    backtest = commands.add_parser("backtest", help="train on rolling windows of months and score the following months")
+    backtest.add_argument("start", help="first month (YYYY-MM)")
+    backtest.add_argument("end", help="last month (YYYY-MM)")
+    backtest.add_argument("model_name")
+    backtest.add_argument("--params", type=json.loads, default={}, help='model parameters as JSON, e.g. {"n_estimators": 300}')
+    backtest.add_argument("--experiment-name", help="default: experiment_name in the config + _backtest")
+    backtest.add_argument("--window", choices=["sliding", "expanding"], default="sliding")
+    backtest.add_argument("--train-months", type=int, default=1, help="months per training window (initial size if expanding)")
+    backtest.add_argument("--horizon", type=int, default=1, help="following months to score each model on")
+    backtest.add_argument("--step", type=int, default=1, help="months between window origins")
+    backtest.add_argument("--workers", type=int, default=2)
+    backtest.add_argument("--max-duration-min", type=int, default=360, help="drop trips at least this long (minutes)")
+    backtest.set_defaults(func=run_backtest)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
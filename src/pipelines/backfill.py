@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from src.utils.io import load_month_data, get_project_root, DATA_DIR, INTERIM_DIR
+from src.utils.preprocess import REQUIRED_COLUMNS
+from src.utils.feature_store import get_features
+from src.pipelines.retrain_pipeline import retrain_if_needed
+
+
+BACKFILL_DIR = "backfill"
+
+
+def month_range(start: tuple[int, int], end: tuple[int, int]) -> list[tuple[int, int]]:
+    """startからendまで（両端を含む）の (年, 月) のリストを返す"""
+    first = start[0] * 12 + start[1] - 1
+    last = end[0] * 12 + end[1] - 1
+    return [(index // 12, index % 12 + 1) for index in range(first, last + 1)]
+
+
+def parse_month(value: str) -> tuple[int, int]:
+    """"2014-01" 形式の文字列を (年, 月) に変換する"""
+    year, month = value.split("-")
+    return int(year), int(month)
+
+
+def get_checkpoint_path(start: tuple[int, int], end: tuple[int, int], mode: str) -> Path:
+    """バックフィルの進捗を保存するJSONのパスを返す（期間・モードごとに1ファイル）"""
+    name = f"{start[0]}_{start[1]:02d}-{end[0]}_{end[1]:02d}_{mode}.json"
+    return get_project_root() / DATA_DIR / INTERIM_DIR / BACKFILL_DIR / name
+
+
+def load_checkpoint(path: Path) -> dict:
+    """進捗を読み込む。なければ空の進捗を返す。"""
+    if not path.exists():
+        return {"completed": [], "timeline": []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: Path, checkpoint: dict) -> None:
+    """進捗を保存する。書き込み途中で中断しても壊れないよう、一時ファイル経由で置き換える。"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def timeline_entry(year: int, month: int, stage: str, start: float, end: float) -> dict:
+    return {
+        "month": f"{year}-{month:02d}",
+        "stage": stage,
+        "start": start,
+        "end": end,
+        "duration_sec": end - start,
+        "pid": os.getpid(),
+    }
+
+
+def prepare_month(year: int, month: int, max_duration_min: int = 360, features: bool = True) -> list[dict]:
+    """
+    1か月分の読み込み（Parquetキャッシュの作成）と前処理（特徴量ストアへの保存）を行う（ワーカープロセスで実行）。
+    features=Falseの場合は読み込みのみ行う。各ステージの開始・終了時刻を返す。
+    """
+    start = time.time()
+    load_month_data(year, month, columns=REQUIRED_COLUMNS)
+    loaded = time.time()
+    entries = [timeline_entry(year, month, "load", start, loaded)]
+    if features:
+        get_features(year, month, max_duration_min)
+        entries.append(timeline_entry(year, month, "preprocess", loaded, time.time()))
+    return entries
+
+
+def print_timeline(timeline: list[dict], wall_time: float) -> None:
+    """月・ステージごとの所要時間と、ステージごとの合計を表示する"""
+    if not timeline:
+        return
+    origin = min(entry["start"] for entry in timeline)
+    for entry in timeline:
+        print(
+            f"{entry['month']}  {entry['stage']:10s} "
+            f"{entry['start'] - origin:8.1f}s → {entry['end'] - origin:8.1f}s  ({entry['duration_sec']:.1f}s)"
+        )
+
+    totals: dict[str, float] = {}
+    for entry in timeline:
+        totals[entry["stage"]] = totals.get(entry["stage"], 0.0) + entry["duration_sec"]
+    summary = ", ".join(f"{stage}={seconds:.1f}s" for stage, seconds in totals.items())
+    print(f"Stage totals: {summary} / sum {sum(totals.values()):.1f}s, wall {wall_time:.1f}s")
+
+
+def backfill(
+    start: tuple[int, int],
+    end: tuple[int, int],
+    n_workers: int = 2,
+    prefetch: int = 2,
+    threshold: float = 0.01,
+    mode: str = "full",
+    window_months: int = 1,
+    max_duration_min: int = 360,
+    resume: bool = True,
+    force: bool = False,
+) -> dict:
+    """
+    startからendまでの各月について、順にretrain_if_neededを実行する。
+
+    読み込み・前処理・学習をパイプラインとして実行する。
+    学習は前の月の結果（Productionモデル）に依存するため1か月ずつ順に行い、
+    その間に後続の月の読み込み・前処理をワーカープロセスで先行して進める。
+    先行する月数はprefetchまで（キューの上限）で、前処理済みデータがメモリやディスクに溜まりすぎないようにする。
+    window_months > 1 の場合、学習はParquetキャッシュからのストリーミング前処理で行い特徴量ストアを使わないため、
+    先行して行うのは読み込み（Parquetキャッシュの作成）のみとする。
+
+    月ごとの学習が終わるたびに進捗を data/interim/backfill/ に保存し、
+    resume=Trueなら中断したバックフィルを完了済みの月の次から再開する。
+    各ステージ（load / preprocess / wait / train）の開始・終了時刻をタイムラインとして記録する。
+    force=Trueならドリフト判定を行わず、すべての月で再学習する。
+
+    実行例）
+    backfill(start=(2014, 1), end=(2014, 12), n_workers=2)
+    """
+    months = month_range(start, end)
+    checkpoint_path = get_checkpoint_path(start, end, mode)
+    checkpoint = load_checkpoint(checkpoint_path) if resume else {"completed": [], "timeline": []}
+    completed = {tuple(m) for m in checkpoint["completed"]}
+    todo = [m for m in months if m not in completed]
+    if completed:
+        print(f"Resuming backfill: {len(completed)} months done, {len(todo)} remaining")
+
+    wall_start = time.time()
+    pending: deque = deque()
+    upcoming = iter(todo)
+
+    # fork後のMLflowやOpenMPの状態を引き継がないようspawnで起動する
+    with ProcessPoolExecutor(max_workers=max(1, n_workers), mp_context=get_context("spawn")) as executor:
+
+        def fill_queue():
+            # 学習中の月の次から最大prefetchか月を先行して準備する
+            while len(pending) < max(prefetch, 1):
+                month = next(upcoming, None)
+                if month is None:
+                    return
+                pending.append((month, executor.submit(prepare_month, *month, max_duration_min, window_months == 1)))
+
+        fill_queue()
+        while pending:
+            (year, month), future = pending.popleft()
+            wait_start = time.time()
+            stage_entries = future.result()
+            wait_end = time.time()
+            fill_queue()
+
+            train_start = time.time()
+            retrain_if_needed(
+                year, month, threshold=threshold, mode=mode, window_months=window_months, force=force,
+                max_duration_min=max_duration_min,
+            )
+            train_end = time.time()
+
+            checkpoint["timeline"].extend(stage_entries + [
+                timeline_entry(year, month, "wait", wait_start, wait_end),
+                timeline_entry(year, month, "train", train_start, train_end),
+            ])
+            checkpoint["completed"].append([year, month])
+            save_checkpoint(checkpoint_path, checkpoint)
+            print(f"Backfill: {year}-{month:02d} done ({len(checkpoint['completed'])}/{len(months)})")
+
+    print_timeline(checkpoint["timeline"], time.time() - wall_start)
+    return checkpoint
+
+
+def main():
+    """
+    バックフィルのCLI
+
+    実行例）
+    python -m src.pipelines.backfill --start 2014-01 --end 2014-12 --workers 2 --prefetch 2
+    """
+    parser = argparse.ArgumentParser(description="Replay retraining over a range of months")
+    parser.add_argument("--start", required=True, type=parse_month, help="first month (YYYY-MM)")
+    parser.add_argument("--end", required=True, type=parse_month, help="last month (YYYY-MM)")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--prefetch", type=int, default=2)
+    parser.add_argument("--threshold", type=float, default=0.01)
+    parser.add_argument("--mode", choices=["full", "incremental"], default="full")
+    parser.add_argument("--window-months", type=int, default=1)
+    parser.add_argument("--max-duration-min", type=int, default=360, help="drop trips at least this long (minutes)")
+    parser.add_argument("--no-resume", action="store_true", help="ignore the saved progress and start over")
+    parser.add_argument("--force", action="store_true", help="retrain every month without the drift check")
+    args = parser.parse_args()
+
+    backfill(
+        args.start, args.end,
+        n_workers=args.workers,
+        prefetch=args.prefetch,
+        threshold=args.threshold,
+        mode=args.mode,
+        window_months=args.window_months,
+        max_duration_min=args.max_duration_min,
+        resume=not args.no_resume,
+        force=args.force,
+    )
+
+
+if __name__ == "__main__":
+    main()
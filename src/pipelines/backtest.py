@@ -0,0 +1,226 @@
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from multiprocessing import get_context
+from pathlib import Path
+import mlflow
+import pandas as pd
+from threadpoolctl import threadpool_limits
+from src.utils.io import load_month_data, load_config
+from src.utils.preprocess import preprocess_pipeline, REQUIRED_COLUMNS
+from src.utils.lineage import build_lineage
+from src.train.experiment import load_dataset, load_usage_tables
+from src.train.trainer import get_model, train_model
+from src.train.evaluator import score_model
+from src.train.sweep import get_thread_budget, apply_thread_budget
+from src.pipelines.backfill import month_range, prepare_month
+
+
+WINDOW_TYPES = ("sliding", "expanding")
+BACKTEST_TABLE_FILE = "backtest/window_metrics.json"
+BACKTEST_CSV_FILE = "window_metrics.csv"
+# 表に載せるメトリクス（confusion_matrixは表に入れない）
+TABLE_METRICS = ["accuracy", "precision", "recall", "f1_score", "roc_auc", "log_loss"]
+
+
+def build_windows(
+    months: list[tuple[int, int]],
+    train_months: int = 1,
+    horizon: int = 1,
+    window: str = "sliding",
+    step: int = 1,
+) -> list[dict]:
+    """
+    ローリング起点（rolling origin）のバックテストの学習・評価期間を作る。
+    起点の月までのtrain_monthsか月（expandingの場合は最初の月から起点まで）で学習し、
+    続くhorizonか月（monthsの範囲内のみ）で評価する。起点はstepか月ずつ進める。
+
+    例）months=1〜4月, train_months=2, horizon=2, sliding
+    → [学習 1-2月, 評価 3-4月], [学習 2-3月, 評価 4月]
+    """
+    if window not in WINDOW_TYPES:
+        raise ValueError(f"Unsupported window: {window} (expected one of {WINDOW_TYPES})")
+
+    windows = []
+    for origin in range(train_months - 1, len(months) - 1, step):
+        first = 0 if window == "expanding" else origin - train_months + 1
+        windows.append({
+            "window": len(windows),
+            "train": months[first:origin + 1],
+            "test": months[origin + 1:origin + 1 + horizon],
+        })
+    return windows
+
+
+def format_month(month: tuple[int, int]) -> str:
+    return f"{month[0]}-{month[1]:02d}"
+
+
+def run_window(
+    window: dict,
+    model_name: str,
+    params: dict,
+    n_threads: int,
+    max_duration_min: int = 360,
+) -> list[dict]:
+    """
+    1つの期間で学習し、続く各月で評価する（ワーカープロセスで実行）。評価した月ごとの行を返す。
+
+    学習データは特徴量ストア（複数月の場合はParquetキャッシュからのストリーミング前処理）から読む。
+    学習期間の利用回数テーブルは1回だけ集計し、ストリーミング前処理と評価の両方で使う。
+    評価する月の集約特徴量は、推論時と同じく学習期間の利用回数テーブルから引く
+    （評価する月自身の回数を使うと、学習時点で分からない情報が混ざるため）。
+    学習・評価とも同じmax_duration_minで外れ値を除外する。
+    """
+    train_months = window["train"]
+    data_info = list(train_months[0]) if len(train_months) == 1 else [list(m) for m in train_months]
+    params = apply_thread_budget(model_name, params, n_threads)
+
+    with threadpool_limits(limits=n_threads):
+        usage_tables = load_usage_tables(data_info, max_duration_min)
+        df = load_dataset(data_info, max_duration_min=max_duration_min, usage_tables=usage_tables)
+        X_train, y_train = df.drop("is_member", axis=1), df["is_member"]
+        lineage = build_lineage(data_info, df, max_duration_min)
+        del df
+
+        start = time.perf_counter()
+        model = train_model(get_model(model_name, params), X_train, y_train, dataset_id=f"{lineage['digest']}_all")
+        fit_time = time.perf_counter() - start
+        n_train = len(X_train)
+        del X_train, y_train
+
+        rows = []
+        for horizon, (year, month) in enumerate(window["test"], start=1):
+            df_raw = load_month_data(year, month, columns=REQUIRED_COLUMNS)
+            df_test = preprocess_pipeline(df_raw, max_duration_min, usage_tables)
+            del df_raw
+            metrics = score_model(model, df_test.drop("is_member", axis=1), df_test["is_member"])
+            rows.append({
+                "window": window["window"],
+                "train_start": format_month(train_months[0]),
+                "train_end": format_month(train_months[-1]),
+                "train_rows": n_train,
+                "test_month": format_month((year, month)),
+                "horizon": horizon,
+                "test_rows": len(df_test),
+                **{key: metrics[key] for key in TABLE_METRICS if key in metrics},
+                "fit_time_sec": fit_time,
+                "pid": os.getpid(),
+            })
+    print(f"Window {window['window']}: trained on {rows[0]['train_start']}..{rows[0]['train_end']} ({n_train:,} rows)")
+    return rows
+
+
+def log_backtest_to_mlflow(experiment_name: str, run_name: str, table: pd.DataFrame, run_params: dict, run_metrics: dict) -> str:
+    """
+    窓ごとのメトリクスの表を1つのRunに記録する。run_metricsには実行時間などを渡す。
+    表はJSON（MLflowのテーブル）とCSVで保存し、f1_score_h<k> などは窓の番号をstepにして記録する。
+    ホライズンごとの平均は mean_<メトリクス>_h<k> として記録する。
+    """
+    mlflow.set_experiment(experiment_name)
+    with mlflow.start_run(run_name=run_name) as run:
+        mlflow.log_params(run_params)
+        mlflow.log_metrics(run_metrics)
+        mlflow.set_tags({"backtest": "true", "model_type": run_params["model_name"]})
+        mlflow.log_table(data=table, artifact_file=BACKTEST_TABLE_FILE)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = Path(tmp_dir) / BACKTEST_CSV_FILE
+            table.to_csv(csv_path, index=False)
+            mlflow.log_artifact(str(csv_path), "backtest")
+
+        metric_names = [key for key in TABLE_METRICS if key in table.columns]
+        for row in table.itertuples(index=False):
+            mlflow.log_metrics(
+                {f"{key}_h{row.horizon}": getattr(row, key) for key in metric_names},
+                step=row.window,
+            )
+        means = table.groupby("horizon")[metric_names].mean()
+        mlflow.log_metrics({
+            f"mean_{key}_h{horizon}": value
+            for horizon, values in means.iterrows() for key, value in values.items()
+        })
+    return run.info.run_id
+
+
+def backtest(
+    start: tuple[int, int],
+    end: tuple[int, int],
+    model_name: str,
+    params: dict | None = None,
+    experiment_name: str | None = None,
+    train_months: int = 1,
+    horizon: int = 1,
+    window: str = "sliding",
+    step: int = 1,
+    n_workers: int = 2,
+    max_duration_min: int = 360,
+) -> pd.DataFrame:
+    """
+    startからendまでの月で、ローリング起点のバックテストを行う。
+    各窓（build_windows）で学習したモデルを続くhorizonか月で評価し、窓×評価月ごとのメトリクスの表を返す。
+    表はMLflowの1つのRun（backtest_...）に記録する。experiment_nameの既定は設定ファイルの experiment_name + "_backtest"。
+
+    先に全月の読み込み（Parquetキャッシュ）と前処理（特徴量ストア）を並列に済ませ、
+    窓はワーカープロセスで並列に学習・評価する。ワーカーはキャッシュを読むだけで、CSVは解析し直さない。
+    スレッド数はCPU数をワーカー数で等分する（src.train.sweep と同じ）。
+
+    実行例）
+    table = backtest(start=(2014, 1), end=(2014, 12), model_name="lgbm", train_months=3, horizon=2, n_workers=4)
+    """
+    params = params or {}
+    experiment_name = experiment_name or f"{load_config()['experiment_name']}_backtest"
+    months = month_range(start, end)
+    windows = build_windows(months, train_months, horizon, window, step)
+    if not windows:
+        raise ValueError(f"No backtest windows: {len(months)} months with train_months={train_months}")
+
+    n_workers = max(1, min(n_workers, len(windows)))
+    n_threads = get_thread_budget(n_workers)
+    print(f"Backtest: {len(windows)} {window} windows, {n_workers} workers x {n_threads} threads")
+
+    wall_start = time.time()
+    rows = []
+    # fork後のMLflowやOpenMPの状態を引き継がないようspawnで起動する
+    with ProcessPoolExecutor(max_workers=n_workers, mp_context=get_context("spawn")) as executor:
+        # 窓どうしで同じ月のキャッシュを作り合わないよう、月ごとの準備を先に済ませる
+        for future in [executor.submit(prepare_month, *month, max_duration_min) for month in months]:
+            future.result()
+        prepare_time = time.time() - wall_start
+
+        # expandingでは後の窓ほど学習データが多いため、大きい窓から投入して最後に長い窓が残らないようにする
+        futures = [
+            executor.submit(run_window, w, model_name, params, n_threads, max_duration_min)
+            for w in sorted(windows, key=lambda w: len(w["train"]), reverse=True)
+        ]
+        for future in as_completed(futures):
+            rows.extend(future.result())
+    wall_time = time.time() - wall_start
+
+    table = pd.DataFrame(rows).sort_values(["window", "horizon"], ignore_index=True)
+    fit_time = table.groupby("window")["fit_time_sec"].first().sum()
+    print(table.drop(columns=["pid"]).to_string(index=False))
+    print(f"Backtest wall {wall_time:.1f}s (prepare {prepare_time:.1f}s, fit sum {fit_time:.1f}s)")
+
+    log_backtest_to_mlflow(
+        experiment_name,
+        f"backtest_{model_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+        table,
+        {
+            "model_name": model_name,
+            "start": format_month(start),
+            "end": format_month(end),
+            "window": window,
+            "train_months": train_months,
+            "horizon": horizon,
+            "step": step,
+            "max_duration_min": max_duration_min,
+            "n_windows": len(windows),
+            "n_workers": n_workers,
+            "threads_per_worker": n_threads,
+            **{f"model_{key}": value for key, value in params.items()},
+        },
+        {"wall_time_sec": wall_time, "prepare_time_sec": prepare_time, "fit_time_sum_sec": fit_time},
+    )
+    return table
@@ -1,14 +1,24 @@
-import mlflow
-from mlflow.tracking import MlflowClient
+import tempfile
 from pathlib import Path
 from src.utils.io import load_config
+from src.train.mlflow_logger import wait_for_pending_logs, COMPILED_PREDICTOR_ARTIFACT_DIR, COMPILED_PREDICTOR_FILE
+from src.serving.compiled import compile_model
+from src.pipelines.registry_session import get_session
+from src.utils.profiling import profiled
+
+# Runに記録する、コンパイル済み予測器の書き出し結果のタグ（書き出せた場合はアーティファクトのパス）
+COMPILED_PREDICTOR_TAG = "compiled_predictor"
 
 
 def get_best_run(experiment_name: str, metric: str = "test_f1_score"):
     """
     Experimentから指定メトリクスが最も高いRunを取得する。
+    同じプロセスでバックグラウンド送信中のRunがあれば、送信完了を待ってから検索する。
+    モデルまで記録し終えたRun（FINISHED）だけを対象にし、送信に失敗したRunは選ばない。
     """
-    clinet = MlflowClient()
+    for run_id, error in wait_for_pending_logs().items():
+        print(f"Skipping run {run_id}: logging failed ({error})")
+    clinet = get_session()
     experiment = clinet.get_experiment_by_name(experiment_name)
     
     if not experiment:
@@ -16,6 +26,7 @@ def get_best_run(experiment_name: str, metric: str = "test_f1_score"):
     
     runs = clinet.search_runs(
         experiment_ids=[experiment.experiment_id],
+        filter_string="attributes.status = 'FINISHED'",
         order_by=[f"metrics.{metric} DESC"],
         max_results=1
     )
@@ -29,15 +40,62 @@ def get_best_run(experiment_name: str, metric: str = "test_f1_score"):
     return best_run.info.run_id
 
 
+@profiled("export_compiled_predictor")
+def export_compiled_predictor(run_id: str) -> str | None:
+    """
+    Runのモデルをコンパイル済み予測器（src.serving.compiled）に変換し、Runのアーティファクトに保存する。
+    変換に対応していないモデルの場合や、読み込み・変換・保存のどこかで失敗した場合は、
+    警告を表示してNoneを返す（コンパイル済み予測器は任意のため、モデルの登録は続ける）。
+    結果はRunのタグ compiled_predictor に記録する（アーティファクトのパス / "unsupported" / "failed"）。
+    失敗した場合は例外の内容を compiled_predictor_error に記録し、失敗したRunを検索できるようにする。
+    """
+    client = get_session()
+    try:
+        model = client.load_model(run_id).get_raw_model()
+        compiled = compile_model(model)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = compiled.save(Path(tmp_dir) / COMPILED_PREDICTOR_FILE)
+            client.log_artifact(run_id, str(path), COMPILED_PREDICTOR_ARTIFACT_DIR)
+    except ValueError as e:
+        print(f"Skipping compiled predictor: {e}")
+        tag_compiled_predictor(run_id, "unsupported", str(e))
+        return None
+    except Exception as e:
+        print(f"Warning: failed to export compiled predictor for run {run_id}: {type(e).__name__}: {e}")
+        tag_compiled_predictor(run_id, "failed", f"{type(e).__name__}: {e}")
+        return None
+
+    artifact_path = f"{COMPILED_PREDICTOR_ARTIFACT_DIR}/{COMPILED_PREDICTOR_FILE}"
+    tag_compiled_predictor(run_id, artifact_path)
+    print(f"Exported compiled predictor: {artifact_path}")
+    return artifact_path
+
+
+def tag_compiled_predictor(run_id: str, status: str, error: str | None = None):
+    """コンパイル済み予測器の書き出し結果をRunのタグに記録する（記録に失敗しても登録は止めない）"""
+    tags = {COMPILED_PREDICTOR_TAG: status}
+    if error is not None:
+        # MLflowのタグの値の長さには上限があるため切り詰める
+        tags[f"{COMPILED_PREDICTOR_TAG}_error"] = error[:1000]
+    try:
+        for key, value in tags.items():
+            get_session().set_run_tag(run_id, key, value)
+    except Exception as e:
+        print(f"Warning: failed to tag run {run_id} with the compiled predictor status: {e}")
+
+
 def register_model_from_run(run_id: str, model_name: str):
     """
     指定したRun IDのモデルをModel Registryに登録する。
+    推論用にコンパイル済み予測器も書き出し、そのパスをモデルバージョンのタグ compiled_predictor に記録する。
     """
-    client = MlflowClient()
+    client = get_session()
     model_uri = f"runs:/{run_id}/model"
     
+    compiled_path = export_compiled_predictor(run_id)
+
     print(f"Registering model from run: {run_id}")
-    result = mlflow.register_model(model_uri=model_uri, name=model_name)
+    result = client.register_model(model_uri=model_uri, name=model_name)
     
     client.set_model_version_tag(
         name=model_name,
@@ -45,6 +103,13 @@ def register_model_from_run(run_id: str, model_name: str):
         key="registered_from_run",
         value=run_id,
     )
+    if compiled_path is not None:
+        client.set_model_version_tag(
+            name=model_name,
+            version=result.version,
+            key="compiled_predictor",
+            value=compiled_path,
+        )
     
     print(f"Registered as {result.name} (version={result.version})")
     return result.version   
@@ -53,7 +118,7 @@ def update_alias(model_name: str, new_version: str, alias: str = "production"):
     """
     既存のProductionエイリアスを削除し、新しいモデルに付与する。（他のエイリアスの付け替えも対応）
     """
-    client = MlflowClient()
+    client = get_session()
     
     # 既存のProductionモデルを確認
     try:
@@ -73,6 +138,7 @@ def update_alias(model_name: str, new_version: str, alias: str = "production"):
     print(f"Set alias {alias} → {model_name} (v{new_version})")
 
 
+@profiled("register_best_model")
 def register_best_model():
     """メイン処理：Experiment内で最良Runを探してRegistryを更新"""
     CONFIG = load_config()
@@ -85,7 +151,7 @@ def register_best_model():
     print(f"Searching best run from experiment '{experiment_name}'...")
     best_run_id = get_best_run(experiment_name, metric)
 
-    client = MlflowClient()
+    client = get_session()
     try:
         current_prod = client.get_model_version_by_alias(name=model_name, alias=alias)
         current_prod_run_id = current_prod.tags.get("registered_from_run", "")
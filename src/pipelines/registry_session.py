@@ -0,0 +1,150 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import mlflow
+from pathlib import Path
+from mlflow.tracking import MlflowClient # type: ignore
+from src.utils.io import get_project_root, DATA_DIR, INTERIM_DIR
+
+
+MODEL_CACHE_DIR = "model_cache"
+
+
+class RegistrySession:
+    """
+    MlflowClientを共有し、Registry / Trackingの参照結果を短時間キャッシュする。
+
+    エイリアス・モデルバージョン・Runの参照はttl秒の間キャッシュし、
+    このセッション経由で登録・タグ付け・エイリアス変更をした場合は関連するキャッシュを破棄する。
+    キャッシュしないメソッドはそのままMlflowClientに委譲するため、MlflowClientの代わりに渡せる。
+    モデルはRun IDごとにローカル（data/interim/model_cache）へ保存し、2回目以降はダウンロードしない。
+    """
+
+    def __init__(self, ttl: float = 30.0, client: MlflowClient | None = None):
+        self.client = client or MlflowClient()
+        self.ttl = ttl
+        self._cache: dict[tuple, tuple[float, object]] = {}
+        self._models: dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _cached(self, key: tuple, fetch):
+        now = time.monotonic()
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None and hit[0] > now:
+                return hit[1]
+        value = fetch()
+        with self._lock:
+            self._cache[key] = (now + self.ttl, value)
+        return value
+
+    def invalidate(self, kind: str | None = None, name: str | None = None):
+        """キャッシュを破棄する。kind・nameを指定した場合は該当するものだけ破棄する。"""
+        with self._lock:
+            for key in list(self._cache):
+                if (kind is None or key[0] == kind) and (name is None or key[1] == name):
+                    del self._cache[key]
+
+    # --- 参照（キャッシュあり） ---
+
+    def get_model_version_by_alias(self, name: str, alias: str):
+        return self._cached(("alias", name, alias), lambda: self.client.get_model_version_by_alias(name, alias))
+
+    def get_model_version(self, name: str, version: str):
+        return self._cached(("version", name, str(version)), lambda: self.client.get_model_version(name, version))
+
+    def get_run(self, run_id: str):
+        return self._cached(("run", run_id), lambda: self.client.get_run(run_id))
+
+    # --- 更新（関連するキャッシュを破棄） ---
+
+    def register_model(self, model_uri: str, name: str):
+        result = mlflow.register_model(model_uri=model_uri, name=name)
+        self.invalidate("version", name)
+        return result
+
+    def set_model_version_tag(self, name: str, version: str, key: str, value: str):
+        self.client.set_model_version_tag(name=name, version=version, key=key, value=value)
+        self.invalidate("version", name)
+        self.invalidate("alias", name)
+
+    def set_registered_model_alias(self, name: str, alias: str, version: str):
+        self.client.set_registered_model_alias(name=name, alias=alias, version=version)
+        self.invalidate("alias", name)
+
+    def delete_registered_model_alias(self, name: str, alias: str):
+        self.client.delete_registered_model_alias(name=name, alias=alias)
+        self.invalidate("alias", name)
+
+    def set_run_tag(self, run_id: str, key: str, value: str):
+        self.client.set_tag(run_id, key, value)
+        self.invalidate("run", run_id)
+
+    # --- モデルのローカルキャッシュ ---
+
+    def get_model_cache_dir(self) -> Path:
+        return get_project_root() / DATA_DIR / INTERIM_DIR / MODEL_CACHE_DIR
+
+    def download_model(self, run_id: str) -> Path:
+        """
+        Runのモデルをローカルに保存し、そのパスを返す。
+        Runに記録されたモデルは変わらないため、保存済みならダウンロードしない。
+        """
+        model_dir = self.get_model_cache_dir() / run_id
+        if model_dir.exists():
+            return model_dir
+
+        tmp_dir = model_dir.with_name(f"{run_id}.{os.getpid()}.tmp")
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        path = mlflow.artifacts.download_artifacts(artifact_uri=f"runs:/{run_id}/model", dst_path=str(tmp_dir))
+        try:
+            os.replace(path, model_dir)
+        except OSError:
+            # 別プロセスが先に保存した場合
+            pass
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        print(f"Cached model of run {run_id}")
+        return model_dir
+
+    def download_artifact(self, run_id: str, artifact_path: str) -> Path:
+        """
+        Runのアーティファクト（1ファイル）をローカルに保存し、そのパスを返す。
+        download_modelと同じく、保存済みならダウンロードしない。
+        """
+        local_path = self.get_model_cache_dir() / f"{run_id}.artifacts" / artifact_path
+        if local_path.exists():
+            return local_path
+
+        local_path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=local_path.parent) as tmp_dir:
+            path = mlflow.artifacts.download_artifacts(
+                artifact_uri=f"runs:/{run_id}/{artifact_path}", dst_path=tmp_dir
+            )
+            os.replace(path, local_path)
+        return local_path
+
+    def load_model(self, run_id: str):
+        """Runのモデルをpyfuncとして読み込む。同じセッション内では読み込み済みのものを返す。"""
+        with self._lock:
+            model = self._models.get(run_id)
+        if model is None:
+            model = mlflow.pyfunc.load_model(str(self.download_model(run_id)))
+            with self._lock:
+                self._models[run_id] = model
+        return model
+
+
+_session: RegistrySession | None = None
+
+
+def get_session() -> RegistrySession:
+    """プロセス内で共有するRegistrySessionを返す"""
+    global _session
+    if _session is None:
+        _session = RegistrySession()
+    return _session
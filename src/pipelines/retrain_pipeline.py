@@ -1,19 +1,28 @@
+import time
 import mlflow
-from mlflow.tracking import MlflowClient # type: ignore
-from src.utils.io import load_month_data, load_config
-from src.utils.preprocess import preprocess_pipeline
-from src.train.evaluator import evaluate_model
-from src.train.experiment import run_experiment
+from src.utils.io import load_config, load_month_data
+from src.utils.preprocess import preprocess_pipeline, REQUIRED_COLUMNS
+from src.utils.feature_store import get_features
+from src.utils.drift import sketch_like, iter_frame_chunks, compare_sketches, check_drift, get_drift_thresholds
+from src.train.mlflow_logger import load_usage_tables_artifact, load_drift_sketch_artifact
+from src.train.evaluator import evaluate_model_batched
+from src.train.experiment import run_experiment, load_dataset, split_dataset
 from src.pipelines.register_best_model import register_best_model
+from src.pipelines.registry_session import RegistrySession, get_session
+from src.utils.profiling import profiled, stage, trace_mark, get_trace, print_trace, save_trace, get_profile_dir
 
 
-def load_production_model(client: MlflowClient, model_name: str):
-    """Model RegistryからProductionモデルを取得"""
+# Productionモデルから学習を継続できるモデル種別
+INCREMENTAL_MODELS = ("lgbm", "xgboost", "logistic_regression")
+
+
+@profiled("load_production_model")
+def load_production_model(client: RegistrySession, model_name: str):
+    """Model RegistryからProductionモデルを取得（ローカルにキャッシュ済みならダウンロードしない）"""
     try:
         prod_model = client.get_model_version_by_alias(model_name, "production")
         prod_run_id = prod_model.tags.get("registered_from_run")
-        prod_uri = f"runs:/{prod_run_id}/model"
-        prod_model_loaded = mlflow.pyfunc.load_model(prod_uri)
+        prod_model_loaded = client.load_model(prod_run_id)
         print(f"Loaded current production model (v{prod_model.version})")
         return prod_model_loaded, prod_run_id
     except Exception as e:
@@ -21,22 +30,42 @@ def load_production_model(client: MlflowClient, model_name: str):
         return None, None
     
 
-def inherit_training_params(client: MlflowClient, prod_run_id: str):
-    """現行モデルのハイパーパラメータとモデル種別を引き継ぐ"""
+def find_full_training_run(client: RegistrySession, run_id: str):
+    """
+    増分再学習のRunから base_run_id のタグをたどり、ゼロから学習したRunを返す。
+    増分再学習のRunのモデルは起点の木に追加した分を含むため、そのパラメータはフル再学習の設定にならない。
+    """
+    run = client.get_run(run_id)
+    seen = {run_id}
+    while run.data.tags.get("retrain_mode") == "incremental":
+        base_run_id = run.data.tags.get("base_run_id")
+        if not base_run_id or base_run_id in seen:
+            break
+        seen.add(base_run_id)
+        run = client.get_run(base_run_id)
+    return run
+
+
+def inherit_training_params(client: RegistrySession, prod_run_id: str):
+    """
+    現行モデルのハイパーパラメータとモデル種別を引き継ぐ。
+    現行モデルが増分再学習のモデルの場合は、起点をたどってフル学習したRunのパラメータを使う。
+    """
     model_name = "logistic_regression"
     default_params = {"max_iter": 500}
     if not prod_run_id:
         return model_name, default_params
     try:
-        prod_run = client.get_run(prod_run_id)
-        prod_params = prod_run.data.params      # dict[str, str]
+        prod_run = find_full_training_run(client, prod_run_id)
+        prod_params = dict(prod_run.data.params)      # dict[str, str]（キャッシュを書き換えないようコピー）
+        prod_params.pop("incremental_rounds", None)
         model_name = prod_run.data.tags.get("model_type", model_name)
         
         # 型変換（MLflowはparamsをstrで保存する）
         for k, v in prod_params.items():
-            if v.isdigit():
+            try:
                 prod_params[k] = int(v)
-            else:
+            except ValueError:
                 try:
                     prod_params[k] = float(v)
                 except ValueError:
@@ -52,7 +81,10 @@ def inherit_training_params(client: MlflowClient, prod_run_id: str):
         
 
 def compare_performance(old_metrics: dict, new_metrics: dict, threshold: float = 0.01):
-    """精度改善を判定"""
+    """
+    精度改善を判定する。
+    old_metrics は evaluate_production_on_test_split の結果を渡し、新モデルの test_f1_score と同じ行で比べる。
+    """
     old_f1 = old_metrics.get("f1_score", 0.0)
     new_f1 = new_metrics["test_f1_score"]
     improvement = new_f1 - old_f1
@@ -60,33 +92,227 @@ def compare_performance(old_metrics: dict, new_metrics: dict, threshold: float =
     return improvement >= threshold, improvement
 
 
-def retrain_if_needed(year: int, month: int, threshold: float = 0.01):
-    """新しいデータで再学習を実施し、精度が改善した場合のみ更新"""
+@profiled("production_eval_features", rows=len)
+def get_production_eval_features(year: int, month: int, prod_run_id: str, max_duration_min: int = 360):
+    """
+    Productionモデル評価用の特徴量を返す。
+    Productionモデルに利用回数テーブルが記録されていれば、推論時と同じく
+    その回数から集約特徴量を引く（groupbyしない）。なければ新データの月で集計した特徴量を使う。
+    """
+    usage_tables = load_usage_tables_artifact(prod_run_id)
+    if usage_tables is None:
+        return get_features(year, month, max_duration_min)
+
+    df_raw = load_month_data(year, month, columns=REQUIRED_COLUMNS)
+    return preprocess_pipeline(df_raw, max_duration_min, usage_tables)
+
+
+def evaluate_production_on_test_split(prod_model, prod_run_id: str, data_info, df=None, max_duration_min: int = 360, random_state: int = 42) -> dict:
+    """
+    新モデルの test_f1_score と同じテスト用の行でProductionモデルを評価する。
+
+    前処理で落とす行は利用回数テーブルによらないため、同じ期間を前処理すれば行の並びは新モデルの学習データと同じになり、
+    split_datasetを同じrandom_stateで分割すれば同じテスト用の行が得られる。
+    集約特徴量はそれぞれのモデルが推論時に使う回数（Productionモデルは自分のRunの利用回数テーブル、
+    新モデルは学習期間の回数）から引くため、行はそろえ、特徴量の作り方は推論時のままにしている。
+    df に単月の評価用特徴量（get_production_eval_features の結果）を渡すと前処理をやり直さない。
+    """
+    if df is None:
+        # 複数月の期間はストリーミング前処理で、Productionモデルの利用回数テーブルから集約特徴量を引く
+        df = load_dataset(data_info, max_duration_min=max_duration_min, usage_tables=load_usage_tables_artifact(prod_run_id))
+    _, X_test, _, y_test = split_dataset(df, random_state)
+    return evaluate_model_batched(prod_model, X_test, y_test)
+
+
+def check_production_drift(client: RegistrySession, prod_run_id: str, df, current_metrics: dict, thresholds: dict) -> list[str] | None:
+    """
+    新しい月のデータとProductionモデルの学習データの分布を比べ、再学習が必要な理由のリストを返す。
+    分布はProductionのRunに記録された参照分布と同じビンで、チャンクごとに1回読むだけでまとめる。
+    参照分布が記録されていないRunの場合はNoneを返す（判定できないため再学習する）。
+    """
+    reference = load_drift_sketch_artifact(prod_run_id)
+    if reference is None:
+        return None
+
+    current = sketch_like(reference, iter_frame_chunks(df))
+    report = compare_sketches(reference, current)
+    reference_f1 = client.get_run(prod_run_id).data.metrics.get("test_f1_score")
+    print(
+        f"Drift check: max PSI={report['max_psi']:.3f}, max KS={report['max_ks']:.3f}, "
+        f"member rate diff={report['member_rate_diff']:.3f}, F1={current_metrics['f1_score']:.4f} "
+        f"(trained: {reference_f1 if reference_f1 is None else f'{reference_f1:.4f}'})"
+    )
+    return check_drift(report, current_metrics["f1_score"], reference_f1, thresholds)
+
+
+def save_retrain_trace(mark: int, year: int, month: int):
+    """retrain_if_neededの各ステージの計測結果を表示し、JSONで保存する"""
+    trace = get_trace(since=mark)
+    print_trace(trace)
+    save_trace(trace, get_profile_dir() / f"retrain_{year}_{month:02d}.json")
+
+
+def get_window_months(year: int, month: int, window_months: int) -> list[list[int]]:
+    """(year, month) を末尾とする直近window_monthsか月の [年, 月] リストを返す"""
+    months = []
+    for offset in range(window_months - 1, -1, -1):
+        index = year * 12 + (month - 1) - offset
+        months.append([index // 12, index % 12 + 1])
+    return months
+
+
+def log_retrain_comparison(experiment_name: str, year: int, month: int, incremental: dict, full: dict):
+    """増分再学習とフル再学習の時間・精度の比較を記録する"""
+    mlflow.set_experiment(experiment_name)
+    with mlflow.start_run(run_name=f"retrain_comparison_{year}_{month:02d}"):
+        mlflow.log_metrics({
+            "incremental_wall_time_sec": incremental["wall_time_sec"],
+            "incremental_fit_time_sec": incremental["fit_time_sec"],
+            "incremental_f1_score": incremental["test_f1_score"],
+            "full_wall_time_sec": full["wall_time_sec"],
+            "full_fit_time_sec": full["fit_time_sec"],
+            "full_f1_score": full["test_f1_score"],
+            "f1_score_diff": incremental["test_f1_score"] - full["test_f1_score"],
+            "fit_speedup": full["fit_time_sec"] / max(incremental["fit_time_sec"], 1e-9),
+        })
+        mlflow.set_tags({"retrain_comparison": "true", "data_source": [year, month]})
+    print(
+        f"Incremental: F1={incremental['test_f1_score']:.4f} fit={incremental['fit_time_sec']:.2f}s / "
+        f"Full: F1={full['test_f1_score']:.4f} fit={full['fit_time_sec']:.2f}s"
+    )
+
+
+@profiled("run_experiment")
+def run_timed_experiment(**kwargs) -> dict:
+    """run_experimentを実行し、全体の実行時間を wall_time_sec としてメトリクスに加える"""
+    start = time.perf_counter()
+    metrics = run_experiment(**kwargs)
+    metrics["wall_time_sec"] = time.perf_counter() - start
+    return metrics
+
+
+def retrain_if_needed(
+    year: int,
+    month: int,
+    threshold: float = 0.01,
+    mode: str = "full",
+    window_months: int = 1,
+    incremental_rounds: int = 50,
+    compare_with_full: bool = False,
+    force: bool = False,
+    max_duration_min: int = 360,
+):
+    """
+    新しいデータで再学習を実施し、精度が改善した場合のみ更新
+
+    Parameters
+    ----------
+    year, month : int
+        新データの年月
+    threshold : float, optional
+        更新に必要なF1の改善幅
+    mode : str, optional
+        "full"（ゼロから学習）または "incremental"（Productionモデルから学習を継続）。
+        incrementalに対応しないモデル種別の場合はfullで学習する。
+    window_months : int, optional
+        学習に使う直近の月数（スライディングウィンドウ）。1なら新データの月のみ。
+    incremental_rounds : int, optional
+        incremental時にlgbm / xgboostへ追加するブースティング回数（Runには incremental_rounds として記録する）
+    compare_with_full : bool, optional
+        incremental時にフル再学習も実行し、時間と精度の比較をMLflowに記録する
+    force : bool, optional
+        ドリフト判定を行わず、必ず再学習する
+    max_duration_min : int, optional
+        利用時間の上限（分）。Productionモデルの評価と再学習の両方の前処理に使う。
+
+    Productionモデルがある場合は、再学習の前にドリフト判定を行う。
+    新しい月の特徴量の分布（PSI・KS）・会員比率・Productionモデルの F1 が
+    config/register_best_model.yaml の drift のしきい値をどれも超えなければ、再学習せずに終了する。
+    更新の判定では、Productionモデルを新モデルの test_f1_score と同じテスト用の行で評価し直して比べる。
+    各ステージの時間・メモリは最後に表示し、data/interim/profiles/retrain_YYYY_MM.json に保存する。
+    """
+    mark = trace_mark()
     config = load_config()
     model_name = config["model_name"]
     expriment_name = config["experiment_name"]
     
-    client = MlflowClient()
+    client = get_session()
     prod_model, prod_run_id = load_production_model(client, model_name)
     
-    df_raw = load_month_data(year, month)
-    df = preprocess_pipeline(df_raw)
+    if prod_model:
+        df = get_production_eval_features(year, month, prod_run_id, max_duration_min)  # type: ignore
+    else:
+        df = get_features(year, month, max_duration_min)
     X = df.drop("is_member", axis=1)
     y = df["is_member"]
     
-    old_metrics = evaluate_model(prod_model, X, y) if prod_model else {"f1_score": 0.0}
+    with stage("evaluate_production", rows=len(X)):
+        old_metrics = evaluate_model_batched(prod_model, X, y) if prod_model else {"f1_score": 0.0}
     
+    thresholds = get_drift_thresholds(config)
+    if prod_model is not None and thresholds["enabled"] and not force:
+        with stage("drift_check"):
+            reasons = check_production_drift(client, prod_run_id, df, old_metrics, thresholds)  # type: ignore
+        if reasons is not None and not reasons:
+            print("No significant drift, skipping retraining.")
+            save_retrain_trace(mark, year, month)
+            return
+        if reasons:
+            print(f"Retraining because: {'; '.join(reasons)}")
+
     model_type, params = inherit_training_params(client, prod_run_id) # type: ignore
-    new_metrics = run_experiment(
-        data_info=[year, month],
-        model_name=model_type,
-        params=params,
-        experiment_name=expriment_name,
-    )
+    data_info = [year, month] if window_months == 1 else get_window_months(year, month, window_months)
 
+    base_model = None
+    if mode == "incremental":
+        if prod_model is not None and model_type in INCREMENTAL_MODELS:
+            base_model = prod_model.get_raw_model()
+        else:
+            print(f"Incremental retraining is not available for {model_type}, retraining from scratch.")
+
+    if base_model is not None:
+        new_metrics = run_timed_experiment(
+            data_info=data_info,
+            model_name=model_type,
+            params=params,
+            experiment_name=expriment_name,
+            max_duration_min=max_duration_min,
+            base_model=base_model,
+            incremental_rounds=incremental_rounds if model_type in ("lgbm", "xgboost") else None,
+            tags={"retrain_mode": "incremental", "base_run_id": prod_run_id},
+        )
+        if compare_with_full:
+            full_metrics = run_timed_experiment(
+                data_info=data_info,
+                model_name=model_type,
+                params=params,
+                experiment_name=expriment_name,
+                max_duration_min=max_duration_min,
+                tags={"retrain_mode": "full"},
+            )
+            log_retrain_comparison(expriment_name, year, month, new_metrics, full_metrics)
+    else:
+        new_metrics = run_timed_experiment(
+            data_info=data_info,
+            model_name=model_type,
+            params=params,
+            experiment_name=expriment_name,
+            max_duration_min=max_duration_min,
+            tags={"retrain_mode": "full"},
+        )
+
+    # 月全体で評価したold_metricsは新モデルの学習に使った行を含むため、新モデルのテスト用の行で評価し直して比べる
+    if prod_model is not None:
+        with stage("evaluate_production_test_split"):
+            old_metrics = evaluate_production_on_test_split(
+                prod_model, prod_run_id, data_info,  # type: ignore
+                df=df if window_months == 1 else None, max_duration_min=max_duration_min,
+            )
     improved, delta = compare_performance(old_metrics, new_metrics, threshold)
     if improved:
         print(f"Improvement detected (+{delta:.4f}), registering new model...")
         register_best_model()
     else:
-        print(f"No significant improvement (+{delta:.4f}), keeping current model.")
\ No newline at end of file
+        print(f"No significant improvement (+{delta:.4f}), keeping current model.")
+
+    save_retrain_trace(mark, year, month)
\ No newline at end of file
@@ -0,0 +1,195 @@
+import argparse
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any
+import numpy as np
+import pandas as pd
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+from src.utils.io import load_config
+from src.utils.preprocess import preprocess_for_inference
+from src.serving.scorer import ProductionModel, ModelSnapshot
+
+
+class PredictRequest(BaseModel):
+    """1リクエスト分のトリップ（生データの列名をキーにした辞書のリスト）"""
+    trips: list[dict[str, Any]]
+
+
+class PredictResponse(BaseModel):
+    model_version: str | None
+    member_probability: list[float]
+    is_member_pred: list[int]
+
+
+def build_request_features(trips: list[dict[str, Any]], usage_tables=None) -> pd.DataFrame:
+    """
+    リクエストのトリップを特徴量に変換する。
+    列の不足・変換できない値（日時・数値）・欠損値（nullなど）がある場合はValueErrorにする。
+    """
+    try:
+        X = preprocess_for_inference(pd.DataFrame.from_records(trips), usage_tables)
+    except KeyError as e:
+        raise ValueError(f"missing column {e}") from e
+    except TypeError as e:
+        raise ValueError(str(e)) from e
+
+    missing = X.columns[X.isna().any()].tolist()
+    if missing:
+        raise ValueError(f"missing or null values for features {missing}")
+    return X
+
+
+class MicroBatcher:
+    """
+    同時に届いたリクエストの特徴量をまとめて1回のpredict_probaで推論する。
+    max_batch_rows行に達するか、最初のリクエストからmax_wait_ms経過した時点でまとめて推論する。
+    各リクエストは特徴量を作ったときのスナップショットで推論する（モデルの切り替え中はスナップショットごとに推論する）。
+    """
+
+    def __init__(self, holder: ProductionModel, max_batch_rows: int = 16384, max_wait_ms: float = 2.0):
+        self.holder = holder
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait_ms / 1000
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def predict(self, X: pd.DataFrame, snapshot: ModelSnapshot) -> np.ndarray:
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((X, snapshot, future))
+        return await future
+
+    @staticmethod
+    def score_batch(batch: list) -> list[np.ndarray]:
+        """バッチをスナップショットごとにまとめて推論し、リクエストごとの確率を返す"""
+        groups: dict[int, list[int]] = {}
+        for i, (_, snapshot, _) in enumerate(batch):
+            groups.setdefault(id(snapshot), []).append(i)
+
+        results: list = [None] * len(batch)
+        for indices in groups.values():
+            snapshot = batch[indices[0]][1]
+            frames = [batch[i][0] for i in indices]
+            X_all = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+            proba = snapshot.predict_proba(X_all)
+            offset = 0
+            for i, X in zip(indices, frames):
+                results[i] = proba[offset:offset + len(X)]
+                offset += len(X)
+        return results
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            X, snapshot, future = await self.queue.get()
+            batch = [(X, snapshot, future)]
+            n_rows = len(X)
+            deadline = loop.time() + self.max_wait
+
+            while n_rows < self.max_batch_rows:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    X, snapshot, future = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append((X, snapshot, future))
+                n_rows += len(X)
+
+            try:
+                results = await loop.run_in_executor(None, self.score_batch, batch)
+            except Exception as e:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, _, future), proba in zip(batch, results):
+                if not future.done():
+                    future.set_result(proba)
+
+
+def create_app(holder: ProductionModel, max_batch_rows: int = 16384, max_wait_ms: float = 2.0) -> FastAPI:
+    """
+    推論APIを作成する。
+    起動時にモデルを読み込み、バックグラウンドでエイリアスの付け替えを監視する。
+    """
+    batcher = MicroBatcher(holder, max_batch_rows, max_wait_ms)
+
+    async def watch_alias():
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(holder.refresh_interval)
+            try:
+                await loop.run_in_executor(None, holder.refresh)
+            except Exception as e:
+                print(f"Failed to refresh model: {e}")
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        if holder.snapshot is None:
+            holder.refresh(force=True)
+        tasks = [asyncio.create_task(batcher.run())]
+        if holder.refresh_interval != float("inf"):
+            tasks.append(asyncio.create_task(watch_alias()))
+        yield
+        for task in tasks:
+            task.cancel()
+
+    app = FastAPI(title="CitiBike membership scoring", lifespan=lifespan)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "model_name": holder.model_name, "model_version": holder.version}
+
+    @app.post("/predict", response_model=PredictResponse)
+    async def predict(request: PredictRequest):
+        # 途中でモデルが切り替わっても、特徴量・推論・レスポンスのバージョンは同じスナップショットから取る
+        snapshot = holder.get_snapshot()
+        if not request.trips:
+            return PredictResponse(model_version=snapshot.version, member_probability=[], is_member_pred=[])
+        try:
+            # 集約特徴量は学習月の回数テーブルから引く（テーブルがない場合はリクエスト単位で集計）
+            X = build_request_features(request.trips, snapshot.usage_tables)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=f"Invalid trips: {e}")
+
+        proba = await batcher.predict(X, snapshot)
+        return PredictResponse(
+            model_version=snapshot.version,
+            member_probability=proba.tolist(),
+            is_member_pred=(proba > 0.5).astype(int).tolist(),
+        )
+
+    return app
+
+
+def main():
+    """
+    推論サーバーを起動する
+
+    実行例）
+    python -m src.serving.app --port 8000
+    """
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the production model")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--alias", default="production")
+    parser.add_argument("--refresh-interval", type=float, default=30.0)
+    parser.add_argument("--max-batch-rows", type=int, default=16384)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    parser.add_argument("--compiled", action="store_true", help="use the compiled predictor if available")
+    args = parser.parse_args()
+
+    config = load_config()
+    holder = ProductionModel(
+        config["model_name"], alias=args.alias, refresh_interval=args.refresh_interval, compiled=args.compiled,
+    )
+    app = create_app(holder, args.max_batch_rows, args.max_wait_ms)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""
+推論専用のコンパクトなモデル表現（コンパイル済み予測器）。
+
+決定木系（DecisionTree / RandomForest / LightGBM / XGBoost）は全ての木のノードを
+1本の配列に平坦化し、NumPyで全行・全ての木を同時にたどる。
+LogisticRegressionは係数との内積だけを行う。
+読み込みと推論はNumPyだけで行い、lightgbm / xgboost / mlflow をimportしない。
+"""
+import json
+from pathlib import Path
+import numpy as np
+
+
+COMPILED_FORMAT_VERSION = 1
+# LightGBMがmissing_type=Zeroで欠損とみなす絶対値の上限（kZeroThreshold）
+LGBM_ZERO_THRESHOLD = 1e-35
+# 欠損値の扱い（ノードごと）
+MISSING_NONE, MISSING_ZERO, MISSING_NAN = 0, 1, 2
+# 1回にたどる (木, 行) の数。ノード番号の配列がCPUのL2キャッシュに収まる程度にする。
+TRAVERSE_BLOCK = 32_768
+
+
+def sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class CompiledModel:
+    """
+    コンパイル済みの2値分類器。predict_proba / predict はsklearnと同じ形で値を返す。
+
+    meta["kind"] が "linear" の場合は arrays に coef / intercept を、
+    "trees" の場合は平坦化したノード配列（feature / threshold / left / default_left / missing / value）と
+    各木の根のインデックス roots、各段で進める木の本数 active を持つ。
+    """
+
+    def __init__(self, meta: dict, arrays: dict[str, np.ndarray]):
+        self.meta = meta
+        self.arrays = arrays
+        self.feature_names = meta["feature_names"]
+        self.input_dtype = np.dtype(meta["input_dtype"])
+
+    def to_matrix(self, X) -> np.ndarray:
+        """DataFrameの場合は学習時の列順に並べ、学習器と同じ精度の配列にする"""
+        if hasattr(X, "columns"):
+            if list(X.columns) != self.feature_names:
+                X = X[self.feature_names]
+            X = X.to_numpy()
+        # 学習器と同じ精度に丸めてから、比較・内積はfloat64で行う
+        return np.ascontiguousarray(np.asarray(X, dtype=self.input_dtype), dtype="float64")
+
+    def decision_function(self, X) -> np.ndarray:
+        """リンク関数をかける前の値（木の場合は葉の値の合計または平均）"""
+        X = self.to_matrix(X)
+        if self.meta["kind"] == "linear":
+            return X @ self.arrays["coef"] + self.arrays["intercept"]
+
+        # 木の本数 × 行数 のノード番号がCPUキャッシュに収まるよう、行をまとめて処理する
+        chunk_size = max(1, TRAVERSE_BLOCK // len(self.arrays["roots"]))
+        if len(X) <= chunk_size:
+            return self.traverse(X)
+        return np.concatenate([self.traverse(X[start:start + chunk_size]) for start in range(0, len(X), chunk_size)])
+
+    def traverse(self, X: np.ndarray) -> np.ndarray:
+        """
+        全ての木を同時に1段ずつたどり、行ごとに葉の値を集約する。
+        木は深い順に並べてあり、d段目では深さがdより大きい木（先頭のactive[d]本）だけを進める。
+        右の子は left + 1 にあるため、次のノードは left[node] + (右へ進むか) で求まる。
+        """
+        a = self.arrays
+        # 行列を1次元にして、(行, 特徴量) の値を1回のインデックス参照で取り出す
+        flat = X.ravel()
+        row_offsets = np.arange(len(X), dtype="int64") * X.shape[1]
+        node = np.repeat(a["roots"][:, None], len(X), axis=1)
+        # 欠損値がなく、0を欠損とみなす分岐（LightGBMのmissing_type=Zero）もなければ比較だけで済む
+        check_missing = self.meta["has_zero_missing"] or np.isnan(flat).any()
+
+        for n_active in a["active"]:
+            current = node[:n_active]
+            index = np.take(a["feature"], current)
+            index += row_offsets
+            x = np.take(flat, index)
+            threshold = np.take(a["threshold"], current)
+            if check_missing:
+                go_right = ~self.go_left_with_missing(current, x, threshold)
+            else:
+                go_right = x > threshold
+            current = np.take(a["left"], current)
+            current += go_right
+            node[:n_active] = current
+
+        values = np.take(a["value"], node)
+        if self.meta["aggregate"] == "mean":
+            return values.mean(axis=0)
+        return values.sum(axis=0) + self.meta["bias"]
+
+    def go_left_with_missing(self, node: np.ndarray, x: np.ndarray, threshold: np.ndarray) -> np.ndarray:
+        """欠損値の扱いを含めた分岐の向き（Trueなら左）"""
+        a = self.arrays
+        missing_type = a["missing"][node]
+        nan = np.isnan(x)
+        # LightGBMのmissing_type=Noneでは欠損を0として比較する
+        x = np.where(nan & (missing_type == MISSING_NONE), 0.0, x)
+        missing = (nan & (missing_type == MISSING_NAN)) | (
+            (missing_type == MISSING_ZERO) & (nan | (np.abs(x) <= LGBM_ZERO_THRESHOLD))
+        )
+        return np.where(missing, a["default_left"][node], x <= threshold)
+
+    def predict_proba(self, X) -> np.ndarray:
+        score = self.decision_function(X)
+        proba = score if self.meta["link"] == "identity" else sigmoid(self.meta["scale"] * score)
+        return np.column_stack([1.0 - proba, proba])
+
+    def predict(self, X) -> np.ndarray:
+        return (self.predict_proba(X)[:, 1] > 0.5).astype("int64")
+
+    def save(self, path: Path) -> Path:
+        """NumPyの.npz（非圧縮）で保存する。metaはJSON文字列として一緒に保存する。"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(f, meta=np.array(json.dumps(self.meta)), **self.arrays)
+        return path
+
+
+def load_compiled(path: Path) -> CompiledModel:
+    """save() で保存したコンパイル済み予測器を読み込む"""
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {key: data[key] for key in data.files if key != "meta"}
+        meta = json.loads(str(data["meta"]))
+    if meta.get("format_version") != COMPILED_FORMAT_VERSION:
+        raise ValueError(f"Unsupported compiled model format: {meta.get('format_version')}")
+    return CompiledModel(meta, arrays)
+
+
+# --- コンパイル（学習器ごとの変換） ---
+
+class TreeBuilder:
+    """
+    木のノードを1本の配列に追加していく。
+    分岐ノードの子は連続して確保し、右の子を常に left + 1 に置く。
+    """
+
+    def __init__(self):
+        self.columns: dict[str, list] = {
+            key: [] for key in ("feature", "threshold", "left", "default_left", "missing", "value")
+        }
+        self.roots: list[int] = []
+        self.tree_depths: list[int] = []
+
+    def add_root(self) -> int:
+        """新しい木の根を追加する"""
+        self.roots.append(self.add_node())
+        self.tree_depths.append(0)
+        return self.roots[-1]
+
+    def add_node(self) -> int:
+        for values in self.columns.values():
+            values.append(0)
+        return len(self.columns["feature"]) - 1
+
+    def add_children(self) -> tuple[int, int]:
+        """左右の子を連続して追加する"""
+        left = self.add_node()
+        return left, self.add_node()
+
+    def set_split(self, index: int, feature: int, threshold: float, left: int, default_left: bool, missing: int):
+        c = self.columns
+        c["feature"][index], c["threshold"][index], c["left"][index] = feature, threshold, left
+        c["default_left"][index], c["missing"][index] = default_left, missing
+
+    def set_leaf(self, index: int, value: float, depth: int):
+        # 葉は閾値を+infにして常に左（自分自身）へ進むようにし、深さの足りない木は葉に留まる
+        c = self.columns
+        c["feature"][index], c["threshold"][index], c["left"][index] = 0, np.inf, index
+        c["default_left"][index], c["missing"][index] = True, MISSING_NONE
+        c["value"][index] = value
+        self.tree_depths[-1] = max(self.tree_depths[-1], depth)
+
+    def to_arrays(self) -> dict[str, np.ndarray]:
+        """ノード配列と、深い順に並べた木の根（roots）、各段で進める木の本数（active）を返す"""
+        c = self.columns
+        order = np.argsort(self.tree_depths, kind="stable")[::-1]
+        depths = np.asarray(self.tree_depths)[order]
+        return {
+            "feature": np.asarray(c["feature"], dtype="int64"),
+            "threshold": np.asarray(c["threshold"], dtype="float64"),
+            "left": np.asarray(c["left"], dtype="int64"),
+            "default_left": np.asarray(c["default_left"], dtype="bool"),
+            "missing": np.asarray(c["missing"], dtype="int8"),
+            "value": np.asarray(c["value"], dtype="float64"),
+            "roots": np.asarray(self.roots, dtype="int64")[order],
+            "active": np.asarray([(depths > d).sum() for d in range(depths.max(initial=0))], dtype="int64"),
+        }
+
+
+def compile_sklearn_trees(estimators: list, builder: TreeBuilder):
+    """sklearnの決定木（左: x <= threshold）。葉の値は陽性クラスの割合。"""
+    for estimator in estimators:
+        tree = estimator.tree_
+        missing_go_to_left = getattr(tree, "missing_go_to_left", np.zeros(tree.node_count, dtype=bool))
+        stack = [(0, builder.add_root(), 0)]
+        while stack:
+            node, index, depth = stack.pop()
+            if tree.children_left[node] == -1:
+                counts = tree.value[node, 0]
+                builder.set_leaf(index, counts[1] / counts.sum(), depth)
+                continue
+            left, right = builder.add_children()
+            builder.set_split(
+                index, int(tree.feature[node]), float(tree.threshold[node]), left,
+                bool(missing_go_to_left[node]), MISSING_NAN,
+            )
+            stack += [(tree.children_left[node], left, depth + 1), (tree.children_right[node], right, depth + 1)]
+
+
+def compile_lgbm_trees(dump: dict, builder: TreeBuilder):
+    """
+    LightGBMのdump_model()（左: x <= threshold、missing_typeに応じて欠損は既定の向き）。
+    linear_tree=Trueで学習した葉（leaf_coeffを持つ線形モデルの葉）には対応しない。
+    """
+    missing_types = {"None": MISSING_NONE, "Zero": MISSING_ZERO, "NaN": MISSING_NAN}
+
+    for tree in dump["tree_info"]:
+        stack = [(tree["tree_structure"], builder.add_root(), 0)]
+        while stack:
+            node, index, depth = stack.pop()
+            if "leaf_value" in node:
+                # 線形の葉は leaf_const + leaf_coeff · x を返すため、定数の leaf_value だけでは再現できない
+                if node.get("leaf_coeff"):
+                    raise ValueError("LightGBM models with linear leaves (linear_tree=True) are not supported")
+                builder.set_leaf(index, node["leaf_value"], depth)
+                continue
+            if node["decision_type"] != "<=":
+                raise ValueError(f"Unsupported LightGBM split: {node['decision_type']}")
+            left, right = builder.add_children()
+            builder.set_split(
+                index, node["split_feature"], node["threshold"], left,
+                node["default_left"], missing_types[node["missing_type"]],
+            )
+            stack += [(node["left_child"], left, depth + 1), (node["right_child"], right, depth + 1)]
+
+
+def compile_xgboost_trees(dumps: list[str], feature_names: list[str], builder: TreeBuilder):
+    """
+    XGBoostのJSONダンプ（左: x < split_condition、欠損はmissingの子）。
+    XGBoostはfloat32で比較するため、閾値を1つ小さいfloat32にして x <= threshold に揃える。
+    """
+    feature_index = {name: i for i, name in enumerate(feature_names)}
+
+    for dump in dumps:
+        stack = [(json.loads(dump), builder.add_root(), 0)]
+        while stack:
+            node, index, depth = stack.pop()
+            if "leaf" in node:
+                builder.set_leaf(index, node["leaf"], depth)
+                continue
+            children = {child["nodeid"]: child for child in node["children"]}
+            left, right = builder.add_children()
+            split = node["split"]
+            feature = feature_index[split] if split in feature_index else int(split.lstrip("f"))
+            threshold = np.nextafter(np.float32(node["split_condition"]), np.float32(-np.inf))
+            builder.set_split(index, feature, float(threshold), left, node["missing"] == node["yes"], MISSING_NAN)
+            stack += [(children[node["yes"]], left, depth + 1), (children[node["no"]], right, depth + 1)]
+
+
+def compile_model(model) -> CompiledModel:
+    """
+    学習済みモデル（sklearn / LightGBM / XGBoost）をコンパイル済み予測器に変換する。
+    2値分類のみ対応する。対応していないモデルの場合はValueErrorを送出する。
+    """
+    meta = {"format_version": COMPILED_FORMAT_VERSION, "input_dtype": "float64", "scale": 1.0, "bias": 0.0}
+    builder = TreeBuilder()
+
+    if hasattr(model, "booster_"):  # LightGBM
+        dump = model.booster_.dump_model()
+        objective = dump["objective"].split()
+        if objective[0] != "binary":
+            raise ValueError(f"Unsupported LightGBM objective: {dump['objective']}")
+        sigmoid_params = [float(p.split(":")[1]) for p in objective[1:] if p.startswith("sigmoid:")]
+        compile_lgbm_trees(dump, builder)
+        meta.update({
+            "kind": "trees", "feature_names": dump["feature_names"], "link": "sigmoid",
+            "aggregate": "mean" if dump["average_output"] else "sum",
+            "scale": sigmoid_params[0] if sigmoid_params else 1.0,
+        })
+
+    elif hasattr(model, "get_booster"):  # XGBoost
+        booster = model.get_booster()
+        config = json.loads(booster.save_config())
+        if config["learner"]["objective"]["name"] != "binary:logistic":
+            raise ValueError(f"Unsupported XGBoost objective: {config['learner']['objective']['name']}")
+        base_score = float(config["learner"]["learner_model_param"]["base_score"].strip("[]"))
+        feature_names = booster.feature_names or [f"f{i}" for i in range(booster.num_features())]
+
+        dumps = booster.get_dump(dump_format="json")
+        best_iteration = getattr(model, "best_iteration", None)
+        if best_iteration is not None:
+            # early stoppingした場合、predictと同じく最良の反復までの木を使う
+            trees_per_round = len(dumps) // booster.num_boosted_rounds()
+            dumps = dumps[:(best_iteration + 1) * trees_per_round]
+        compile_xgboost_trees(dumps, feature_names, builder)
+        meta.update({
+            "kind": "trees", "feature_names": feature_names, "input_dtype": "float32",
+            "link": "sigmoid", "aggregate": "sum", "bias": float(np.log(base_score / (1 - base_score))),
+        })
+
+    elif hasattr(model, "tree_") or hasattr(model, "estimators_"):  # DecisionTree / RandomForest
+        if len(model.classes_) != 2:
+            raise ValueError("Only binary classifiers can be compiled")
+        estimators = model.estimators_ if hasattr(model, "estimators_") else [model]
+        compile_sklearn_trees(estimators, builder)
+        meta.update({
+            "kind": "trees", "feature_names": list(model.feature_names_in_), "input_dtype": "float32",
+            "link": "identity", "aggregate": "mean",
+        })
+
+    elif hasattr(model, "coef_"):  # LogisticRegression
+        if model.coef_.shape[0] != 1:
+            raise ValueError("Only binary classifiers can be compiled")
+        meta.update({
+            "kind": "linear", "feature_names": list(model.feature_names_in_), "link": "sigmoid",
+        })
+        return CompiledModel(meta, {
+            "coef": model.coef_[0].astype("float64"),
+            "intercept": np.asarray(model.intercept_[0], dtype="float64"),
+        })
+
+    else:
+        raise ValueError(f"Unsupported model type: {type(model).__name__}")
+
+    arrays = builder.to_arrays()
+    meta["has_zero_missing"] = bool((arrays["missing"] == MISSING_ZERO).any())
+    return CompiledModel(meta, arrays)
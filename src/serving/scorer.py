@@ -0,0 +1,160 @@
+import argparse
+import threading
+import time
+from typing import Any, NamedTuple
+import mlflow
+import numpy as np
+import pandas as pd
+from mlflow.tracking import MlflowClient # type: ignore
+from src.utils.io import load_config
+from src.utils.preprocess import preprocess_for_inference
+from src.train.mlflow_logger import load_usage_tables_artifact
+from src.pipelines.registry_session import get_session
+from src.serving.compiled import load_compiled
+
+
+class ModelSnapshot(NamedTuple):
+    """
+    読み込んだモデルと、それに対応する利用回数テーブル・バージョン・Run ID。
+    1つのリクエスト（バッチ）では同じスナップショットを使い、特徴量と推論のモデルを食い違わせない。
+    """
+    model: Any
+    usage_tables: Any
+    version: str
+    run_id: str | None
+
+    def predict_proba(self, X: pd.DataFrame) -> np.ndarray:
+        """特徴量からis_member=1の確率を返す"""
+        return self.model.predict_proba(X)[:, 1]
+
+
+class ProductionModel:
+    """
+    Model Registryのエイリアス（既定: production）が指すモデルをメモリに保持する。
+    ネイティブモデル（sklearn / LightGBM / XGBoost）で直接推論し、pyfuncラッパーは経由しない。
+    学習時に記録された利用回数テーブルがあれば一緒に読み込み、集約特徴量をそこから引く。
+    compiled=Trueの場合、登録時に書き出されたコンパイル済み予測器（タグ compiled_predictor）があればそちらで推論する。
+    1回の推論あたりのオーバーヘッドが小さく少量の行では速いが、大量の行ではネイティブモデルの方が速い。
+    refresh() でエイリアスを確認し、付け替えられていれば新しいバージョンを読み込み直す。
+    バージョンは文字列で保持する（Registryの返す型によらず、APIのレスポンスと比較をそろえる）。
+    モデル・利用回数テーブル・バージョンはまとめて1つのModelSnapshotとして差し替える。
+    推論する側は get_snapshot() で一度だけ参照を取り、そのスナップショットで特徴量の作成と推論を行う。
+    エイリアスの確認はキャッシュを通さず、毎回Registryに問い合わせる。
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        alias: str = "production",
+        refresh_interval: float = 30.0,
+        compiled: bool = False,
+    ):
+        self.model_name = model_name
+        self.alias = alias
+        self.refresh_interval = refresh_interval
+        self.compiled = compiled
+        self.snapshot: ModelSnapshot | None = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_model(cls, model, version: int | str = "local", usage_tables=None) -> "ProductionModel":
+        """学習済みモデルを直接保持する（Registryを使わないベンチマーク・検証用）"""
+        holder = cls(model_name="local", refresh_interval=float("inf"))
+        holder.snapshot = ModelSnapshot(model, usage_tables, str(version), None)
+        holder._checked_at = float("inf")
+        return holder
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        エイリアスの指すバージョンを確認し、変わっていればモデルを読み込み直す。
+        前回の確認から refresh_interval 秒以内なら何もしない。読み込み直した場合はTrueを返す。
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.refresh_interval:
+            return False
+
+        with self._lock:
+            self._checked_at = now
+            client = MlflowClient()
+            model_version = client.get_model_version_by_alias(self.model_name, self.alias)
+            version = str(model_version.version)
+            if self.snapshot is not None and version == self.snapshot.version:
+                return False
+
+            run_id = model_version.tags.get("registered_from_run")
+            compiled_path = model_version.tags.get("compiled_predictor")
+            # モデルはRun IDごとにローカルへキャッシュされ、再起動後もダウンロードし直さない
+            if self.compiled and compiled_path:
+                model = load_compiled(get_session().download_artifact(run_id, compiled_path))
+            else:
+                model = mlflow.pyfunc.load_model(str(get_session().download_model(run_id))).get_raw_model()
+            usage_tables = load_usage_tables_artifact(run_id)
+
+            # 推論中のリクエストが古いモデルを使い切れるよう、スナップショットの参照の差し替えだけで切り替える
+            self.snapshot = ModelSnapshot(model, usage_tables, version, run_id)
+            print(f"Loaded {self.model_name}@{self.alias} (v{version}, run_id={run_id})")
+            return True
+
+    def get_snapshot(self) -> ModelSnapshot:
+        """現在のスナップショットを返す（まだ読み込んでいなければ読み込む）"""
+        if self.snapshot is None:
+            self.refresh(force=True)
+        return self.snapshot  # type: ignore
+
+    @property
+    def version(self) -> str | None:
+        return self.snapshot.version if self.snapshot is not None else None
+
+    def predict_proba(self, X: pd.DataFrame) -> np.ndarray:
+        """特徴量からis_member=1の確率を返す"""
+        return self.get_snapshot().predict_proba(X)
+
+
+def score_trips(holder: ProductionModel, df_raw: pd.DataFrame) -> pd.DataFrame:
+    """
+    生のトリップデータを学習時と同じ特徴量に変換して推論する。
+    集約特徴量は学習月の利用回数テーブルから引く（テーブルがなければバッチ内で集計する）。
+    確率（member_probability）と予測ラベル（is_member_pred）を返す。
+    """
+    snapshot = holder.get_snapshot()
+    X = preprocess_for_inference(df_raw, snapshot.usage_tables)
+    proba = snapshot.predict_proba(X)
+    return pd.DataFrame({
+        "member_probability": proba,
+        "is_member_pred": (proba > 0.5).astype("int64"),
+    })
+
+
+def score_csv(input_csv: str, output_csv: str, alias: str = "production", compiled: bool = False) -> pd.DataFrame:
+    """CSVのトリップをエイリアスの指すモデルでスコアリングし、結果をCSVに保存する"""
+    config = load_config()
+    holder = ProductionModel(config["model_name"], alias=alias, compiled=compiled)
+    holder.refresh(force=True)
+
+    df_raw = pd.read_csv(input_csv)
+    result = score_trips(holder, df_raw)
+    result.to_csv(output_csv, index=False)
+    print(f"Scored {len(result)} trips with v{holder.version} → {output_csv}")
+    return result
+
+
+def main():
+    """
+    CSVをまとめてスコアリングするCLI
+
+    実行例）
+    python -m src.serving.scorer trips.csv predictions.csv
+    """
+    parser = argparse.ArgumentParser(description="Score trips with the production model")
+    parser.add_argument("input_csv")
+    parser.add_argument("output_csv")
+    parser.add_argument("--alias", default="production")
+    parser.add_argument("--compiled", action="store_true", help="use the compiled predictor if available")
+    args = parser.parse_args()
+
+    score_csv(args.input_csv, args.output_csv, alias=args.alias, compiled=args.compiled)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+LightGBM / XGBoost の学習用データセット（特徴量をビンに分けたもの）を作成し、同じデータの学習で再利用する。
+
+通常の fit は毎回 float64 の特徴量全体からビンの境界を求め直すため、スイープ・探索・再学習で
+同じ月を何度も学習すると、そのたびに同じ計算とメモリ確保が繰り返される。
+ここでは (データセットのID, ビン分けに関わるパラメータ) ごとに1回だけ構築し、
+- LightGBM: Dataset をバイナリファイルとして data/processed/binned_datasets/ に保存し、以降は読み込むだけにする
+- XGBoost: QuantileDMatrix はファイルに保存できないため、reuse_xgboost_matrices() の中でだけ直近のものを保持する
+特徴量はfloat32で渡し、構築時のコピーを半分にする（どちらのライブラリも内部ではfloat32で比較する）。
+
+データセットのIDは呼び出し側が決める（src.train.experiment.get_split_id）。
+同じIDには同じ行・同じ値のデータを渡すこと。キーには前処理コードのハッシュも含め、
+ハッシュが変わった（古い前処理コードで作られた）ファイルは次に保存するときに削除する。
+保存したファイルの合計が MAX_DATASET_BYTES を超えた場合は、最後に使ってから最も時間のたったものから削除する。
+
+LightGBMには、lgb.trainで学習したBoosterからLGBMClassifierを作る公開APIがない。
+fit_lgbm_binnedはLGBMClassifier.fitが設定する内部属性を同じように設定するため、
+requirements.txtで固定したバージョン（SUPPORTED_LGBM_VERSION）でのみ使い、それ以外では通常のfitで学習する。
+linear_tree・init_model（学習の継続）はfitの中で別の処理が必要なため、通常のfitで学習する。
+fitとの一致は tests/test_binned_dataset.py で確認している。
+"""
+import hashlib
+import json
+import os
+import shutil
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+from src.utils.io import get_project_root, DATA_DIR
+from src.utils.feature_store import PROCESSED_DIR, get_preprocess_hash
+
+
+BINNED_DATASET_DIR = "binned_datasets"
+# Datasetの構築後に変えられないLightGBMのパラメータ（sklearnの名前。random_stateはビン境界のサンプリングに使われる）。
+# min_child_samplesは feature_pre_filter=False にして、Datasetを作り直さずに変えられるようにする。
+LGBM_BINNING_PARAMS = [
+    "max_bin", "min_data_in_bin", "bin_construct_sample_cnt", "use_missing", "zero_as_missing", "random_state",
+]
+# 線形の葉で学習するパラメータ（名前と別名）。Datasetに生の特徴量が必要なため、保存したDatasetは使えない。
+LGBM_LINEAR_TREE_PARAMS = ["linear_tree", "linear_trees"]
+XGBOOST_BINNING_PARAMS = ["max_bin", "missing"]
+# fit_lgbm_binnedがLGBMClassifier.fitと同じ状態を作ることを確認したLightGBMのバージョン
+SUPPORTED_LGBM_VERSION = "4.6."
+# 保存するDatasetのファイルの合計サイズの上限
+MAX_DATASET_BYTES = 4 * 1024 ** 3
+# reuse_xgboost_matrices() の中で保持するQuantileDMatrixの数（探索では学習用と検証用の2つを使う）
+MATRIX_CACHE_SIZE = 2
+
+_matrix_cache: OrderedDict = OrderedDict()
+# reuse_xgboost_matrices() の入れ子の深さ（0のときはQuantileDMatrixを保持しない）
+_matrix_cache_depth = 0
+
+
+def get_dataset_dir() -> Path:
+    return get_project_root() / DATA_DIR / PROCESSED_DIR / BINNED_DATASET_DIR
+
+
+def get_dataset_key(dataset_id: str, family: str, binning_params: dict) -> str:
+    """
+    前処理コードのハッシュ・データセットのID・ビン分けのパラメータから、キャッシュのキーを返す。
+    キーは前処理コードのハッシュから始まる（remove_stale_datasetsで使う）。
+    """
+    config = json.dumps(binning_params, sort_keys=True, default=str)
+    return f"{get_preprocess_hash()}_{dataset_id}_{family}_{hashlib.sha1(config.encode()).hexdigest()[:12]}"
+
+
+def remove_stale_datasets(dataset_dir: Path) -> None:
+    """現在の前処理コードのハッシュで始まらない（古い前処理コードで作られた）Datasetのファイルを削除する"""
+    prefix = f"{get_preprocess_hash()}_"
+    for stale in dataset_dir.glob("*.bin"):
+        if not stale.name.startswith(prefix):
+            print(f"Removing stale binned dataset: {stale.name}")
+            stale.unlink(missing_ok=True)
+
+
+def remove_least_recently_used_datasets(dataset_dir: Path, max_bytes: int | None = None) -> None:
+    """
+    Datasetのファイルの合計が max_bytes（既定: MAX_DATASET_BYTES）以下になるまで、
+    最後に使った時刻（読み込み・保存時に更新する更新時刻）の古いものから削除する。
+    """
+    max_bytes = MAX_DATASET_BYTES if max_bytes is None else max_bytes
+    files = []
+    for path in dataset_dir.glob("*.bin"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:  # 他のプロセスが削除した
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files, key=lambda f: f[0]):
+        if total <= max_bytes:
+            break
+        print(f"Removing least recently used binned dataset: {path.name}")
+        path.unlink(missing_ok=True)
+        total -= size
+
+
+@contextmanager
+def reuse_xgboost_matrices():
+    """
+    ブロックの中では、同じkeyのQuantileDMatrixを作り直さずに再利用する（探索で候補ごとに学習する場合など）。
+    ブロックを抜けると保持していたQuantileDMatrixを解放する。ブロックの外では学習のたびに作り、保持しない。
+    """
+    global _matrix_cache_depth
+    _matrix_cache_depth += 1
+    try:
+        yield
+    finally:
+        _matrix_cache_depth -= 1
+        if _matrix_cache_depth == 0:
+            _matrix_cache.clear()
+
+
+def clear_binned_datasets():
+    """保存したDatasetとプロセス内のQuantileDMatrixをすべて削除する"""
+    shutil.rmtree(get_dataset_dir(), ignore_errors=True)
+    _matrix_cache.clear()
+
+
+def to_float32(X) -> np.ndarray:
+    """特徴量をC連続のfloat32配列にする"""
+    return np.ascontiguousarray(X, dtype="float32")
+
+
+def load_lgbm_dataset(X, y, key: str, params: dict, reference=None):
+    """
+    keyに対応するLightGBMのDatasetを返す。
+    保存済みならバイナリファイルを読み込み、なければfloat32の特徴量から構築して保存する。
+    referenceを指定した場合は、そのDatasetと同じビン境界で構築する（検証用データ）。
+    """
+    import lightgbm as lgb
+
+    path = get_dataset_dir() / f"{key}.bin"
+    if path.exists():
+        print(f"Loading binned dataset: {path.name}")
+        dataset = lgb.Dataset(str(path), params=params, reference=reference).construct()
+        # 最後に使った時刻として更新時刻を進める（remove_least_recently_used_datasets）
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return dataset
+
+    dataset = lgb.Dataset(
+        to_float32(X), label=np.asarray(y), feature_name=list(X.columns),
+        params=params, reference=reference, free_raw_data=True,
+    ).construct()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    remove_stale_datasets(path.parent)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    dataset.save_binary(str(tmp_path))
+    os.replace(tmp_path, path)
+    print(f"Saved binned dataset: {path.name}")
+    remove_least_recently_used_datasets(path.parent)
+    return dataset
+
+
+def get_xgboost_matrix(X, y, key: str, model, ref=None):
+    """
+    keyに対応するXGBoostのQuantileDMatrixを返す。
+    reuse_xgboost_matrices() の中では直近に作ったものを保持し、同じkeyなら作り直さない。
+    """
+    import xgboost as xgb
+
+    if _matrix_cache_depth > 0 and key in _matrix_cache:
+        _matrix_cache.move_to_end(key)
+        return _matrix_cache[key]
+
+    matrix = xgb.QuantileDMatrix(
+        to_float32(X), label=np.asarray(y), feature_names=list(X.columns), ref=ref,
+        max_bin=model.max_bin, missing=model.missing, nthread=model.n_jobs,
+    )
+    if _matrix_cache_depth > 0:
+        _matrix_cache[key] = matrix
+        while len(_matrix_cache) > MATRIX_CACHE_SIZE:
+            _matrix_cache.popitem(last=False)
+    return matrix
+
+
+def can_fit_lgbm_binned(model, init_model=None) -> bool:
+    """
+    fit_lgbm_binnedでLGBMClassifier.fitと同じ結果になるかを返す。
+    確認済みのLightGBMのバージョンで、fitの中で別の処理が必要なパラメータ
+    （class_weight・関数で指定したobjective・linear_tree）を使わず、
+    既存のモデルからの学習の継続（init_model）でない場合のみTrue。
+    """
+    import lightgbm as lgb
+
+    params = model.get_params()
+    return (
+        lgb.__version__.startswith(SUPPORTED_LGBM_VERSION)
+        and model.class_weight is None
+        and not callable(model.objective)
+        and not any(params.get(name) for name in LGBM_LINEAR_TREE_PARAMS)
+        and init_model is None
+    )
+
+
+def fit_lgbm_binned(model, X_train, y_train, dataset_id: str, eval_set=None, callbacks=None, init_model=None):
+    """
+    LGBMClassifierを、保存済み（なければ構築して保存した）Datasetで学習する。
+    lgb.trainで学習し、LGBMClassifier.fitと同じ属性を設定して返す。
+    eval_setは [(X_val, y_val)] の形で1つだけ指定でき、学習用と同じビン境界で構築する。
+    can_fit_lgbm_binnedがFalseの場合は、Datasetを再利用せずに通常のfitで学習する。
+    """
+    import lightgbm as lgb
+    from sklearn.preprocessing import LabelEncoder
+
+    if not can_fit_lgbm_binned(model, init_model):
+        print(f"Binned dataset is not used for LightGBM {lgb.__version__} with these parameters, fitting normally.")
+        return model.fit(X_train, y_train, eval_set=eval_set, callbacks=callbacks, init_model=init_model)
+
+    # LGBMClassifier.fitと同じ順に、ラベルの変換とパラメータの解決を行う
+    model._le = LabelEncoder().fit(y_train)
+    model._classes = model._le.classes_
+    model._n_classes = len(model._classes)
+    model._class_map = dict(zip(model._le.classes_, model._le.transform(model._le.classes_)))
+    if model.objective is None:
+        model._objective = None
+    model.n_features_in_ = X_train.shape[1]
+    params = {**model._process_params(stage="fit"), "feature_pre_filter": False}
+
+    binning_params = {name: model.get_params().get(name) for name in LGBM_BINNING_PARAMS}
+    key = get_dataset_key(dataset_id, "lgbm", binning_params)
+    train_set = load_lgbm_dataset(X_train, model._le.transform(y_train), key, params)
+
+    valid_sets = []
+    if eval_set:
+        X_val, y_val = eval_set[0]
+        valid_key = get_dataset_key(f"{dataset_id}_valid", "lgbm", binning_params)
+        valid_sets.append(load_lgbm_dataset(X_val, model._le.transform(y_val), valid_key, params, reference=train_set))
+
+    evals_result: dict = {}
+    booster = lgb.train(
+        params, train_set,
+        num_boost_round=model.n_estimators,
+        valid_sets=valid_sets,
+        valid_names=[f"valid_{i}" for i in range(len(valid_sets))] or None,
+        callbacks=[*(callbacks or []), lgb.record_evaluation(evals_result)],
+    )
+
+    model._Booster = booster
+    model._n_features = booster.num_feature()
+    model._evals_result = evals_result
+    model._best_iteration = booster.best_iteration
+    model._best_score = booster.best_score
+    model.fitted_ = True
+    booster.free_dataset()
+    return model
+
+
+def fit_xgboost_binned(model, X_train, y_train, dataset_id: str, eval_set=None):
+    """
+    XGBClassifierを、プロセス内で再利用するQuantileDMatrixで学習する。
+    xgb.trainで学習したBoosterを load_model で読み込むため、XGBClassifier.fitと同じ状態になる。
+    eval_setは [(X_val, y_val)] の形で1つだけ指定でき、early_stopping_roundsはモデルのパラメータを使う。
+    """
+    import xgboost as xgb
+
+    binning_params = {name: model.get_params().get(name) for name in XGBOOST_BINNING_PARAMS}
+    dtrain = get_xgboost_matrix(X_train, y_train, get_dataset_key(dataset_id, "xgboost", binning_params), model)
+
+    evals = []
+    if eval_set:
+        X_val, y_val = eval_set[0]
+        valid_key = get_dataset_key(f"{dataset_id}_valid", "xgboost", binning_params)
+        evals.append((get_xgboost_matrix(X_val, y_val, valid_key, model, ref=dtrain), "validation_0"))
+
+    booster = xgb.train(
+        model.get_xgb_params(), dtrain,
+        num_boost_round=model.n_estimators,
+        evals=evals,
+        early_stopping_rounds=model.early_stopping_rounds,
+        verbose_eval=False,
+    )
+    model.load_model(bytearray(booster.save_raw()))
+    return model
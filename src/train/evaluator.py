@@ -1,33 +1,203 @@
-from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, confusion_matrix
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.profiling import profiled
+from src.train.trainer import get_model_family
 
-def evaluate_model_train_test(model, X_train, X_test, y_train, y_test):
-    """学習・テスト両方のメトリクスを計算"""
-    y_pred_train = model.predict(X_train)
-    y_pred_test = model.predict(X_test)
+# 確率をラベルに変換する閾値（sklearn / LightGBM / XGBoost の predict と同じ）
+THRESHOLD = 0.5
+# log lossで0・1の確率をクリップする幅
+EPS = 1e-15
 
-    metrics = {
-        "train_accuracy": accuracy_score(y_train, y_pred_train),
-        "train_f1_score": f1_score(y_train, y_pred_train, zero_division=0),
-        "test_accuracy": accuracy_score(y_test, y_pred_test),
-        "test_precision": precision_score(y_test, y_pred_test, zero_division=0),
-        "test_recall": recall_score(y_test, y_pred_test, zero_division=0),
-        "test_f1_score": f1_score(y_test, y_pred_test, zero_division=0),
-        "confusion_matrix": confusion_matrix(y_test, y_pred_test).tolist(),
+
+def predict_positive_proba(model, X, chunk_size: int | None = None) -> np.ndarray:
+    """
+    is_member=1の確率を返す。chunk_sizeを指定した場合はchunk_size行ずつ推論する。
+    """
+    if chunk_size is None or len(X) <= chunk_size:
+        return model.predict_proba(X)[:, 1]
+
+    proba = np.empty(len(X), dtype="float64")
+    for start in range(0, len(X), chunk_size):
+        proba[start:start + chunk_size] = model.predict_proba(X.iloc[start:start + chunk_size])[:, 1]
+    return proba
+
+
+def confusion_counts(y_true, y_pred) -> np.ndarray:
+    """
+    2値分類の混同行列 [[TN, FP], [FN, TP]] を1回のbincountで計算する。
+    """
+    y_true = np.asarray(y_true, dtype="int64")
+    y_pred = np.asarray(y_pred, dtype="int64")
+    return np.bincount(2 * y_true + y_pred, minlength=4).reshape(2, 2)
+
+
+def metrics_from_confusion(cm: np.ndarray) -> dict:
+    """混同行列からaccuracy・precision・recall・F1を計算する（0除算は0とする）"""
+    (tn, fp), (fn, tp) = cm.tolist()
+    total = tn + fp + fn + tp
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return {
+        "accuracy": (tp + tn) / total if total else 0.0,
+        "precision": precision,
+        "recall": recall,
+        "f1_score": 2 * tp / (2 * tp + fp + fn) if tp + fp + fn else 0.0,
     }
+
+
+def roc_auc(y_true, proba: np.ndarray) -> float:
+    """
+    ROC-AUCを1回のソートで計算する。
+    確率の昇順に並べ、各正例について自分より確率の低い負例の数（同じ確率の負例は0.5）を数える。
+    片方のクラスしかない場合はNaNを返す。
+    """
+    y_true = np.asarray(y_true, dtype="int64")
+    n_pos = int(y_true.sum())
+    n_neg = len(y_true) - n_pos
+    if n_pos == 0 or n_neg == 0:
+        return float("nan")
+
+    order = np.argsort(proba)
+    sorted_proba = np.asarray(proba)[order]
+    sorted_y = y_true[order]
+    # 同じ確率の行をまとめたグループごとの正例数・負例数
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(sorted_proba)) + 1))
+    pos = np.add.reduceat(sorted_y, starts)
+    neg = np.diff(np.append(starts, len(sorted_y))) - pos
+    neg_below = np.cumsum(neg) - neg
+    return float(np.sum(pos * (neg_below + 0.5 * neg)) / (n_pos * n_neg))
+
+
+def log_loss(y_true, proba: np.ndarray) -> float:
+    """2値分類のlog loss"""
+    y_true = np.asarray(y_true, dtype="float64")
+    proba = np.clip(proba, EPS, 1 - EPS)
+    return float(-np.mean(y_true * np.log(proba) + (1 - y_true) * np.log1p(-proba)))
+
+
+def compute_metrics(y_true, y_pred, proba: np.ndarray | None = None) -> dict:
+    """
+    予測ラベル（と確率）から全メトリクスを計算する。
+    confusion_matrixはsklearnと同じ [[TN, FP], [FN, TP]] のリストで返す。
+    """
+    cm = confusion_counts(y_true, y_pred)
+    metrics = metrics_from_confusion(cm)
+    if proba is not None:
+        metrics["roc_auc"] = roc_auc(y_true, proba)
+        metrics["log_loss"] = log_loss(y_true, proba)
+    metrics["confusion_matrix"] = cm.tolist()
     return metrics
 
-def evaluate_model(model, X, y):
+
+def score_model(model, X, y, chunk_size: int | None = None, proba_metrics: bool = True) -> dict:
     """
-    与えられたデータのメトリクスを計算
+    1回のpredict_probaから全メトリクスを計算する。
+    proba_metrics=Falseの場合はROC-AUC・log lossを省略する。
+    predict_probaを持たないモデル（pyfuncなど）はpredictのラベルのみで計算する。
     """
-    
-    y_pred = model.predict(X)
-    
+    if hasattr(model, "predict_proba"):
+        proba = predict_positive_proba(model, X, chunk_size)
+        return compute_metrics(y, (proba > THRESHOLD).astype("int64"), proba if proba_metrics else None)
+    return compute_metrics(y, model.predict(X))
+
+
+@profiled("evaluate")
+def evaluate_model_train_test(model, X_train, X_test, y_train, y_test, train_sample_rows: int | None = None, chunk_size: int | None = None, random_state: int = 42):
+    """
+    学習・テスト両方のメトリクスを計算
+
+    学習データのメトリクス（train_*）は過学習の確認用のため、
+    train_sample_rowsを指定した場合はその行数だけ無作為に抽出して計算する。
+    chunk_sizeを指定した場合はchunk_size行ずつ推論する（大きな月でのメモリ削減用）。
+    """
+    if train_sample_rows is not None and train_sample_rows < len(X_train):
+        rng = np.random.default_rng(random_state)
+        rows = np.sort(rng.choice(len(X_train), train_sample_rows, replace=False))
+        X_train, y_train = X_train.iloc[rows], y_train.iloc[rows]
+
+    train = score_model(model, X_train, y_train, chunk_size, proba_metrics=False)
+    test = score_model(model, X_test, y_test, chunk_size)
+
     metrics = {
-        "accuracy": accuracy_score(y, y_pred),
-        "f1_score": f1_score(y, y_pred, zero_division=0),
-        "precision": precision_score(y, y_pred, zero_division=0),
-        "recall": recall_score(y, y_pred, zero_division=0),
-        "confusion_matrix": confusion_matrix(y, y_pred).tolist(),
+        "train_accuracy": train["accuracy"],
+        "train_f1_score": train["f1_score"],
+        "test_accuracy": test["accuracy"],
+        "test_precision": test["precision"],
+        "test_recall": test["recall"],
+        "test_f1_score": test["f1_score"],
+        "confusion_matrix": test["confusion_matrix"],
     }
+    for key in ("roc_auc", "log_loss"):
+        if key in test:
+            metrics[f"test_{key}"] = test[key]
+    return metrics
+
+def evaluate_model(model, X, y, chunk_size: int | None = None):
+    """
+    与えられたデータのメトリクスを計算
+    """
+    return score_model(model, X, y, chunk_size)
+
+
+def get_native_predictor(model):
+    """
+    特徴量の配列（C連続）からis_member=1の確率を返す関数を作る。
+    pyfuncモデルは中のネイティブモデルを取り出し、スキーマ検証やDataFrameのコピーを経由しない。
+    LightGBM / XGBoost はBoosterで直接推論する（推論中はGILを解放する）。
+    """
+    if hasattr(model, "get_raw_model"):
+        model = model.get_raw_model()
+
+    family = get_model_family(model)
+    if family == "lgbm":
+        booster = model.booster_
+        return lambda features, columns: booster.predict(features)
+    if family == "xgboost":
+        booster = model.get_booster()
+        return lambda features, columns: booster.inplace_predict(features)
+    # sklearnは学習時の列名と揃えるため、バッチをコピーなしでDataFrameに包んで渡す
+    return lambda features, columns: model.predict_proba(pd.DataFrame(features, columns=columns, copy=False))[:, 1]
+
+
+@profiled("evaluate_batched")
+def evaluate_model_batched(model, X, y, batch_size: int = 100_000, n_threads: int = 1) -> dict:
+    """
+    月全体のデータをbatch_size行ずつネイティブモデルで推論し、メトリクスを計算する。
+
+    特徴量は1回だけ配列として取り出し、バッチごとにC連続の配列にして推論する。
+    混同行列とlog lossはバッチごとに足し合わせるため、確率を全行分保持せず、
+    メモリ使用量はデータの行数によらずバッチサイズで決まる（ROC-AUCは計算しない）。
+    n_threads > 1 の場合はバッチをスレッドプールで並列に推論する
+    （GILを解放するLightGBM / XGBoost向け）。
+    """
+    predict = get_native_predictor(model)
+    columns = list(X.columns)
+    features = X.to_numpy()
+    y = np.asarray(y, dtype="int64")
+
+    def predict_batch(start):
+        batch = np.ascontiguousarray(features[start:start + batch_size], dtype="float64")
+        return start, np.asarray(predict(batch, columns), dtype="float64")
+
+    cm = np.zeros((2, 2), dtype="int64")
+    log_loss_sum = 0.0
+    starts = range(0, len(y), batch_size)
+
+    def accumulate(results):
+        nonlocal cm, log_loss_sum
+        for start, proba in results:
+            y_batch = y[start:start + len(proba)]
+            cm += confusion_counts(y_batch, proba > THRESHOLD)
+            log_loss_sum += log_loss(y_batch, proba) * len(proba)
+
+    if n_threads > 1:
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            accumulate(executor.map(predict_batch, starts))
+    else:
+        accumulate(map(predict_batch, starts))
+
+    metrics = metrics_from_confusion(cm)
+    metrics["log_loss"] = log_loss_sum / len(y) if len(y) else float("nan")
+    metrics["confusion_matrix"] = cm.tolist()
     return metrics
@@ -1,32 +1,71 @@
-from src.utils.preprocess import preprocess_pipeline
-from src.utils.io import load_month_data
-from src.train.trainer import get_model, train_model
+import time
+from src.utils.preprocess import preprocess_pipeline_streaming, accumulate_usage_tables
+from src.utils.feature_store import get_features, get_usage_tables
+from src.utils.lineage import build_lineage
+from src.utils.drift import build_reference_sketch
+from src.utils.profiling import stage, trace_mark, get_trace, trace_metrics
+from src.train.trainer import get_model, train_model, continue_training
 from src.train.evaluator import evaluate_model_train_test
 from src.train.mlflow_logger import log_experiment_to_mlflow
-from sklearn.model_selection import train_test_split
 
-def run_experiment(data_info, model_name, params, experiment_name, random_state=42):
-    """実験全体の統合関数
-    
-    実行例）
-    metrics = run_experiment(
-    data_info=[2014, 1],
-    model_name="logistic_regression",
-    params={"max_iter": 500, "random_state": 42},
-    experiment_name="citibike_membership"
-    )
-    
+def get_streaming_months(data_info, streaming=False) -> list[tuple[int, int]] | None:
+    """
+    ストリーミング前処理で読む(年, 月)のリストを返す。特徴量ストアを使う場合（単月かつstreaming=False）はNone。
     """
-    df_org = load_month_data(*data_info)
-    df = preprocess_pipeline(df_org)
+    if isinstance(data_info[0], (list, tuple)):
+        return [tuple(m) for m in data_info]
+    if streaming:
+        return [tuple(data_info)]
+    return None
+
+
+def load_dataset(data_info, streaming=False, max_duration_min=360, usage_tables=None):
+    """
+    data_infoに対応する学習用データを返す。
+    data_infoは[年, 月]、または複数月の場合は[[年, 月], ...]で指定する。
+    複数月またはstreaming=Trueの場合はチャンク単位のストリーミング前処理を使う。
+    単月の場合は特徴量ストアを経由する。
+    usage_tables（load_usage_tablesの結果）を渡すと、ストリーミング前処理で回数の集計をやり直さない。
+    """
+    months = get_streaming_months(data_info, streaming)
+    if months is not None:
+        return preprocess_pipeline_streaming(months, max_duration_min, usage_tables=usage_tables)
+
+    return get_features(*data_info, max_duration_min)
+
+
+def load_usage_tables(data_info, max_duration_min=360, streaming=False):
+    """
+    data_infoの期間で集計した駅・自転車の利用回数テーブルを返す。
+    複数月またはstreaming=Trueの場合はチャンク単位で集計し、月全体をメモリに載せない（特徴量ストアを使わない）。
+    """
+    months = get_streaming_months(data_info, streaming)
+    if months is not None:
+        return accumulate_usage_tables(months, max_duration_min)
+    return get_usage_tables(*data_info, max_duration_min)
+
+
+def split_dataset(df, random_state=42, test_size=0.2):
+    """前処理済みデータを特徴量とターゲットに分け、学習用・テスト用に分割する"""
+    # sklearnのimportは時間がかかるため、分割するときに初めてimportする
+    from sklearn.model_selection import train_test_split
 
     X = df.drop("is_member", axis=1)
     y = df["is_member"]
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=random_state
-    )
+    return train_test_split(X, y, test_size=test_size, random_state=random_state)
 
+
+def get_split_id(lineage: dict, random_state=42, test_size=0.2, part: str = "train") -> str:
+    """
+    分割後のデータを識別するID（ビン分け済みデータセットの再利用に使う）。
+    元データのダイジェストと分割の条件から決まるため、同じ月を同じ条件で分割すれば同じIDになる。
+    """
+    return f"{lineage['digest']}_{part}_rs{random_state}_t{test_size}"
+
+
+def build_dataset_params(data_info, X_train, X_test, y_train, y_test, random_state=42, test_size=0.2):
+    """MLflowに記録するデータセット情報を作成する"""
     dataset_info = {
         "data_info": data_info,
         "feature_names": X_train.columns.tolist(),
@@ -34,7 +73,7 @@ def run_experiment(data_info, model_name, params, experiment_name, random_state=
     
     dataset_params = {
         "data_info": data_info,
-        "test_size": 0.2,
+        "test_size": test_size,
         "random_state": random_state,
         "train_samples": len(X_train),
         "test_samples": len(X_test),
@@ -43,10 +82,66 @@ def run_experiment(data_info, model_name, params, experiment_name, random_state=
         "class_distribution_train": y_train.value_counts().to_dict(),
         "class_distribution_test": y_test.value_counts().to_dict(),
     }
+    return dataset_info, dataset_params
+
+
+def run_experiment(data_info, model_name, params, experiment_name, random_state=42, streaming=False, base_model=None, tags=None, profile_dataset=False, train_sample_rows=None, incremental_rounds=None, max_duration_min=360):
+    """実験全体の統合関数
+    
+    実行例）
+    metrics = run_experiment(
+    data_info=[2014, 1],
+    model_name="logistic_regression",
+    params={"max_iter": 500, "random_state": 42},
+    experiment_name="citibike_membership"
+    )
+    
+    複数月で学習する場合は data_info=[[2014, 6], [2014, 7]] のように指定する。
+    base_modelを渡すと、そのモデルを起点に学習を継続する（continue_training）。
+    incremental_roundsは継続学習で lgbm / xgboost に追加する木の数で、paramsとは別に incremental_rounds として記録する
+    （paramsの n_estimators は起点のモデルの設定のまま残す）。
+    学習時間は fit_time_sec としてメトリクスに含まれる。
+    データセットは元CSVのハッシュによるリネージとして記録する。
+    profile_dataset=True の場合は mlflow.data.from_pandas によるデータ全体のプロファイルも記録する。
+    train_sample_rowsを指定すると、学習データのメトリクスはその行数の無作為抽出で計算する。
+    max_duration_minは前処理の外れ値除外の条件（利用時間の上限・分）で、学習データと利用回数テーブルの両方に使う。
+    各ステージ（読み込み・前処理・学習・評価など）の時間・メモリは stage_* メトリクスと
+    profiling/trace.json として記録する。
+    """
+    mark = trace_mark()
+    with stage("load_dataset") as record:
+        # 利用回数テーブルを先に作り、ストリーミング前処理でも同じものを使う（複数月を何度も集計しない）
+        usage_tables = load_usage_tables(data_info, max_duration_min, streaming)
+        df = load_dataset(data_info, streaming, max_duration_min, usage_tables)
+        record["rows"] = len(df)
+
+    with stage("split"):
+        X_train, X_test, y_train, y_test = split_dataset(df, random_state)
+        dataset_info, dataset_params = build_dataset_params(data_info, X_train, X_test, y_train, y_test, random_state)
 
+    # リネージは元CSVのハッシュ（キャッシュ済み）から決まり、学習データセットのIDにも使う
+    lineage = build_lineage(data_info, df, max_duration_min)
     model = get_model(model_name, params)
-    model = train_model(model, X_train, y_train)
-    metrics = evaluate_model_train_test(model, X_train, X_test, y_train, y_test)
-    log_experiment_to_mlflow(model, df, dataset_params, metrics, params, dataset_info, X_train, experiment_name, model_name)
+    start = time.perf_counter()
+    with stage("fit", rows=len(X_train)):
+        if base_model is not None:
+            model = continue_training(model, base_model, X_train, y_train, incremental_rounds)
+        else:
+            model = train_model(model, X_train, y_train, dataset_id=get_split_id(lineage, random_state))
+    fit_time = time.perf_counter() - start
+
+    metrics = evaluate_model_train_test(model, X_train, X_test, y_train, y_test, train_sample_rows, random_state=random_state)
+    metrics["fit_time_sec"] = fit_time
+    with stage("drift_sketch"):
+        drift_sketch = build_reference_sketch(X_train, y_train)
+
+    trace = get_trace(since=mark)
+    metrics.update(trace_metrics(trace))
+    logged_params = params if incremental_rounds is None else {**params, "incremental_rounds": incremental_rounds}
+    log_experiment_to_mlflow(
+        model, df if profile_dataset else None, dataset_params, metrics, logged_params, dataset_info, X_train,
+        experiment_name, model_name, tags=tags, usage_tables=usage_tables, lineage=lineage, trace=trace,
+        drift_sketch=drift_sketch,
+    )
 
     return metrics
\ No newline at end of file
@@ -1,77 +1,215 @@
-import mlflow
+import atexit
 import json
+import mlflow
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-import lightgbm as lgb
-import xgboost as xgb
+from mlflow.data.dataset_source_registry import get_dataset_source_from_json
+from mlflow.data.meta_dataset import MetaDataset
+from mlflow.entities import DatasetInput, InputTag, Metric, Param, RunTag
+from mlflow.tracking import MlflowClient # type: ignore
+from mlflow.tracking.context import registry as context_registry
+from mlflow.types import ColSpec, Schema
+from mlflow.utils.mlflow_tags import MLFLOW_DATASET_CONTEXT, MLFLOW_PARENT_RUN_ID, MLFLOW_RUN_NAME
+from src.utils.usage_tables import UsageTables
+from src.utils.profiling import profiled
+from src.train.trainer import get_model_family
+
+
+USAGE_TABLES_ARTIFACT_DIR = "usage_tables"
+USAGE_TABLES_FILE = "usage_tables.npz"
+LINEAGE_ARTIFACT_FILE = "dataset_info/lineage.json"
+TRACE_ARTIFACT_FILE = "profiling/trace.json"
+DRIFT_SKETCH_ARTIFACT_FILE = "drift/reference_sketch.json"
+COMPILED_PREDICTOR_ARTIFACT_DIR = "compiled"
+COMPILED_PREDICTOR_FILE = "predictor.npz"
+# pandasの型からMLflowのスキーマ型への対応（それ以外は文字列扱い）
+MLFLOW_COLUMN_TYPES = {
+    "float64": "double",
+    "float32": "float",
+    "int64": "long",
+    "int32": "integer",
+    "int8": "integer",
+    "bool": "boolean",
+}
+
+# Runの記録をバックグラウンドで送信するスレッドプール
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="mlflow-logger")
+_pending_logs: dict[str, Future] = {}
+_pending_lock = threading.Lock()
 
 
 def log_model_to_mlflow(model, X_train, model_name: str):
     """モデルをMLflowに保存（フレームワーク自動判定）"""
-    if isinstance(model, lgb.LGBMClassifier):
-        mlflow.lightgbm.log_model(model, artifact_path="model", input_example=X_train.iloc[:5])
-    elif isinstance(model, xgb.XGBClassifier):
-        mlflow.xgboost.log_model(model, artifact_path="model", input_example=X_train.iloc[:5])
+    input_example = X_train.iloc[:5]
+    family = get_model_family(model)
+    if family == "lgbm":
+        mlflow.lightgbm.log_model(model, artifact_path="model", input_example=input_example)
+    elif family == "xgboost":
+        mlflow.xgboost.log_model(model, artifact_path="model", input_example=input_example)
     else:
-        mlflow.sklearn.log_model(model, artifact_path="model", input_example=X_train.iloc[:5])
-
-
-def log_experiment_to_mlflow(model, df, dataset_params, metrics, params, dataset_info, X_train, experiment_name, model_name):
-    """MLflowへの統合的なログ処理"""
-
-    mlflow.set_experiment(experiment_name)
-    with mlflow.start_run(run_name=f"{model_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"):
-        # パラメータ & メトリクス
-        mlflow.log_params(params)
-        mlflow.log_metrics({k: v for k, v in metrics.items() if not isinstance(v, list)})
-        
-        # 特徴量名をファイルとして保存
-        feature_path = Path("interim/features.json")
-        feature_path.parent.mkdir(exist_ok=True, parents=True)
-        with open(feature_path, "w") as f:
-            json.dump(dataset_params["feature_names"], f, indent=2)           
-        mlflow.log_artifact(str(feature_path), "dataset_info")
-        
-        # クラス分布を記録
-        class_dist_path = Path("interim/class_distribution.json")
-        class_dist_path.parent.mkdir(exist_ok=True, parents=True)
-        with open(class_dist_path, "w") as f:
-            json.dump({
-                "train": dataset_params["class_distribution_train"],
-                "test": dataset_params["class_distribution_test"]
-            }, f, indent=2)
-        mlflow.log_artifact(str(class_dist_path), "dataset_info")        
-        
-        # データセットの追跡（スナップショットを記録）
+        mlflow.sklearn.log_model(model, artifact_path="model", input_example=input_example)
+
+
+def lineage_to_dataset(lineage: dict) -> MetaDataset:
+    """
+    リネージ（src.utils.lineage.build_lineage）からMLflowのデータセットを作る。
+    データ本体は読まず、ハッシュとスキーマのみを持つ。
+    """
+    source = get_dataset_source_from_json(json.dumps({"uri": lineage["sources"][0]["path"]}), "local")
+    schema = None
+    if "schema" in lineage:
+        schema = Schema([
+            ColSpec(MLFLOW_COLUMN_TYPES.get(dtype, "string"), col) for col, dtype in lineage["schema"].items()
+        ])
+    return MetaDataset(source, name=f"citibike_{lineage['digest']}", digest=lineage["digest"], schema=schema)
+
+
+@profiled("mlflow_upload")
+def upload_run(run_id, model, input_example, model_name, params, metrics, tags, summary, usage_tables, df, lineage, trace, drift_sketch):
+    """
+    1つのRunの記録をまとめて送信する（バックグラウンドスレッドで実行）。
+    パラメータ・メトリクス・タグは1回のlog_batch、小さなJSONは1つのファイルにまとめて送る。
+    最後にモデルを記録してRunを終了する。
+    """
+    client = MlflowClient()
+    try:
+        timestamp = int(time.time() * 1000)
+        client.log_batch(
+            run_id,
+            metrics=[Metric(k, float(v), timestamp, 0) for k, v in metrics.items() if not isinstance(v, list)],
+            params=[Param(k, str(v)) for k, v in params.items()],
+            tags=[RunTag(k, str(v)) for k, v in tags.items()],
+        )
+        client.log_dict(run_id, summary, "dataset_info/run_summary.json")
+        if trace is not None:
+            client.log_dict(run_id, trace, TRACE_ARTIFACT_FILE)
+        if drift_sketch is not None:
+            client.log_dict(run_id, drift_sketch, DRIFT_SKETCH_ARTIFACT_FILE)
+
+        # 推論時に集約特徴量を引くための利用回数テーブル
+        if usage_tables is not None:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                tables_path = usage_tables.save(Path(tmp_dir) / USAGE_TABLES_FILE)
+                client.log_artifact(run_id, str(tables_path), USAGE_TABLES_ARTIFACT_DIR)
+
+        # データセットの追跡（リネージは軽量なので常に、データ全体のプロファイルはdfを渡した場合のみ）
+        datasets = []
+        if lineage is not None:
+            client.log_dict(run_id, lineage, LINEAGE_ARTIFACT_FILE)
+            datasets.append(lineage_to_dataset(lineage))
+        if df is not None:
+            try:
+                datasets.append(mlflow.data.from_pandas(df, name=f"citibike_data_{datetime.now().strftime('%Y%m%d')}"))  # type: ignore
+            except Exception as e:
+                print(f"Error profiling dataset: {e}")
+        if datasets:
+            client.log_inputs(run_id, datasets=[
+                DatasetInput(dataset._to_mlflow_entity(), tags=[InputTag(MLFLOW_DATASET_CONTEXT, "training")])
+                for dataset in datasets
+            ])
+
+        # モデル登録（このスレッドでRunを再開し、終了時にFINISHEDにする）
+        with mlflow.start_run(run_id=run_id):
+            log_model_to_mlflow(model, input_example, model_name)
+    except Exception as e:
+        print(f"Error logging run {run_id} to MLflow: {e}")
+        client.set_terminated(run_id, status="FAILED")
+        raise
+
+
+def wait_for_pending_logs() -> dict[str, Exception]:
+    """
+    バックグラウンドで送信中のRunの記録がすべて終わるまで待つ。
+    送信に失敗したRun（FAILEDになったRun）のIDと例外を返す。
+    """
+    with _pending_lock:
+        pending = dict(_pending_logs)
+        _pending_logs.clear()
+    failures = {}
+    for run_id, future in pending.items():
         try:
-            mlflow.log_input(
-                mlflow.data.from_pandas(            # type: ignore
-                    df,
-                    name=f"citibike_data_{datetime.now().strftime('%Y%m%d')}",
-                ),
-                context="training",
-            )
+            future.result()
         except Exception as e:
-            print(f"Error logging dataset to MLflow: {e}")
-
-        # 混同行列
-        cm_path = Path("data/interim/confusion_matrix.json")
-        cm_path.parent.mkdir(exist_ok=True, parents=True)
-        with open(cm_path, "w") as f:
-            json.dump(metrics["confusion_matrix"], f, indent=2)
-        mlflow.log_artifact(str(cm_path), "evaluation")
-
-        # データ情報
-        feature_path = Path("data/interim/features.json")
-        with open(feature_path, "w") as f:
-            json.dump(dataset_info["feature_names"], f, indent=2)
-        mlflow.log_artifact(str(feature_path), "dataset_info")
-
-        # モデル登録
-        log_model_to_mlflow(model, X_train, model_name)
-
-        mlflow.set_tags({
-            "model_type": model_name,
-            "framework": "sklearn",
-            "data_source": dataset_info["data_info"],
-        })
\ No newline at end of file
+            failures[run_id] = e
+    return failures
+
+
+def log_experiment_to_mlflow(model, df, dataset_params, metrics, params, dataset_info, X_train, experiment_name, model_name, parent_run_id=None, tags=None, usage_tables=None, lineage=None, trace=None, drift_sketch=None, wait=False):
+    """
+    MLflowへの統合的なログ処理。作成したRunのIDを返す。
+    Runの作成だけをその場で行い、記録の送信はバックグラウンドのスレッドプールで行う。
+    送信の完了を待つ場合は wait=True にするか、wait_for_pending_logs() を呼ぶ。
+
+    parent_run_idを指定した場合は、そのRunの子Runとして記録する。
+    tagsを指定した場合は標準のタグに追加して記録する。
+    usage_tablesを指定した場合は、推論用の利用回数テーブルをモデルと一緒に記録する。
+    lineageを指定した場合は、データセットのリネージ（元CSVのハッシュ・行数・スキーマ）を記録する。
+    drift_sketchを指定した場合は、学習データの分布（src.utils.drift）を再学習前のドリフト判定用に記録する。
+    traceを指定した場合は、ステージごとの計測結果（src.utils.profiling）をJSONで記録する。
+    dfを指定した場合のみ、mlflow.data.from_pandasによるデータ全体のプロファイルも記録する（大きな月では数秒かかる）。
+    """
+    experiment = mlflow.set_experiment(experiment_name)
+    run_name = f"{model_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    run_tags = {MLFLOW_RUN_NAME: run_name}
+    if parent_run_id is not None:
+        run_tags[MLFLOW_PARENT_RUN_ID] = parent_run_id
+    run = MlflowClient().create_run(experiment.experiment_id, tags=context_registry.resolve_tags(run_tags), run_name=run_name)
+
+    summary = {
+        "feature_names": dataset_info["feature_names"],
+        "class_distribution": {
+            "train": dataset_params["class_distribution_train"],
+            "test": dataset_params["class_distribution_test"],
+        },
+        "confusion_matrix": metrics["confusion_matrix"],
+    }
+    all_tags = {
+        "model_type": model_name,
+        "framework": "sklearn",
+        "data_source": dataset_info["data_info"],
+        **(tags or {}),
+    }
+    if lineage is not None:
+        all_tags["dataset_digest"] = lineage["digest"]
+    # 学習データ全体を保持し続けないよう、入力例は先頭5行だけコピーして渡す
+    input_example = X_train.iloc[:5].copy()
+
+    future = _executor.submit(
+        upload_run, run.info.run_id, model, input_example, model_name,
+        dict(params), dict(metrics), all_tags, summary, usage_tables, df, lineage, trace, drift_sketch,
+    )
+    with _pending_lock:
+        _pending_logs[run.info.run_id] = future
+    if wait:
+        future.result()
+
+    return run.info.run_id
+
+
+def load_usage_tables_artifact(run_id: str) -> UsageTables | None:
+    """Runに記録された利用回数テーブルを読み込む。記録されていなければNoneを返す。"""
+    try:
+        path = mlflow.artifacts.download_artifacts(
+            run_id=run_id, artifact_path=f"{USAGE_TABLES_ARTIFACT_DIR}/{USAGE_TABLES_FILE}"
+        )
+    except Exception as e:
+        print(f"No usage tables found for run {run_id}: {e}")
+        return None
+    return UsageTables.load(Path(path))
+
+
+def load_drift_sketch_artifact(run_id: str) -> dict | None:
+    """Runに記録された学習データの分布を読み込む。記録されていなければNoneを返す。"""
+    try:
+        return mlflow.artifacts.load_dict(f"runs:/{run_id}/{DRIFT_SKETCH_ARTIFACT_FILE}")
+    except Exception as e:
+        print(f"No drift sketch found for run {run_id}: {e}")
+        return None
+
+
+# プロセス終了前に送信中の記録を待つ
+atexit.register(wait_for_pending_logs)
@@ -0,0 +1,198 @@
+import random
+import mlflow
+from datetime import datetime
+from src.train.experiment import load_dataset, load_usage_tables, split_dataset, build_dataset_params, get_split_id
+from src.train.trainer import get_model, train_model, train_model_with_early_stopping, get_boosted_rounds
+from src.train.evaluator import evaluate_model_train_test, predict_positive_proba, confusion_counts, metrics_from_confusion, log_loss, THRESHOLD
+from src.train.mlflow_logger import log_experiment_to_mlflow
+from src.train.binned_dataset import reuse_xgboost_matrices
+from src.utils.lineage import build_lineage
+from src.utils.drift import build_reference_sketch
+
+
+# モデルごとのデフォルト探索空間
+DEFAULT_SEARCH_SPACES = {
+    "lgbm": {
+        "learning_rate": [0.02, 0.05, 0.1, 0.2],
+        "num_leaves": [15, 31, 63, 127],
+        "min_child_samples": [10, 20, 50, 100],
+        "subsample": [0.7, 0.85, 1.0],
+        "subsample_freq": [1],
+        "colsample_bytree": [0.7, 0.85, 1.0],
+        "verbose": [-1],
+    },
+    "xgboost": {
+        "learning_rate": [0.02, 0.05, 0.1, 0.2],
+        "max_depth": [3, 4, 6, 8],
+        "min_child_weight": [1, 5, 10],
+        "subsample": [0.7, 0.85, 1.0],
+        "colsample_bytree": [0.7, 0.85, 1.0],
+        "tree_method": ["hist"],
+    },
+}
+
+
+def sample_candidates(search_space: dict[str, list], n_candidates: int, random_state: int = 42) -> list[dict]:
+    """探索空間からランダムにn_candidates個のパラメータ候補を作る（重複なし）"""
+    rng = random.Random(random_state)
+    candidates: list[dict] = []
+    seen = set()
+    for _ in range(n_candidates * 20):
+        params = {k: rng.choice(v) for k, v in search_space.items()}
+        key = tuple(sorted(params.items()))
+        if key not in seen:
+            seen.add(key)
+            candidates.append(params)
+        if len(candidates) == n_candidates:
+            break
+    return candidates
+
+
+def evaluate_trial(model, X_val, y_val) -> dict:
+    """検証データでのlog lossとF1を計算"""
+    proba = predict_positive_proba(model, X_val)
+    return {
+        "val_logloss": log_loss(y_val, proba),
+        "val_f1_score": metrics_from_confusion(confusion_counts(y_val, proba > THRESHOLD))["f1_score"],
+    }
+
+
+def successive_halving(
+    data_info,
+    model_name: str,
+    experiment_name: str,
+    candidates: list[dict] | None = None,
+    n_candidates: int = 27,
+    min_rounds: int = 50,
+    max_rounds: int = 1350,
+    eta: int = 3,
+    early_stopping_rounds: int = 20,
+    random_state: int = 42,
+    max_duration_min: int = 360,
+) -> dict:
+    """
+    lgbm / xgboost のハイパーパラメータをSuccessive Halvingで探索する。
+
+    ブースティング回数 min_rounds から始めて、各段で候補を検証データのlog lossで順位付けし、
+    上位 1/eta だけを eta 倍の回数まで学習する。各学習は検証データでアーリーストッピングする。
+    次の段では前の段のモデルに木を追加して学習を継続し（init_model / xgb_model）、それまでの学習を捨てない。
+    前の段でアーリーストッピングした候補はそれ以上改善しないため、学習し直さずに前の段のスコアを使う。
+    最後に残った候補を学習データ全体で学習し直し、run_experimentと同じテストデータで評価する。
+
+    各段の学習は親Run（search_...）の子Runとして検証メトリクスのみ記録し、
+    最終モデルだけを test_f1_score 付きで記録するため、get_best_run は最終モデルを選ぶ。
+
+    実行例）
+    result = successive_halving(
+        data_info=[2014, 1],
+        model_name="lgbm",
+        experiment_name="citibike_membership",
+    )
+    """
+    model_name = model_name.lower()
+    if model_name not in DEFAULT_SEARCH_SPACES:
+        raise ValueError(f"Search is not supported for model: {model_name}")
+    if candidates is None:
+        candidates = sample_candidates(DEFAULT_SEARCH_SPACES[model_name], n_candidates, random_state)
+
+    usage_tables = load_usage_tables(data_info, max_duration_min)
+    df = load_dataset(data_info, max_duration_min=max_duration_min, usage_tables=usage_tables)
+    lineage = build_lineage(data_info, df, max_duration_min)
+    X_train, X_test, y_train, y_test = split_dataset(df, random_state)
+    # sklearnのimportは時間がかかるため、探索するときに初めてimportする
+    from sklearn.model_selection import train_test_split
+    X_fit, X_val, y_fit, y_val = train_test_split(X_train, y_train, test_size=0.2, random_state=random_state)
+
+    survivors = list(enumerate(candidates))
+    rounds = min_rounds
+    rung = 0
+    total_rounds = 0
+    best_iterations: dict[int, int] = {}
+    # 候補ごとの前の段のモデル・検証メトリクスと、アーリーストッピングした候補
+    models: dict = {}
+    trial_metrics_by_id: dict[int, dict] = {}
+    stopped: set[int] = set()
+
+    mlflow.set_experiment(experiment_name)
+    run_name = f"search_{model_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    # 学習用・検証用のQuantileDMatrixは探索の間だけ保持し、候補ごとに作り直さない
+    with mlflow.start_run(run_name=run_name) as parent_run, reuse_xgboost_matrices():
+        mlflow.log_params({
+            "n_candidates": len(candidates),
+            "min_rounds": min_rounds,
+            "max_rounds": max_rounds,
+            "eta": eta,
+            "early_stopping_rounds": early_stopping_rounds,
+            "max_duration_min": max_duration_min,
+        })
+        mlflow.set_tags({"search": "successive_halving", "model_type": model_name, "data_source": data_info})
+
+        while True:
+            print(f"Rung {rung}: {len(survivors)} candidates x {rounds} rounds")
+            scores = []
+            for candidate_id, params in survivors:
+                base_model = models.get(candidate_id)
+                done = get_boosted_rounds(base_model) if base_model is not None else 0
+                if candidate_id in stopped:
+                    # 前の段でアーリーストッピングしたため、回数を増やしても結果は変わらない
+                    trial_metrics = trial_metrics_by_id[candidate_id]
+                else:
+                    # 前の段のモデルに rounds - done 回を追加する。
+                    # 学習用・検証用のビン分けは全候補で共通のため、最初の候補で作ったものを再利用する（初回の段のみ）
+                    model = get_model(model_name, {**params, "n_estimators": rounds - done})
+                    model, best_iterations[candidate_id] = train_model_with_early_stopping(
+                        model, X_fit, y_fit, X_val, y_val, early_stopping_rounds,
+                        dataset_id=get_split_id(lineage, random_state, part="search_fit"), base_model=base_model,
+                    )
+                    trial_metrics = evaluate_trial(model, X_val, y_val)
+                    models[candidate_id] = model
+                    trial_metrics_by_id[candidate_id] = trial_metrics
+                    trained = get_boosted_rounds(model)
+                    total_rounds += trained - done
+                    if trained < rounds:
+                        stopped.add(candidate_id)
+                best_iteration = best_iterations[candidate_id]
+                scores.append((trial_metrics["val_logloss"], candidate_id, params))
+
+                with mlflow.start_run(run_name=f"{run_name}_r{rung}_c{candidate_id}", nested=True):
+                    mlflow.log_params({**params, "n_estimators": rounds, "continued_from_rounds": done})
+                    mlflow.log_metrics({**trial_metrics, "best_iteration": best_iteration})
+                    mlflow.set_tags({"rung": rung, "candidate_id": candidate_id, "search_trial": "true"})
+
+            scores.sort(key=lambda s: s[0])
+            if len(scores) <= 1 or rounds >= max_rounds:
+                break
+            n_keep = max(1, len(scores) // eta)
+            survivors = [(candidate_id, params) for _, candidate_id, params in scores[:n_keep]]
+            # 残らなかった候補のモデルは捨てる
+            models = {candidate_id: models[candidate_id] for candidate_id, _ in survivors}
+            rounds = min(rounds * eta, max_rounds)
+            rung += 1
+
+        best_logloss, best_id, best_params = scores[0]
+        final_params = {**best_params, "n_estimators": max(1, best_iterations[best_id])}
+        print(f"Best candidate {best_id}: val_logloss={best_logloss:.4f}, params={final_params}")
+
+        # 学習データ全体で再学習し、run_experimentと同じテストデータで評価
+        model = get_model(model_name, final_params)
+        model = train_model(model, X_train, y_train, dataset_id=get_split_id(lineage, random_state))
+        metrics = evaluate_model_train_test(model, X_train, X_test, y_train, y_test)
+        dataset_info, dataset_params = build_dataset_params(data_info, X_train, X_test, y_train, y_test, random_state)
+        best_run_id = log_experiment_to_mlflow(
+            model, None, dataset_params, metrics, final_params, dataset_info, X_train,
+            experiment_name, model_name, parent_run_id=parent_run.info.run_id,
+            usage_tables=usage_tables, lineage=lineage,
+            drift_sketch=build_reference_sketch(X_train, y_train),
+        )
+
+        # 全候補を max_rounds まで学習した場合と比べた計算量
+        compute_fraction = total_rounds / (len(candidates) * max_rounds)
+        mlflow.log_metrics({
+            "best_val_logloss": best_logloss,
+            "total_boosting_rounds": total_rounds,
+            "compute_fraction_vs_grid": compute_fraction,
+        })
+        mlflow.set_tag("best_child_run_id", best_run_id)
+        print(f"Search used {compute_fraction:.1%} of the boosting rounds of a full grid")
+
+    return {"params": final_params, "metrics": metrics, "run_id": best_run_id, "compute_fraction": compute_fraction}
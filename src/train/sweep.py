@@ -0,0 +1,188 @@
+import os
+import tempfile
+import mlflow
+import numpy as np
+from mlflow.tracking import MlflowClient # type: ignore
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from multiprocessing import get_context
+from pathlib import Path
+from threadpoolctl import threadpool_limits
+from src.train.experiment import load_dataset, load_usage_tables, split_dataset, build_dataset_params, get_split_id
+from src.train.trainer import get_model, train_model
+from src.train.evaluator import evaluate_model_train_test
+from src.train.mlflow_logger import log_experiment_to_mlflow, lineage_to_dataset, USAGE_TABLES_FILE, LINEAGE_ARTIFACT_FILE
+from src.utils.lineage import build_lineage
+from src.utils.drift import build_reference_sketch
+from src.utils.usage_tables import UsageTables
+
+
+# スレッド数を指定できるモデルとそのパラメータ名
+THREAD_PARAMS = {
+    "random_forest": "n_jobs",
+    "lgbm": "n_jobs",
+    "xgboost": "n_jobs",
+}
+
+
+def get_thread_budget(n_jobs: int) -> int:
+    """ワーカー1つあたりに割り当てるスレッド数（CPU数をワーカー数で等分）"""
+    return max(1, (os.cpu_count() or 1) // n_jobs)
+
+
+def apply_thread_budget(model_name: str, params: dict, n_threads: int) -> dict:
+    """
+    マルチスレッド対応モデルのスレッド数をn_threadsに設定する。
+    paramsで明示的に指定されている場合はそちらを優先する。
+    """
+    params = dict(params)
+    thread_param = THREAD_PARAMS.get(model_name.lower())
+    if thread_param:
+        params.setdefault(thread_param, n_threads)
+    return params
+
+
+def save_split(split_dir: Path, X_train, X_test, y_train, y_test) -> None:
+    """学習・テストデータを.npyとして保存し、ワーカーからメモリマップで共有できるようにする"""
+    np.save(split_dir / "X_train.npy", np.ascontiguousarray(X_train.to_numpy(dtype="float64")))
+    np.save(split_dir / "X_test.npy", np.ascontiguousarray(X_test.to_numpy(dtype="float64")))
+    np.save(split_dir / "y_train.npy", y_train.to_numpy())
+    np.save(split_dir / "y_test.npy", y_test.to_numpy())
+
+
+def load_split(split_dir: Path, feature_names: list[str]):
+    """save_splitで保存したデータをメモリマップで読み込む（コピーしない）"""
+    def frame(name):
+        return pd.DataFrame(np.load(split_dir / f"{name}.npy", mmap_mode="r"), columns=feature_names, copy=False)
+
+    def series(name):
+        return pd.Series(np.load(split_dir / f"{name}.npy", mmap_mode="r"), name="is_member")
+
+    return frame("X_train"), frame("X_test"), series("y_train"), series("y_test")
+
+
+def run_candidate(
+    split_dir: str,
+    feature_names: list[str],
+    dataset_info: dict,
+    dataset_params: dict,
+    model_name: str,
+    params: dict,
+    experiment_name: str,
+    parent_run_id: str,
+    n_threads: int,
+    lineage: dict | None = None,
+    drift_sketch: dict | None = None,
+) -> dict:
+    """
+    スイープの1候補を学習・評価し、親Runの子Runとして記録する（ワーカープロセスで実行）。
+    記録の送信はワーカーのバックグラウンドで行い、ワーカーの終了時に完了する（src.train.mlflow_logger）。
+    """
+    X_train, X_test, y_train, y_test = load_split(Path(split_dir), feature_names)
+    usage_tables = UsageTables.load(Path(split_dir) / USAGE_TABLES_FILE)
+    params = apply_thread_budget(model_name, params, n_threads)
+
+    # BLAS/OpenMPのスレッド数もワーカーごとの割り当てに合わせる
+    with threadpool_limits(limits=n_threads):
+        model = get_model(model_name, params)
+        dataset_id = get_split_id(lineage, dataset_params["random_state"]) if lineage is not None else None
+        model = train_model(model, X_train, y_train, dataset_id=dataset_id)
+        metrics = evaluate_model_train_test(model, X_train, X_test, y_train, y_test)
+
+    run_id = log_experiment_to_mlflow(
+        model, None, dataset_params, metrics, params, dataset_info, X_train,
+        experiment_name, model_name, parent_run_id=parent_run_id, usage_tables=usage_tables, lineage=lineage,
+        drift_sketch=drift_sketch,
+    )
+    return {"model_name": model_name, "params": params, "metrics": metrics, "run_id": run_id}
+
+
+def run_sweep(
+    data_info,
+    candidates: list[tuple[str, dict]],
+    experiment_name: str,
+    n_jobs: int = 2,
+    random_state: int = 42,
+    max_duration_min: int = 360,
+) -> list[dict]:
+    """
+    複数の(モデル名, パラメータ)を並列に学習・評価する。
+    データの読み込み・前処理・分割は1回だけ行い、分割結果はメモリマップで各ワーカーと共有する。
+    各候補は親Run（sweep_...）の子Runとして記録され、test_f1_scoreの降順で結果を返す。
+    学習や記録に失敗した候補は結果に含めない。
+
+    実行例）
+    results = run_sweep(
+        data_info=[2014, 1],
+        candidates=[
+            ("logistic_regression", {"max_iter": 500}),
+            ("random_forest", {"n_estimators": 200}),
+            ("lgbm", {"n_estimators": 300}),
+        ],
+        experiment_name="citibike_membership",
+        n_jobs=3,
+    )
+    """
+    usage_tables = load_usage_tables(data_info, max_duration_min)
+    df = load_dataset(data_info, max_duration_min=max_duration_min, usage_tables=usage_tables)
+    X_train, X_test, y_train, y_test = split_dataset(df, random_state)
+    dataset_info, dataset_params = build_dataset_params(data_info, X_train, X_test, y_train, y_test, random_state)
+    feature_names = X_train.columns.tolist()
+    drift_sketch = build_reference_sketch(X_train, y_train)
+
+    n_jobs = max(1, min(n_jobs, len(candidates)))
+    n_threads = get_thread_budget(n_jobs)
+    print(f"Sweep: {len(candidates)} candidates, {n_jobs} workers x {n_threads} threads")
+
+    mlflow.set_experiment(experiment_name)
+    results = []
+    with tempfile.TemporaryDirectory() as split_dir, \
+            mlflow.start_run(run_name=f"sweep_{datetime.now().strftime('%Y%m%d_%H%M%S')}") as parent_run:
+        save_split(Path(split_dir), X_train, X_test, y_train, y_test)
+        usage_tables.save(Path(split_dir) / USAGE_TABLES_FILE)
+        del X_train, X_test, y_train, y_test
+
+        mlflow.log_params({"n_candidates": len(candidates), "n_jobs": n_jobs, "threads_per_job": n_threads, "max_duration_min": max_duration_min})
+        mlflow.set_tags({"sweep": "true", "data_source": data_info})
+        lineage = build_lineage(data_info, df, max_duration_min)
+        mlflow.log_input(lineage_to_dataset(lineage), context="training")
+        mlflow.log_dict(lineage, LINEAGE_ARTIFACT_FILE)
+        del df
+
+        # fork後のMLflowやOpenMPの状態を引き継がないようspawnで起動する
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=get_context("spawn")) as executor:
+            futures = {
+                executor.submit(
+                    run_candidate, split_dir, feature_names, dataset_info, dataset_params,
+                    model_name, params, experiment_name, parent_run.info.run_id, n_threads, lineage, drift_sketch,
+                ): model_name
+                for model_name, params in candidates
+            }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Candidate {futures[future]} failed: {e}")
+                    continue
+                print(f"{result['model_name']}: test_f1_score={result['metrics']['test_f1_score']:.4f}")
+                results.append(result)
+
+        # ワーカーの終了までに記録の送信は終わっている。送信に失敗した（FINISHEDでない）Runは結果から除く
+        client = MlflowClient()
+        logged = []
+        for result in results:
+            status = client.get_run(result["run_id"]).info.status
+            if status == "FINISHED":
+                logged.append(result)
+            else:
+                print(f"Candidate {result['model_name']} was not logged (run {result['run_id']} is {status})")
+        results = logged
+
+        results.sort(key=lambda r: r["metrics"]["test_f1_score"], reverse=True)
+        if results:
+            # 親Runに test_f1_score を記録すると get_best_run が親Runを選んでしまうため別名で記録する
+            mlflow.log_metric("best_child_test_f1_score", results[0]["metrics"]["test_f1_score"])
+            mlflow.set_tag("best_child_run_id", results[0]["run_id"])
+
+    return results
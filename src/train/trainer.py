@@ -1,10 +1,39 @@
-import lightgbm as lgb
-import xgboost as xgb
-from sklearn.linear_model import LogisticRegression
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.ensemble import RandomForestClassifier
+import importlib
 from typing import Any
 
+
+# モデル名 → (モジュール, クラス名)。
+# lightgbm / xgboost / sklearn はimportに時間がかかるため、get_modelで使うときに初めてimportする。
+MODEL_REGISTRY = {
+    "logistic_regression": ("sklearn.linear_model", "LogisticRegression"),
+    "decision_tree": ("sklearn.tree", "DecisionTreeClassifier"),
+    "random_forest": ("sklearn.ensemble", "RandomForestClassifier"),
+    "lgbm": ("lightgbm", "LGBMClassifier"),
+    "xgboost": ("xgboost", "XGBClassifier"),
+}
+
+
+def get_model_class(model_name: str) -> type:
+    """モデル名に対応する学習器のクラスを返す（このとき初めてフレームワークをimportする）"""
+    if model_name.lower() not in MODEL_REGISTRY:
+        raise ValueError(f"Unsupported model: {model_name}")
+    module_name, class_name = MODEL_REGISTRY[model_name.lower()]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def get_model_family(model) -> str | None:
+    """
+    学習器のインスタンスからMODEL_REGISTRYのモデル名を返す（該当しなければNone）。
+    クラス（継承元を含む）の定義モジュールとクラス名で判定し、フレームワークのモジュールは参照しない。
+    sys.modulesには別スレッドでimport中のモジュールも入るため、そこからクラスを引くと失敗することがある。
+    """
+    for cls in type(model).__mro__:
+        for model_name, (module_name, class_name) in MODEL_REGISTRY.items():
+            if cls.__name__ == class_name and (cls.__module__ == module_name or cls.__module__.startswith(f"{module_name}.")):
+                return model_name
+    return None
+
+
 def get_model(model_name: str, params: dict | None = None) -> Any:
     """
     モデル名に応じて学習器インスタンスを返す
@@ -23,26 +52,92 @@ def get_model(model_name: str, params: dict | None = None) -> Any:
     if params is None:
         params = {}
 
-    model_name = model_name.lower()
+    return get_model_class(model_name)(**params)
+
+
+def train_model(model, X_train, y_train, dataset_id: str | None = None):
+    """
+    モデル学習。
+    dataset_idを指定した場合、lgbm / xgboost はビン分け済みのデータセット（src.train.binned_dataset）を
+    作成・再利用して学習する。同じdataset_idには同じ学習データを渡すこと。
+    """
+    family = get_model_family(model)
+    if dataset_id is not None and family == "lgbm":
+        from src.train.binned_dataset import fit_lgbm_binned
+        return fit_lgbm_binned(model, X_train, y_train, dataset_id)
+
+    elif dataset_id is not None and family == "xgboost":
+        from src.train.binned_dataset import fit_xgboost_binned
+        return fit_xgboost_binned(model, X_train, y_train, dataset_id)
 
-    if model_name == "logistic_regression":
-        return LogisticRegression(**params)
+    model.fit(X_train, y_train)
+    return model
 
-    elif model_name == "decision_tree":
-        return DecisionTreeClassifier(**params)
 
-    elif model_name == "random_forest":
-        return RandomForestClassifier(**params)
+def continue_training(model, base_model, X_train, y_train, additional_rounds: int | None = None):
+    """
+    既存モデル（base_model）を起点に学習を継続する。
+    lgbm / xgboost は既存の木にブースティングを追加し、LogisticRegressionは係数からwarm startする。
+    additional_roundsを指定すると、lgbm / xgboost に追加する木の数として n_estimators の代わりに使う。
+    """
+    family = get_model_family(model)
+    if additional_rounds is not None and family in ("lgbm", "xgboost"):
+        model.set_params(n_estimators=additional_rounds)
+    if family == "lgbm":
+        model.fit(X_train, y_train, init_model=base_model.booster_)
 
-    elif model_name == "lgbm":
-        return lgb.LGBMClassifier(**params)
+    elif family == "xgboost":
+        model.fit(X_train, y_train, xgb_model=base_model.get_booster())
 
-    elif model_name == "xgboost":
-        return xgb.XGBClassifier(**params)
+    elif family == "logistic_regression":
+        model.set_params(warm_start=True)
+        model.coef_ = base_model.coef_.copy()
+        model.intercept_ = base_model.intercept_.copy()
+        model.fit(X_train, y_train)
 
     else:
-        raise ValueError(f"Unsupported model: {model_name}")
-def train_model(model, X_train, y_train):
-    """モデル学習"""
-    model.fit(X_train, y_train)
-    return model
\ No newline at end of file
+        raise ValueError(f"Incremental training is not supported for {type(model).__name__}")
+    return model
+
+
+def get_boosted_rounds(model) -> int:
+    """lgbm / xgboost のモデルが実際に学習したブースティング回数（アーリーストッピング後の木も含む）"""
+    if get_model_family(model) == "lgbm":
+        return model.booster_.current_iteration()
+    return model.get_booster().num_boosted_rounds()
+
+
+def train_model_with_early_stopping(model, X_train, y_train, X_val, y_val, early_stopping_rounds: int = 20, dataset_id: str | None = None, base_model=None):
+    """
+    検証データでアーリーストッピングしながら学習する（lgbm / xgboost のみ）。
+    学習後のモデルと、最良のブースティング回数（base_modelの木を含む通算）を返す。
+    dataset_idを指定した場合は、学習用・検証用ともビン分け済みのデータセットを再利用する（train_modelと同じ）。
+    base_modelを指定した場合は、その木に n_estimators 回のブースティングを追加する（ビン分け済みのデータセットは使わない）。
+    """
+    family = get_model_family(model)
+    if base_model is not None:
+        dataset_id = None
+
+    if family == "lgbm":
+        import lightgbm as lgb
+        callbacks = [lgb.early_stopping(early_stopping_rounds, verbose=False)]
+        if dataset_id is not None:
+            from src.train.binned_dataset import fit_lgbm_binned
+            model = fit_lgbm_binned(model, X_train, y_train, dataset_id, eval_set=[(X_val, y_val)], callbacks=callbacks)
+        else:
+            init_model = base_model.booster_ if base_model is not None else None
+            model.fit(X_train, y_train, eval_set=[(X_val, y_val)], callbacks=callbacks, init_model=init_model)
+        return model, model.best_iteration_
+
+    elif family == "xgboost":
+        model.set_params(early_stopping_rounds=early_stopping_rounds)
+        if dataset_id is not None:
+            from src.train.binned_dataset import fit_xgboost_binned
+            model = fit_xgboost_binned(model, X_train, y_train, dataset_id, eval_set=[(X_val, y_val)])
+        else:
+            xgb_model = base_model.get_booster() if base_model is not None else None
+            model.fit(X_train, y_train, eval_set=[(X_val, y_val)], verbose=False, xgb_model=xgb_model)
+        return model, model.best_iteration + 1
+
+    else:
+        raise ValueError(f"Early stopping is not supported for {type(model).__name__}")
\ No newline at end of file
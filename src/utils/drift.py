@@ -0,0 +1,128 @@
+from typing import Iterable
+import numpy as np
+import pandas as pd
+
+
+# 参照分布のビン数（分位点で区切る）
+SKETCH_BINS = 20
+# PSIで0件のビンを扱うための下限
+PSI_EPS = 1e-4
+# config/register_best_model.yaml の drift に指定がない場合のしきい値
+DEFAULT_DRIFT_THRESHOLDS = {
+    "enabled": True,
+    "psi_threshold": 0.2,
+    "ks_threshold": 0.1,
+    "member_rate_threshold": 0.05,
+    "f1_drop_threshold": 0.01,
+}
+
+
+def bin_counts(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """edgesで区切ったビンごとの件数（両端のビンは範囲外の値も含む）"""
+    return np.bincount(np.searchsorted(edges, values, side="right"), minlength=len(edges) + 1)
+
+
+def build_reference_sketch(X: pd.DataFrame, y: pd.Series, n_bins: int = SKETCH_BINS) -> dict:
+    """
+    学習データの特徴量ごとの分布（分位点で区切ったヒストグラム）とクラスの件数をまとめる。
+    Productionモデルと一緒に記録し、新しい月のデータと比べるときの基準にする。
+    """
+    features = {}
+    for col in X.columns:
+        values = X[col].to_numpy()
+        edges = np.unique(np.quantile(values, np.linspace(0, 1, n_bins + 1)[1:-1]))
+        features[col] = {"edges": edges.tolist(), "counts": bin_counts(values, edges).tolist()}
+
+    return {
+        "n_rows": len(X),
+        "features": features,
+        "class_counts": np.bincount(np.asarray(y, dtype="int64"), minlength=2).tolist(),
+    }
+
+
+def sketch_like(reference: dict, chunks: Iterable[tuple[pd.DataFrame, pd.Series]]) -> dict:
+    """
+    referenceと同じビンで新しいデータの分布をまとめる。
+    (特徴量, ターゲット) のチャンクを1回ずつ読むだけで、月全体を保持しなくてよい。
+    """
+    edges = {col: np.asarray(f["edges"]) for col, f in reference["features"].items()}
+    counts = {col: np.zeros(len(e) + 1, dtype="int64") for col, e in edges.items()}
+    class_counts = np.zeros(2, dtype="int64")
+    n_rows = 0
+
+    for X, y in chunks:
+        for col, col_edges in edges.items():
+            counts[col] += bin_counts(X[col].to_numpy(), col_edges)
+        class_counts += np.bincount(np.asarray(y, dtype="int64"), minlength=2)
+        n_rows += len(X)
+
+    return {
+        "n_rows": n_rows,
+        "features": {col: {"edges": edges[col].tolist(), "counts": counts[col].tolist()} for col in edges},
+        "class_counts": class_counts.tolist(),
+    }
+
+
+def iter_frame_chunks(df: pd.DataFrame, target: str = "is_member", chunksize: int = 500_000):
+    """前処理済みDataFrameを (特徴量, ターゲット) のチャンクに分ける（コピーしない）"""
+    for start in range(0, len(df), chunksize):
+        chunk = df.iloc[start:start + chunksize]
+        yield chunk.drop(columns=target), chunk[target]
+
+
+def psi(expected: np.ndarray, actual: np.ndarray) -> float:
+    """Population Stability Index"""
+    p = np.maximum(expected / max(expected.sum(), 1), PSI_EPS)
+    q = np.maximum(actual / max(actual.sum(), 1), PSI_EPS)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+
+def ks_statistic(expected: np.ndarray, actual: np.ndarray) -> float:
+    """ビンごとの累積分布から求めたKolmogorov-Smirnov統計量（近似）"""
+    p = np.cumsum(expected) / max(expected.sum(), 1)
+    q = np.cumsum(actual) / max(actual.sum(), 1)
+    return float(np.max(np.abs(p - q)))
+
+
+def compare_sketches(reference: dict, current: dict) -> dict:
+    """特徴量ごとのPSI・KSと、会員比率の差を返す"""
+    features = {}
+    for col, ref in reference["features"].items():
+        expected = np.asarray(ref["counts"], dtype="float64")
+        actual = np.asarray(current["features"][col]["counts"], dtype="float64")
+        features[col] = {"psi": psi(expected, actual), "ks": ks_statistic(expected, actual)}
+
+    ref_classes = np.asarray(reference["class_counts"], dtype="float64")
+    cur_classes = np.asarray(current["class_counts"], dtype="float64")
+    member_rate_diff = abs(cur_classes[1] / max(cur_classes.sum(), 1) - ref_classes[1] / max(ref_classes.sum(), 1))
+
+    return {
+        "max_psi": max(f["psi"] for f in features.values()),
+        "max_ks": max(f["ks"] for f in features.values()),
+        "member_rate_diff": float(member_rate_diff),
+        "features": features,
+    }
+
+
+def check_drift(report: dict, current_f1: float, reference_f1: float | None, thresholds: dict) -> list[str]:
+    """
+    再学習が必要な理由のリストを返す（空なら再学習不要）。
+    分布の変化（PSI・KS・会員比率）と、Productionモデルの新しい月でのF1の低下を見る。
+    """
+    reasons = []
+    if report["max_psi"] >= thresholds["psi_threshold"]:
+        col = max(report["features"], key=lambda c: report["features"][c]["psi"])
+        reasons.append(f"PSI {report['max_psi']:.3f} >= {thresholds['psi_threshold']} ({col})")
+    if report["max_ks"] >= thresholds["ks_threshold"]:
+        col = max(report["features"], key=lambda c: report["features"][c]["ks"])
+        reasons.append(f"KS {report['max_ks']:.3f} >= {thresholds['ks_threshold']} ({col})")
+    if report["member_rate_diff"] >= thresholds["member_rate_threshold"]:
+        reasons.append(f"member rate shift {report['member_rate_diff']:.3f} >= {thresholds['member_rate_threshold']}")
+    if reference_f1 is not None and reference_f1 - current_f1 >= thresholds["f1_drop_threshold"]:
+        reasons.append(f"F1 drop {reference_f1 - current_f1:.4f} >= {thresholds['f1_drop_threshold']}")
+    return reasons
+
+
+def get_drift_thresholds(config: dict) -> dict:
+    """設定ファイルの drift セクションを既定値とまとめる"""
+    return {**DEFAULT_DRIFT_THRESHOLDS, **(config.get("drift") or {})}
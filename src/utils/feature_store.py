@@ -0,0 +1,146 @@
+from pathlib import Path
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import src.utils.io as io_module
+import src.utils.preprocess as preprocess_module
+import src.utils.usage_tables as usage_tables_module
+from src.utils.io import load_month_data, get_project_root, DATA_DIR
+from src.utils.preprocess import preprocess_pipeline, build_usage_tables, REQUIRED_COLUMNS, FEATURES
+from src.utils.usage_tables import UsageTables
+from src.utils.profiling import profiled
+
+
+PROCESSED_DIR = "processed"
+FEATURE_STORE_DIR = "feature_store"
+TARGET = "is_member"
+USAGE_TABLES_FILE = "usage_tables.npz"
+
+
+def get_preprocess_hash() -> str:
+    """
+    前処理コード（src/utils/preprocess.py、読み込み処理の src/utils/io.py、
+    集約特徴量の回数を引く src/utils/usage_tables.py）のハッシュを返す。
+    コードが変わるとキーが変わり、古い特徴量は使われなくなる。
+    """
+    digest = hashlib.sha1()
+    for module in (preprocess_module, io_module, usage_tables_module):
+        digest.update(Path(module.__file__).read_bytes())  # type: ignore
+    return digest.hexdigest()[:12]
+
+
+def get_store_dir() -> Path:
+    """特徴量ストアのルートディレクトリを返す"""
+    return get_project_root() / DATA_DIR / PROCESSED_DIR / FEATURE_STORE_DIR
+
+
+def get_entry_prefix(year: int, month: int, max_duration_min: int) -> str:
+    return f"{year}_{month:02d}_d{max_duration_min}"
+
+
+def get_entry_dir(year: int, month: int, max_duration_min: int = 360) -> Path:
+    """
+    (年, 月, 前処理コードのハッシュ, max_duration_min) に対応するエントリのパスを返す。
+    """
+    prefix = get_entry_prefix(year, month, max_duration_min)
+    return get_store_dir() / f"{prefix}_{get_preprocess_hash()}"
+
+
+def save_features(
+    df: pd.DataFrame,
+    year: int,
+    month: int,
+    max_duration_min: int = 360,
+    usage_tables: UsageTables | None = None,
+) -> Path:
+    """
+    前処理済みDataFrameを特徴量行列（X.npy）とターゲット（y.npy）として保存する。
+    usage_tablesを渡した場合は集約特徴量の回数テーブルも保存する。
+    同じ年月・条件で前処理コードが古いエントリは削除する。
+    """
+    entry_dir = get_entry_dir(year, month, max_duration_min)
+    tmp_dir = entry_dir.with_name(f"{entry_dir.name}.{os.getpid()}.tmp")
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    np.save(tmp_dir / "X.npy", np.ascontiguousarray(df[FEATURES].to_numpy(dtype="float64")))
+    np.save(tmp_dir / "y.npy", df[TARGET].to_numpy(dtype="int64"))
+    if usage_tables is not None:
+        usage_tables.save(tmp_dir / USAGE_TABLES_FILE)
+    with open(tmp_dir / "meta.json", "w") as f:
+        json.dump({
+            "year": year,
+            "month": month,
+            "max_duration_min": max_duration_min,
+            "preprocess_hash": get_preprocess_hash(),
+            "feature_names": FEATURES,
+            "n_rows": len(df),
+        }, f, indent=2)
+
+    if entry_dir.exists():
+        shutil.rmtree(tmp_dir)
+    else:
+        os.replace(tmp_dir, entry_dir)
+
+    # 古い前処理コードで作られたエントリを削除
+    prefix = get_entry_prefix(year, month, max_duration_min)
+    for stale in entry_dir.parent.glob(f"{prefix}_*"):
+        if stale != entry_dir and not stale.name.endswith(".tmp"):
+            print(f"Removing stale features: {stale.name}")
+            shutil.rmtree(stale, ignore_errors=True)
+
+    return entry_dir
+
+
+def load_features(year: int, month: int, max_duration_min: int = 360) -> pd.DataFrame | None:
+    """
+    特徴量ストアから前処理済みDataFrameを読み込む。エントリがなければNoneを返す。
+    特徴量行列はメモリマップで開くため、読み込み自体はほぼコピーなしで済む。
+    """
+    entry_dir = get_entry_dir(year, month, max_duration_min)
+    if not entry_dir.exists():
+        return None
+
+    X = np.load(entry_dir / "X.npy", mmap_mode="r")
+    y = np.load(entry_dir / "y.npy")
+    df = pd.DataFrame(X, columns=FEATURES, copy=False)
+    df[TARGET] = y
+    print(f"Loaded features from store: {entry_dir.name}")
+    return df
+
+
+@profiled("get_features", rows=len)
+def get_features(year: int, month: int, max_duration_min: int = 360, use_store: bool = True) -> pd.DataFrame:
+    """
+    特定の年・月の前処理済みデータを返す。
+    特徴量ストアにあればそれを使い、なければ前処理を実行して保存する。
+
+    実行例）
+    df = get_features(2014, 1)
+    """
+    if use_store:
+        df = load_features(year, month, max_duration_min)
+        if df is not None:
+            return df
+
+    df_org = load_month_data(year, month, columns=REQUIRED_COLUMNS)
+    usage_tables = build_usage_tables(df_org, max_duration_min)
+    df = preprocess_pipeline(df_org, max_duration_min, usage_tables)
+
+    if use_store:
+        entry_dir = save_features(df, year, month, max_duration_min, usage_tables)
+        print(f"Saved features to store: {entry_dir.name}")
+    return df
+
+
+def get_usage_tables(year: int, month: int, max_duration_min: int = 360) -> UsageTables:
+    """
+    特定の年・月の駅・自転車の利用回数テーブルを返す。
+    特徴量ストアに保存されていなければ、get_featuresで特徴量と一緒に作成する。
+    """
+    path = get_entry_dir(year, month, max_duration_min) / USAGE_TABLES_FILE
+    if not path.exists():
+        get_features(year, month, max_duration_min)
+    return UsageTables.load(path)
@@ -1,19 +1,91 @@
+from datetime import datetime
 from pathlib import Path
+from typing import Iterator
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import threading
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
 import re
 import yaml
+from src.utils.profiling import profiled
 
 
 DATA_DIR = "data"
 RAW_DIR = "raw"
 INTERIM_DIR = "interim"
+CACHE_DIR = "raw_cache"
+# data/ の場所を明示する環境変数（ベンチマークやCIで一時ディレクトリの合成データを使う場合）
+PROJECT_ROOT_ENV = "CITIBIKE_PROJECT_ROOT"
+
+# 生CSVの列ごとのコンパクトな型（存在しない列は無視される）
+RAW_DTYPES = {
+    "tripduration": "int32",
+    "start station id": "int32",
+    "start station name": "category",
+    "end station id": "int32",
+    "end station name": "category",
+    "bikeid": "int32",
+    "usertype": "category",
+    "gender": "int8",
+}
+# pyarrowで読み込む場合の対応する型
+ARROW_TYPES = {
+    "int32": pa.int32(),
+    "int8": pa.int8(),
+    "category": pa.dictionary(pa.int32(), pa.string()),
+}
+RAW_DATETIME_COLUMNS = ["starttime", "stoptime"]
+# 欠損値として扱う文字列（2014年のデータでは birth year の欠損が "\\N"）
+NULL_VALUES = ["", "NULL", "NaN", "nan", "\\N"]
+# 年によって異なる列名の表記を2014年の表記にそろえる（小文字化・空白の正規化後の名前で引く）
+COLUMN_ALIASES = {
+    "trip duration": "tripduration",
+    "start time": "starttime",
+    "stop time": "stoptime",
+    "bike id": "bikeid",
+    "user type": "usertype",
+}
+# 年によって日時の書式が異なる（2014年9月以降は "9/1/2014 00:00:25" 形式）
+DATETIME_FORMATS = [
+    "%Y-%m-%d %H:%M:%S",
+    "%m/%d/%Y %H:%M:%S",
+    "%m/%d/%Y %H:%M",
+]
+
+
+def parse_datetime(s: pd.Series) -> pd.Series:
+    """
+    日時文字列の列をdatetimeに変換する。
+    先頭の値から書式を判定して明示的に指定し、行ごとの書式推定を避ける。
+    """
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
+    
+    head = s.iloc[:1000].dropna()
+    if head.empty:
+        return pd.to_datetime(s)
+
+    for fmt in DATETIME_FORMATS:
+        try:
+            datetime.strptime(str(head.iloc[0]), fmt)
+        except ValueError:
+            continue
+        return pd.to_datetime(s, format=fmt)
+    return pd.to_datetime(s)
 
 
 def get_project_root() -> Path:
     """
     プロジェクトのルートディレクトリ（data/ や src/ がある階層）を返す。
     Docker内では /app を返す想定。
+    環境変数 CITIBIKE_PROJECT_ROOT が設定されていればそのディレクトリを返す。
     """
+    if os.environ.get(PROJECT_ROOT_ENV):
+        return Path(os.environ[PROJECT_ROOT_ENV])
     cwd = Path.cwd()
     for parent in cwd.parents:
         if (parent / "data").exists() and (parent / "src").exists():
@@ -32,40 +104,240 @@ def get_year_dir(year: int) -> Path:
     return data_dir
 
 
-def find_month_dir(year_dir: Path, month: int) -> Path:
+def find_month_dirs(year_dir: Path, month: int) -> list[Path]:
     """
     年ディレクトリ内から、指定した月に対応するフォルダを正規表現で検索する。
     例: month=1 → フォルダ名が '1_' で始まるもの（例: '1_January'）
     """
     pattern = re.compile(rf"^{month}_", re.IGNORECASE)
-    matches = [p for p in year_dir.iterdir() if p.is_dir() and pattern.match(p.name)]
+    matches = sorted(p for p in year_dir.iterdir() if p.is_dir() and pattern.match(p.name))
     
     if not matches:
         raise FileNotFoundError(f"No folder found for month={month} in {year_dir}")
-    if len(matches) > 1:
-        print(f"複数フォルダが該当しました。最初の1つを使用します: {matches[0].name}")
         
-    return matches[0]
+    return matches
 
 
-def load_month_data(year: int, month: int) -> pd.DataFrame:
+def find_month_csvs(year: int, month: int) -> list[Path]:
     """
-    特定の年・月のCSVを読み込む。
-    例: load_month_data(2014, 1)
+    特定の年・月の生CSVのパスを返す。
+    月のデータが複数ファイル（パート）に分かれている場合は、すべてのファイルをファイル名順に返す。
     """
     year_dir = get_year_dir(year)
-    month_dir = find_month_dir(year_dir, month)
+    month_dirs = find_month_dirs(year_dir, month)
     
-    csv_files = list(month_dir.glob("*.csv"))
+    csv_files = sorted(path for month_dir in month_dirs for path in month_dir.glob("*.csv"))
     if not csv_files:
-        raise FileNotFoundError(f"No CSV found in {month_dir}")
-    
-    if len(csv_files) > 1:
-        print(f"複数CSVが見つかりました。最初の1件を読み込みます: {csv_files[0].name}")
+        raise FileNotFoundError(f"No CSV found in {month_dirs}")
         
-    csv_path = csv_files[0]
-    print(f"Loading: {csv_files}")
-    return pd.read_csv(csv_path)
+    return csv_files
+
+
+def normalize_column_name(name: str) -> str:
+    """
+    列名をこのプロジェクトの表記（2014年の小文字・スペース区切り）に揃える。
+    例: "Start Station Name" → "start station name"、"Bike ID" → "bikeid"
+    """
+    name = " ".join(name.strip().lower().replace("_", " ").split())
+    return COLUMN_ALIASES.get(name, name)
+
+
+def read_csv_header(csv_path: Path) -> list[str]:
+    """CSVのヘッダーを読み、正規化した列名を返す"""
+    return [normalize_column_name(col) for col in pd.read_csv(csv_path, nrows=0).columns]
+
+
+def get_cache_path(csv_path: Path) -> Path:
+    """
+    生CSVに対応するParquetキャッシュのパスを返す。
+    キーはCSVの絶対パス・サイズ・更新時刻で、CSVが更新されれば別ファイルになる。
+    """
+    stat = csv_path.stat()
+    key = f"{csv_path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    cache_dir = get_project_root() / DATA_DIR / INTERIM_DIR / CACHE_DIR
+    return cache_dir / f"{csv_path.stem}_{digest}.parquet"
+
+
+@profiled("parse_csv", rows=lambda table: table.num_rows)
+def read_raw_csv_arrow(csv_path: Path) -> pa.Table:
+    """
+    生CSVをpyarrowのマルチスレッドCSVリーダーで読み込む。
+    列名は正規化し、駅名・usertypeは辞書型、IDはint32、開始・終了時刻はtimestampに変換する。
+    """
+    header = read_csv_header(csv_path)
+    column_types = {col: ARROW_TYPES[t] for col, t in RAW_DTYPES.items() if col in header}
+    column_types.update({col: pa.timestamp("ns") for col in RAW_DATETIME_COLUMNS if col in header})
+    return pa_csv.read_csv(
+        csv_path,
+        read_options=pa_csv.ReadOptions(column_names=header, skip_rows=1, use_threads=True),
+        convert_options=pa_csv.ConvertOptions(
+            column_types=column_types,
+            timestamp_parsers=DATETIME_FORMATS,
+            null_values=NULL_VALUES,
+            strings_can_be_null=True,
+        ),
+    )
+
+
+def read_raw_csv(csv_path: Path) -> pd.DataFrame:
+    """
+    生CSVを型指定付きで読み込む。
+    駅名・usertypeはcategory、IDはint32、開始・終了時刻はdatetimeに変換する。
+    """
+    return read_raw_csv_arrow(csv_path).to_pandas()
+
+
+def write_cache(table: pa.Table, cache_path: Path) -> None:
+    """
+    Arrowテーブルを Parquetキャッシュとして保存する。
+    書き込み途中のファイルを読まないよう、一時ファイル経由で置き換える。
+    """
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, cache_path)
+
+
+def read_cache(cache_path: Path, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Parquetキャッシュをメモリマップで読み込む。columnsを指定した場合はその列のみ読む。
+    """
+    return read_cache_arrow(cache_path, columns).to_pandas()
+
+
+def read_cache_arrow(cache_path: Path, columns: list[str] | None = None) -> pa.Table:
+    """Parquetキャッシュをメモリマップで読み込み、Arrowテーブルのまま返す"""
+    return pq.read_table(cache_path, columns=columns, memory_map=True)
+
+
+def read_part(csv_path: Path, columns: list[str] | None = None, use_cache: bool = True) -> pa.Table:
+    """
+    CSV1ファイル分をArrowテーブルとして読み込む。
+    初回はCSVを読み込んでParquetキャッシュを作成し、2回目以降はキャッシュから必要な列のみを読み込む。
+    """
+    if not use_cache:
+        print(f"Loading: {csv_path}")
+        table = read_raw_csv_arrow(csv_path)
+        return table.select(columns) if columns is not None else table
+
+    cache_path = get_cache_path(csv_path)
+    if not cache_path.exists():
+        print(f"Loading: {csv_path}")
+        table = read_raw_csv_arrow(csv_path)
+        write_cache(table, cache_path)
+        return table.select(columns) if columns is not None else table
+
+    print(f"Loading from cache: {cache_path.name}")
+    return read_cache_arrow(cache_path, columns)
+
+
+@profiled("load_data", rows=lambda table: table.num_rows)
+def load_months_arrow(
+    months: list[tuple[int, int]],
+    columns: list[str] | None = None,
+    use_cache: bool = True,
+    max_workers: int | None = None,
+) -> pa.Table:
+    """
+    複数の(年, 月)の全パートファイルをスレッドプールで並列に読み込み、1つのArrowテーブルにまとめる。
+    テーブルの結合はコピーせず、各ファイルのデータをチャンクとして並べるだけで行う。
+    ファイルによって型が異なる列（例: 辞書型とstring）は共通の型にそろえる。
+    """
+    paths = [path for year, month in months for path in find_month_csvs(year, month)]
+    max_workers = max_workers or min(len(paths), os.cpu_count() or 1)
+
+    if max_workers > 1 and len(paths) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            tables = list(executor.map(lambda path: read_part(path, columns, use_cache), paths))
+    else:
+        tables = [read_part(path, columns, use_cache) for path in paths]
+
+    if len(tables) == 1:
+        return tables[0]
+    if columns is None:
+        # 全列を読む場合は、列の並びをそろえ、ファイルによってない列はnullで埋める
+        names = list(dict.fromkeys(name for table in tables for name in table.column_names))
+        tables = [
+            table.select([name for name in names if name in table.column_names]) for table in tables
+        ]
+    return pa.concat_tables(tables, promote_options="permissive")
+
+
+def load_months(
+    months: list[tuple[int, int]],
+    columns: list[str] | None = None,
+    use_cache: bool = True,
+    max_workers: int | None = None,
+) -> pd.DataFrame:
+    """
+    複数の(年, 月)のデータを1つのDataFrameとして読み込む。
+    例: 2014年第1四半期 → load_months([(2014, 1), (2014, 2), (2014, 3)])
+    """
+    return load_months_arrow(months, columns, use_cache, max_workers).to_pandas()
+
+
+def load_month_data(
+    year: int,
+    month: int,
+    columns: list[str] | None = None,
+    use_cache: bool = True,
+) -> pd.DataFrame:
+    """
+    特定の年・月のCSVを読み込む。
+    月のデータが複数ファイルに分かれている場合はすべて読み込んで結合する。
+    初回はCSVを型指定付きで読み込みParquetキャッシュを作成し、
+    2回目以降はキャッシュから必要な列のみを読み込む。
+    例: load_month_data(2014, 1)
+
+    Parameters
+    ----------
+    year : int
+        対象年
+    month : int
+        対象月
+    columns : list[str] | None, optional
+        読み込む列。Noneの場合は全列。
+    use_cache : bool, optional
+        Parquetキャッシュを使用するかどうか。
+    """
+    return load_months([(year, month)], columns, use_cache)
+
+
+def iter_month_chunks(
+    year: int,
+    month: int,
+    columns: list[str] | None = None,
+    chunksize: int = 500_000,
+) -> Iterator[pd.DataFrame]:
+    """
+    特定の年・月のデータをchunksize行ずつ読み込むジェネレータ。
+    パートファイルごとに、Parquetキャッシュがあればバッチ単位で読み、なければCSVを分割して読む。
+    月全体をメモリに載せないため、ピークメモリはchunksizeで抑えられる。
+    """
+    for csv_path in find_month_csvs(year, month):
+        cache_path = get_cache_path(csv_path)
+
+        if cache_path.exists():
+            print(f"Streaming from cache: {cache_path.name}")
+            parquet_file = pq.ParquetFile(cache_path, memory_map=True)
+            for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+                yield batch.to_pandas()
+            continue
+
+        print(f"Streaming: {csv_path}")
+        header = read_csv_header(csv_path)
+        dtype = {col: t for col, t in RAW_DTYPES.items() if col in header}
+        reader = pd.read_csv(
+            csv_path, header=0, names=header, dtype=dtype, usecols=columns,  # type: ignore
+            na_values=NULL_VALUES, chunksize=chunksize,
+        )
+        with reader:
+            for chunk in reader:
+                for col in RAW_DATETIME_COLUMNS:
+                    if col in chunk.columns:
+                        chunk[col] = parse_datetime(chunk[col])
+                yield chunk
 
 
 def load_config(config_path: str = "config/register_best_model.yaml") -> dict:
@@ -0,0 +1,86 @@
+from pathlib import Path
+import hashlib
+import json
+import os
+import pandas as pd
+from src.utils.io import find_month_csvs, get_cache_path
+from src.utils.feature_store import get_preprocess_hash
+
+
+LINEAGE_SUFFIX = ".lineage.json"
+DIGEST_CHUNK_BYTES = 8 * 1024 * 1024
+
+
+def compute_file_digest(path: Path, chunk_size: int = DIGEST_CHUNK_BYTES) -> tuple[str, int]:
+    """
+    ファイルを一定サイズずつ読みながらSHA-256と行数（改行数）を計算する。
+    ファイル全体をメモリに載せない。
+    """
+    digest = hashlib.sha256()
+    n_lines = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+            n_lines += chunk.count(b"\n")
+    return digest.hexdigest(), n_lines
+
+
+def get_source_lineage(csv_path: Path) -> dict:
+    """
+    生CSV1ファイル分のリネージ（パス・サイズ・更新時刻・内容のハッシュ・行数・列名）を返す。
+    結果はParquetキャッシュの隣にJSONで保存し、CSVが変わらない限り再計算しない。
+    """
+    lineage_path = get_cache_path(csv_path).with_suffix(LINEAGE_SUFFIX)
+    if lineage_path.exists():
+        with open(lineage_path) as f:
+            return json.load(f)
+
+    print(f"Computing digest: {csv_path}")
+    stat = csv_path.stat()
+    sha256, n_lines = compute_file_digest(csv_path)
+    lineage = {
+        "path": str(csv_path.resolve()),
+        "size_bytes": stat.st_size,
+        "mtime": stat.st_mtime,
+        "sha256": sha256,
+        "n_rows": max(n_lines - 1, 0),  # ヘッダー行を除く
+        "columns": pd.read_csv(csv_path, nrows=0).columns.tolist(),
+    }
+
+    lineage_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = lineage_path.with_suffix(f".{os.getpid()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(lineage, f, indent=2)
+    os.replace(tmp_path, lineage_path)
+    return lineage
+
+
+def build_lineage(data_info, df: pd.DataFrame | None = None, max_duration_min: int = 360) -> dict:
+    """
+    学習データのリネージを作成する。
+    data_infoは[年, 月]、または複数月の場合は[[年, 月], ...]で指定する。
+
+    元CSV（パートファイルを含む）ごとのリネージに、前処理コードのハッシュと、前処理済みデータの行数・スキーマを加える。
+    digestは元CSVの内容・前処理コード・外れ値除外の条件（max_duration_min）から決まり、同じデータセットなら同じ値になる。
+    dfの中身は読まず、行数と列の型だけを使う。
+    """
+    months = [tuple(m) for m in data_info] if isinstance(data_info[0], (list, tuple)) else [tuple(data_info)]
+    sources = [get_source_lineage(path) for year, month in months for path in find_month_csvs(year, month)]
+    preprocess_hash = get_preprocess_hash()
+
+    digest = hashlib.sha256(preprocess_hash.encode())
+    digest.update(f"max_duration_min={max_duration_min}".encode())
+    for source in sources:
+        digest.update(source["sha256"].encode())
+
+    lineage = {
+        "data_info": data_info,
+        "digest": digest.hexdigest()[:16],
+        "preprocess_hash": preprocess_hash,
+        "max_duration_min": max_duration_min,
+        "sources": sources,
+    }
+    if df is not None:
+        lineage["n_rows"] = len(df)
+        lineage["schema"] = {col: str(dtype) for col, dtype in df.dtypes.items()}
+    return lineage
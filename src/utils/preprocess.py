@@ -1,5 +1,10 @@
+import numpy as np
 import pandas as pd
 from enum import Enum, auto
+from typing import Iterator
+from src.utils.io import iter_month_chunks, parse_datetime
+from src.utils.profiling import profiled
+from src.utils.usage_tables import UsageTables
 
 class TimeOfDay(Enum):
     MORNING = auto()
@@ -7,6 +12,34 @@ class TimeOfDay(Enum):
     NIGHT = auto()
 
 
+# preprocess_pipelineが参照する生データの列
+REQUIRED_COLUMNS = [
+    "tripduration",
+    "starttime",
+    "stoptime",
+    "start station name",
+    "bikeid",
+    "usertype",
+    "gender",
+]
+
+# モデル学習に使う特徴量
+FEATURES = [
+    "start_hour",
+    "weekday",
+    "time_category",
+    "tripduration_min",
+    "station_usage_count",
+    "bike_usage_count",
+    "gender",
+]
+
+
+def duration_mask(df_org: pd.DataFrame, max_duration_min: int = 360) -> np.ndarray:
+    """利用時間がmax_duration_min分未満の行をTrueとするマスク（外れ値除外の条件）"""
+    return df_org["tripduration"].to_numpy() / 60 < max_duration_min
+
+
 def load_and_clean_data(df_org: pd.DataFrame, max_duration_min: int = 360) -> pd.DataFrame:
     """
     CSVを読み込み、日付変換と基本クリーニングを行う。
@@ -23,45 +56,77 @@ def load_and_clean_data(df_org: pd.DataFrame, max_duration_min: int = 360) -> pd
     pd.DataFrame
         前処理済みデータ
     """
-    df = df_org.copy()
+    # 利用時間（分）で外れ値を除外してから行を取り出す（全体のcopyは作らない）
+    keep = np.flatnonzero(duration_mask(df_org, max_duration_min))
+    df = df_org.take(keep)
 
     # 型変換
-    df["starttime"] = pd.to_datetime(df["starttime"])
-    df["stoptime"] = pd.to_datetime(df["stoptime"])
-
-    # 利用時間（分）
-    df["tripduration_min"] = df["tripduration"] / 60
-    df = df[df["tripduration_min"] < max_duration_min]
+    df["starttime"] = parse_datetime(df["starttime"])
+    df["stoptime"] = parse_datetime(df["stoptime"])
+    df["tripduration_min"] = df["tripduration"].to_numpy() / 60
 
     return df
 
 
+def categorize_time(hour: int) -> int:
+    """時刻（0〜23時）を時間帯（TimeOfDay）に分類する"""
+    if 6 <= hour < 12:
+        return TimeOfDay.MORNING.value
+    elif 12 <= hour < 18:
+        return TimeOfDay.AFTERNOON.value
+    else:
+        return TimeOfDay.NIGHT.value
+
+
+# 時刻 → 時間帯のルックアップテーブル（start_hourでインデックスする）
+TIME_CATEGORY_BY_HOUR = np.array([categorize_time(h) for h in range(24)], dtype="int64")
+
+
 def add_time_features(df: pd.DataFrame) -> pd.DataFrame:
     """時間に関する特徴量を追加"""
     df["start_hour"] = df["starttime"].dt.hour
     df["weekday"] = df["starttime"].dt.weekday
+    # 開始時刻が欠損（NaT）の行は、categorize_timeと同じくNIGHTにする
+    hours = df["start_hour"].to_numpy(dtype="float64", na_value=np.nan)
+    missing = np.isnan(hours)
+    df["time_category"] = np.where(
+        missing, TimeOfDay.NIGHT.value, TIME_CATEGORY_BY_HOUR[np.where(missing, 0, hours).astype("int64")]
+    )
+    return df
 
-    def categorize_time(hour: int) -> int:
-        if 6 <= hour < 12:
-            return TimeOfDay.MORNING.value
-        elif 12 <= hour < 18:
-            return TimeOfDay.AFTERNOON.value
-        else:
-            return TimeOfDay.NIGHT.value
 
-    df["time_category"] = df["start_hour"].apply(categorize_time)
-    return df
+def compute_usage_counts(df: pd.DataFrame) -> tuple[pd.Series, pd.Series]:
+    """駅ごと・自転車ごとの利用回数を集計する"""
+    station_counts = df.groupby("start station name", observed=True).size()
+    bike_counts = df.groupby("bikeid", observed=True).size()
+    return station_counts, bike_counts
 
 
-def add_aggregate_features(df: pd.DataFrame) -> pd.DataFrame:
-    """駅や自転車単位の集約特徴量を追加"""
+def build_usage_tables(df_org: pd.DataFrame, max_duration_min: int = 360) -> UsageTables:
+    """
+    生データから駅・自転車の利用回数テーブルを作成する。
+    load_and_clean_dataと同じ条件で外れ値を除外した行を数える。
+    """
+    mask = duration_mask(df_org, max_duration_min)
+    df = df_org.loc[mask, ["start station name", "bikeid"]]
+    return UsageTables.from_counts(*compute_usage_counts(df))
+
+
+def add_aggregate_features(df: pd.DataFrame, usage_tables: UsageTables | None = None) -> pd.DataFrame:
+    """
+    駅や自転車単位の集約特徴量を追加。
+    集計済みの回数テーブル（usage_tables）が渡された場合は、groupbyせずにテーブルから引く。
+    """
+    if usage_tables is not None:
+        df["station_usage_count"] = usage_tables.lookup_station(df["start station name"])
+        df["bike_usage_count"] = usage_tables.lookup_bike(df["bikeid"])
+        return df
+
     # 駅の人気度
-    station_usage = df.groupby("start station name").size().reset_index(name="station_usage_count")
-    df = df.merge(station_usage, on="start station name", how="left")
+    df["station_usage_count"] = df.groupby("start station name", observed=True)["bikeid"].transform("size")
 
     # 自転車の稼働回数
-    bike_usage = df.groupby("bikeid").size().reset_index(name="bike_usage_count")
-    df = df.merge(bike_usage, on="bikeid", how="left")
+    df["bike_usage_count"] = df.groupby("bikeid", observed=True)["bikeid"].transform("size")
 
     return df
 
@@ -74,16 +139,7 @@ def add_target(df: pd.DataFrame) -> pd.DataFrame:
 
 def select_features(df: pd.DataFrame) -> pd.DataFrame:
     """モデル学習用の特徴量を抽出"""
-    features = [
-        "start_hour",
-        "weekday",
-        "time_category",
-        "tripduration_min",
-        "station_usage_count",
-        "bike_usage_count",
-        "gender",
-    ]
-    return df[features + ["is_member"]]
+    return df[FEATURES + ["is_member"]]
 
 
 def convert_to_float(df: pd.DataFrame) -> pd.DataFrame:
@@ -97,7 +153,45 @@ def convert_to_float(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def preprocess_pipeline(df_org: pd.DataFrame) -> pd.DataFrame:
+def build_feature_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    select_features と convert_to_float を1回で行う。
+    特徴量は事前確保したC連続のfloat64配列に直接書き込み、列ごとの型変換やコピーを避ける。
+    インデックスは0からの連番に振り直す。is_member がない場合（推論時）は特徴量のみを返す。
+    """
+    n_rows = len(df)
+    matrix = np.empty((n_rows, len(FEATURES)), dtype="float64")
+    for i, col in enumerate(FEATURES):
+        matrix[:, i] = df[col].to_numpy()
+
+    df_final = pd.DataFrame(matrix, columns=FEATURES, copy=False)
+    if "is_member" in df.columns:
+        df_final["is_member"] = df["is_member"].to_numpy()
+    return df_final
+
+
+def preprocess_for_inference(df_org: pd.DataFrame, usage_tables: UsageTables | None = None) -> pd.DataFrame:
+    """
+    推論用の前処理。preprocess_pipelineと同じ特徴量を作るが、
+    入力の行を落とさないよう外れ値除外は行わず、ターゲットも作らない。
+    usage_tablesを渡すと、集約特徴量をバッチ内ではなく学習月の回数から引く。
+    """
+    columns = [col for col in REQUIRED_COLUMNS if col in df_org.columns]
+    df = df_org[columns].copy()
+
+    df["starttime"] = parse_datetime(df["starttime"])
+    df["tripduration_min"] = df["tripduration"].to_numpy() / 60
+    df = add_time_features(df)
+    df = add_aggregate_features(df, usage_tables)
+    return build_feature_frame(df)
+
+
+@profiled("preprocess", rows=len)
+def preprocess_pipeline(
+    df_org: pd.DataFrame,
+    max_duration_min: int = 360,
+    usage_tables: UsageTables | None = None,
+) -> pd.DataFrame:
     """
     CitiBikeデータの前処理を一括で実行する。
 
@@ -105,16 +199,139 @@ def preprocess_pipeline(df_org: pd.DataFrame) -> pd.DataFrame:
     ----------
     df_org : pd.DataFrame
         生データ
+    max_duration_min : int, optional
+        利用時間の上限（分）
+    usage_tables : UsageTables | None, optional
+        集約特徴量に使う回数テーブル。Noneの場合はdf_org自身から集計する。
 
     Returns
     -------
     pd.DataFrame
         前処理済みかつ学習用に整形されたDataFrame
     """
-    df = load_and_clean_data(df_org)
+    df = load_and_clean_data(df_org, max_duration_min)
     df = add_time_features(df)
-    df = add_aggregate_features(df)
+    df = add_aggregate_features(df, usage_tables)
     df = add_target(df)
-    df = select_features(df)
-    df_final = convert_to_float(df)
-    return df_final
\ No newline at end of file
+    return build_feature_frame(df)
+
+
+def scan_usage_counts(
+    months: list[tuple[int, int]],
+    max_duration_min: int = 360,
+    chunksize: int = 500_000,
+) -> tuple[UsageTables, int]:
+    """
+    ストリーミング前処理の1パス目。
+    チャンクごとにクリーニングし、駅・自転車の利用回数を全期間分加算する。
+    外れ値除外後の行数（2パス目の出力の行数）も合わせて返す。
+    """
+    station_counts = pd.Series(dtype="int64")
+    bike_counts = pd.Series(dtype="int64")
+    n_rows = 0
+    for year, month in months:
+        for chunk in iter_month_chunks(year, month, REQUIRED_COLUMNS, chunksize):
+            df = load_and_clean_data(chunk, max_duration_min)
+            n_rows += len(df)
+            station_chunk, bike_chunk = compute_usage_counts(df)
+            station_chunk.index = pd.Index(np.asarray(station_chunk.index))
+            station_counts = station_counts.add(station_chunk, fill_value=0)
+            bike_counts = bike_counts.add(bike_chunk, fill_value=0)
+    return UsageTables.from_counts(station_counts.astype("int64"), bike_counts.astype("int64")), n_rows
+
+
+def accumulate_usage_tables(
+    months: list[tuple[int, int]],
+    max_duration_min: int = 360,
+    chunksize: int = 500_000,
+) -> UsageTables:
+    """複数月の駅・自転車の利用回数テーブルを、チャンク単位で読み込んで集計する"""
+    return scan_usage_counts(months, max_duration_min, chunksize)[0]
+
+
+def count_kept_rows(
+    months: list[tuple[int, int]],
+    max_duration_min: int = 360,
+    chunksize: int = 500_000,
+) -> int:
+    """外れ値除外後の行数を数える（tripdurationの列だけを読む）"""
+    return sum(
+        int(duration_mask(chunk, max_duration_min).sum())
+        for year, month in months
+        for chunk in iter_month_chunks(year, month, ["tripduration"], chunksize)
+    )
+
+
+def iter_preprocessed_chunks(
+    months: list[tuple[int, int]],
+    max_duration_min: int = 360,
+    chunksize: int = 500_000,
+    usage_tables: UsageTables | None = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    複数月のデータをチャンク単位で前処理するジェネレータ。
+    1パス目で集約特徴量の回数を全期間分集計し、2パス目で行単位の処理と結合を行う。
+    ピークメモリはチャンクサイズと駅・自転車数のみに依存し、月数には依存しない。
+
+    Parameters
+    ----------
+    months : list[tuple[int, int]]
+        対象の(年, 月)のリスト
+    max_duration_min : int, optional
+        利用時間の上限（分）
+    chunksize : int, optional
+        1チャンクあたりの行数
+    usage_tables : UsageTables | None, optional
+        集計済みの回数テーブル。渡した場合は1パス目を省略する。
+    """
+    if usage_tables is None:
+        usage_tables = accumulate_usage_tables(months, max_duration_min, chunksize)
+
+    for year, month in months:
+        for chunk in iter_month_chunks(year, month, REQUIRED_COLUMNS, chunksize):
+            df = load_and_clean_data(chunk, max_duration_min)
+            df = add_time_features(df)
+            df = add_aggregate_features(df, usage_tables)
+            df = add_target(df)
+            yield build_feature_frame(df)
+
+
+@profiled("preprocess_streaming", rows=len)
+def preprocess_pipeline_streaming(
+    months: list[tuple[int, int]],
+    max_duration_min: int = 360,
+    chunksize: int = 500_000,
+    usage_tables: UsageTables | None = None,
+) -> pd.DataFrame:
+    """
+    複数月のデータをチャンク単位で前処理し、学習用DataFrameとして返す。
+    結果は全月を連結してpreprocess_pipelineに渡した場合と一致する。
+
+    1パス目で数えた行数で特徴量行列を事前確保し、2パス目の各チャンクを書き込んだら捨てる。
+    チャンクを溜めてから連結しないため、ピークメモリは最終的なDataFrameとチャンク1つ分で済む。
+    usage_tablesを渡した場合は、行数だけを数えて（tripdurationの列のみ読む）回数の集計を省略する。
+
+    実行例）
+    df = preprocess_pipeline_streaming([(2014, 6), (2014, 7), (2014, 8)])
+    """
+    if usage_tables is None:
+        usage_tables, n_rows = scan_usage_counts(months, max_duration_min, chunksize)
+    else:
+        n_rows = count_kept_rows(months, max_duration_min, chunksize)
+
+    matrix = np.empty((n_rows, len(FEATURES)), dtype="float64")
+    target = np.empty(n_rows, dtype="int64")
+    position = 0
+    for chunk in iter_preprocessed_chunks(months, max_duration_min, chunksize, usage_tables):
+        end = position + len(chunk)
+        if end > n_rows:
+            raise RuntimeError(f"Source data changed during streaming preprocessing (expected {n_rows:,} rows)")
+        matrix[position:end] = chunk[FEATURES].to_numpy()
+        target[position:end] = chunk["is_member"].to_numpy()
+        position = end
+    if position != n_rows:
+        raise RuntimeError(f"Source data changed during streaming preprocessing (expected {n_rows:,} rows, got {position:,})")
+
+    df = pd.DataFrame(matrix, columns=FEATURES, copy=False)
+    df["is_member"] = target
+    return df
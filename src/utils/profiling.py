@@ -0,0 +1,229 @@
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+PROFILE_DIR = "profiles"
+# 詳細プロファイルのモード（"cprofile" / "tracemalloc"）。環境変数でも指定できる。
+PROFILE_MODE_ENV = "CITIBIKE_PROFILE"
+
+# 長時間動くプロセスでトレースが増え続けないよう、古い記録から捨てる
+MAX_TRACE_RECORDS = 100_000
+
+_trace: deque[dict] = deque(maxlen=MAX_TRACE_RECORDS)
+_trace_seq = 0
+_trace_lock = threading.Lock()
+_local = threading.local()
+_profile_mode = os.environ.get(PROFILE_MODE_ENV)
+
+
+def set_profile_mode(mode: str | None) -> None:
+    """
+    詳細プロファイルのモードを切り替える。
+    "cprofile": 最上位のステージごとにcProfileの結果を data/interim/profiles/ に保存する。
+    "tracemalloc": ステージごとにPythonのメモリ確保のピークを記録する（遅くなる）。
+    None: 時間・メモリの計測のみ（既定）。
+    """
+    global _profile_mode
+    if mode not in (None, "cprofile", "tracemalloc"):
+        raise ValueError(f"Unknown profile mode: {mode}")
+    _profile_mode = mode
+
+
+def get_peak_rss_mb() -> float | None:
+    """
+    プロセスの起動からの最大常駐メモリ（MB）。取得できない環境ではNone。
+    ステージの前に確保したメモリも含むため、ステージ単体のメモリ量ではない。
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def get_rss_mb() -> float | None:
+    """プロセスの現在の常駐メモリ（MB）。/proc のない環境ではNone。"""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+
+
+def get_profile_dir() -> Path:
+    """プロファイル結果・トレースの保存先（data/interim/profiles）"""
+    # src.utils.io からもこのモジュールを使うため、循環importを避けてここでimportする
+    from src.utils.io import get_project_root, DATA_DIR, INTERIM_DIR
+    return get_project_root() / DATA_DIR / INTERIM_DIR / PROFILE_DIR
+
+
+def get_stack() -> list[str]:
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+@contextmanager
+def stage(name: str, rows: int | None = None):
+    """
+    処理の1ステージの実行時間・CPU時間・常駐メモリ・処理行数を記録する。
+    処理行数は開始時に渡すか、ブロック内で record["rows"] に設定する。
+
+    記録する値と注意点:
+    - process_cpu_sec: プロセス全体のCPU時間（LightGBMなどのスレッドや、並行して動く他のステージの分も含む）
+    - thread_cpu_sec: ステージを実行したスレッドだけのCPU時間
+    - rss_delta_mb: ステージの前後での現在の常駐メモリの増減（ステージ内で確保して解放した分は含まない）
+    - process_peak_rss_mb: 終了時点のプロセスの最大常駐メモリ（ステージより前のピークも含む）
+    - peak_rss_increase_mb: ステージ中にプロセスの最大常駐メモリが増えた量（ピークを更新しなければ0）
+    ステージ単体のメモリ確保のピークが必要な場合は "tracemalloc" モードの traced_peak_mb を使う。
+
+    実行例）
+    with stage("fit", rows=len(X_train)):
+        model.fit(X_train, y_train)
+    """
+    stack = get_stack()
+    record = {
+        "name": name,
+        "parent": stack[-1] if stack else None,
+        "depth": len(stack),
+        "rows": rows,
+        "start": time.time(),
+    }
+    profiler = None
+    # cProfileはメインスレッドの最上位ステージだけで有効にする
+    if _profile_mode == "cprofile" and not stack and threading.current_thread() is threading.main_thread():
+        profiler = cProfile.Profile()
+        profiler.enable()
+    tracing = _profile_mode == "tracemalloc" and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+
+    stack.append(name)
+    rss_start = get_rss_mb()
+    peak_rss_start = get_peak_rss_mb()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    thread_cpu_start = time.thread_time()
+    try:
+        yield record
+    finally:
+        record["wall_sec"] = time.perf_counter() - wall_start
+        record["process_cpu_sec"] = time.process_time() - cpu_start
+        record["thread_cpu_sec"] = time.thread_time() - thread_cpu_start
+        rss_end = get_rss_mb()
+        record["rss_delta_mb"] = rss_end - rss_start if rss_start is not None and rss_end is not None else None
+        record["process_peak_rss_mb"] = get_peak_rss_mb()
+        record["peak_rss_increase_mb"] = (
+            record["process_peak_rss_mb"] - peak_rss_start if peak_rss_start is not None else None
+        )
+        stack.pop()
+
+        if tracing:
+            record["traced_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+            tracemalloc.stop()
+        if profiler is not None:
+            profiler.disable()
+            profile_dir = get_profile_dir()
+            profile_dir.mkdir(parents=True, exist_ok=True)
+            profile_path = profile_dir / f"{name}_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.prof"
+            profiler.dump_stats(profile_path)
+            record["profile"] = str(profile_path)
+
+        global _trace_seq
+        with _trace_lock:
+            record["seq"] = _trace_seq
+            _trace_seq += 1
+            _trace.append(record)
+
+
+def profiled(name: str | None = None, rows: Callable | None = None):
+    """
+    関数全体を1ステージとして記録するデコレータ。
+    rowsには戻り値から処理行数を求める関数を渡す（例: rows=len）。
+    """
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name) as record:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    record["rows"] = rows(result)
+                return result
+        return wrapper
+    return decorator
+
+
+def trace_mark() -> int:
+    """現在のトレースの位置を返す（get_trace(since=...) で以降の記録だけを取り出す）"""
+    with _trace_lock:
+        return _trace_seq
+
+
+def get_trace(since: int = 0) -> list[dict]:
+    """記録済みのステージを終了順に返す"""
+    with _trace_lock:
+        return [record for record in _trace if record["seq"] >= since]
+
+
+def reset_trace() -> None:
+    with _trace_lock:
+        _trace.clear()
+
+
+def trace_metrics(records: list[dict]) -> dict:
+    """
+    ステージ名ごとに集計したMLflow用のメトリクスを返す。
+    時間と行数は合計、メモリは最大値を使う（各値の意味はstageを参照）。
+    """
+    metrics: dict[str, float] = {}
+    for record in records:
+        prefix = f"stage_{record['name']}"
+        for key in ("wall_sec", "process_cpu_sec", "thread_cpu_sec"):
+            metrics[f"{prefix}_{key}"] = metrics.get(f"{prefix}_{key}", 0.0) + record[key]
+        if record["rows"] is not None:
+            metrics[f"{prefix}_rows"] = metrics.get(f"{prefix}_rows", 0) + record["rows"]
+        for key in ("rss_delta_mb", "process_peak_rss_mb", "peak_rss_increase_mb", "traced_peak_mb"):
+            if record.get(key) is not None:
+                metrics[f"{prefix}_{key}"] = max(metrics.get(f"{prefix}_{key}", 0.0), record[key])
+    return metrics
+
+
+def save_trace(records: list[dict], path: Path) -> Path:
+    """トレースをJSONで保存する"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(records, f, indent=2)
+    return path
+
+
+def print_trace(records: list[dict]) -> None:
+    """
+    トレースをステージの入れ子に沿って表示する。
+    cpuはプロセス全体のCPU時間、rssはステージ前後の常駐メモリの増減とプロセスの最大常駐メモリ。
+    """
+    for record in sorted(records, key=lambda r: r["start"]):
+        rows = f"{record['rows']:>12,} rows" if record["rows"] is not None else " " * 17
+        rss = ""
+        if record["rss_delta_mb"] is not None:
+            rss += f"rss {record['rss_delta_mb']:+8.0f} MB  "
+        if record["process_peak_rss_mb"] is not None:
+            rss += f"process peak {record['process_peak_rss_mb']:8.0f} MB"
+        print(
+            f"{'  ' * record['depth']}{record['name']:<{32 - 2 * record['depth']}s} "
+            f"wall {record['wall_sec']:8.3f}s  cpu {record['process_cpu_sec']:8.3f}s  {rows}  {rss}"
+        )
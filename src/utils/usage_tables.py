@@ -0,0 +1,77 @@
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+
+# 密な配列で引ける自転車IDの上限（これを超える場合は二分探索で引く）
+MAX_DENSE_BIKE_ID = 10_000_000
+
+
+class UsageTables:
+    """
+    駅・自転車ごとの利用回数（station_usage_count / bike_usage_count）のルックアップテーブル。
+
+    学習した月の回数を保持し、推論時や評価時にバッチ内でgroupbyせずに回数を引く。
+    駅名は辞書エンコード（駅名の配列 + ハッシュインデックス）、自転車IDは
+    IDを添字にした回数配列で保持する。学習データにない駅・自転車の回数は0とする。
+    """
+
+    def __init__(self, station_names: np.ndarray, station_counts: np.ndarray, bike_ids: np.ndarray, bike_counts: np.ndarray):
+        order = np.argsort(station_names, kind="stable")
+        self.station_names = station_names[order]
+        self.station_counts = station_counts[order].astype("int64")
+
+        order = np.argsort(bike_ids, kind="stable")
+        self.bike_ids = bike_ids[order].astype("int64")
+        self.bike_counts = bike_counts[order].astype("int64")
+
+        self._station_index = pd.Index(self.station_names)
+        self._bike_dense = None
+        if len(self.bike_ids) and 0 <= self.bike_ids[0] and self.bike_ids[-1] < MAX_DENSE_BIKE_ID:
+            self._bike_dense = np.zeros(self.bike_ids[-1] + 1, dtype="int64")
+            self._bike_dense[self.bike_ids] = self.bike_counts
+
+    @classmethod
+    def from_counts(cls, station_counts: pd.Series, bike_counts: pd.Series) -> "UsageTables":
+        """駅名・自転車IDをインデックスに持つ回数のSeriesから作成する"""
+        return cls(
+            np.asarray(station_counts.index, dtype=str),
+            station_counts.to_numpy(),
+            np.asarray(bike_counts.index, dtype="int64"),
+            bike_counts.to_numpy(),
+        )
+
+    def lookup_station(self, names: pd.Series) -> np.ndarray:
+        """駅名ごとの利用回数を返す"""
+        keys = np.asarray(names, dtype=object)
+        positions = self._station_index.get_indexer(keys)
+        return np.where(positions >= 0, self.station_counts[positions], 0)
+
+    def lookup_bike(self, bike_ids: pd.Series) -> np.ndarray:
+        """自転車IDごとの利用回数を返す"""
+        ids = np.asarray(bike_ids, dtype="int64")
+        if self._bike_dense is not None:
+            in_range = (ids >= 0) & (ids < len(self._bike_dense))
+            return np.where(in_range, self._bike_dense[np.where(in_range, ids, 0)], 0)
+
+        positions = np.searchsorted(self.bike_ids, ids)
+        positions = np.minimum(positions, len(self.bike_ids) - 1)
+        found = self.bike_ids[positions] == ids
+        return np.where(found, self.bike_counts[positions], 0)
+
+    def save(self, path: Path) -> Path:
+        """npz形式で保存する"""
+        np.savez_compressed(
+            path,
+            station_names=self.station_names.astype(str),
+            station_counts=self.station_counts,
+            bike_ids=self.bike_ids,
+            bike_counts=self.bike_counts,
+        )
+        return path
+
+    @classmethod
+    def load(cls, path: Path) -> "UsageTables":
+        """saveで保存したテーブルを読み込む"""
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["station_names"], data["station_counts"], data["bike_ids"], data["bike_counts"])
@@ -0,0 +1,40 @@
+import sys
+from pathlib import Path
+import pytest
+
+# リポジトリのルートから src.* をimportできるようにする
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.utils.io import PROJECT_ROOT_ENV  # noqa: E402
+
+# テスト用の合成データの行数（1か月あたり）
+TEST_MONTH_ROWS = 20_000
+
+
+@pytest.fixture
+def project_root(tmp_path, monkeypatch):
+    """2014年1〜2月の合成データを置いた一時ディレクトリを data/ の場所にする"""
+    from src.benchmarks.synthetic import write_month_csvs
+
+    for month in (1, 2):
+        write_month_csvs(tmp_path, 2014, month, TEST_MONTH_ROWS, seed=month)
+    monkeypatch.setenv(PROJECT_ROOT_ENV, str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def mlflow_tracking(tmp_path, monkeypatch):
+    """
+    一時ディレクトリのSQLiteをMLflowのTracking / Registryにし、共有のRegistrySessionを作り直す。
+    アーティファクトの既定の保存先（カレントディレクトリの mlruns/）も一時ディレクトリにする。
+    """
+    import mlflow
+    import src.pipelines.registry_session as registry_session
+
+    monkeypatch.chdir(tmp_path)
+    uri = f"sqlite:///{tmp_path / 'mlflow.db'}"
+    monkeypatch.setenv("MLFLOW_TRACKING_URI", uri)
+    mlflow.set_tracking_uri(uri)
+    monkeypatch.setattr(registry_session, "_session", None)
+    yield uri
+    mlflow.set_tracking_uri(None)
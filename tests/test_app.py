@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sklearn.linear_model import LogisticRegression
+from src.utils.preprocess import preprocess_pipeline, build_usage_tables
+from src.benchmarks.synthetic import generate_month
+from src.serving.scorer import ProductionModel, ModelSnapshot
+import src.serving.app as app_module
+from src.serving.app import create_app, MicroBatcher
+
+
+TRIP = {
+    "tripduration": 600,
+    "starttime": "2014-01-06 08:00:00",
+    "stoptime": "2014-01-06 08:10:00",
+    "start station name": "W 52 St & 11 Ave",
+    "bikeid": 16000,
+    "usertype": "Subscriber",
+    "gender": 1,
+}
+
+
+class ConstantModel:
+    """どの行にも同じ確率を返すモデル"""
+
+    def __init__(self, value: float):
+        self.value = value
+
+    def predict_proba(self, X):
+        return np.tile([1 - self.value, self.value], (len(X), 1))
+
+
+@pytest.fixture(scope="module")
+def trained():
+    df_raw = generate_month(2014, 1, 5_000)
+    usage_tables = build_usage_tables(df_raw)
+    df = preprocess_pipeline(df_raw, usage_tables=usage_tables)
+    model = LogisticRegression(max_iter=200).fit(df.drop("is_member", axis=1), df["is_member"])
+    return model, usage_tables
+
+
+@pytest.fixture(scope="module")
+def client(trained):
+    model, usage_tables = trained
+    # Registryのバージョン番号は整数で渡されることがある
+    holder = ProductionModel.from_model(model, version=3, usage_tables=usage_tables)
+    with TestClient(create_app(holder)) as client:
+        yield client
+
+
+def test_predict_with_int_model_version(client):
+    response = client.post("/predict", json={"trips": [TRIP, TRIP]})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["model_version"] == "3"
+    assert len(body["member_probability"]) == 2
+    assert client.get("/health").json()["model_version"] == "3"
+
+
+@pytest.mark.parametrize("change", [
+    {"starttime": None},
+    {"starttime": "not a date"},
+    {"tripduration": None},
+    {"tripduration": "ten minutes"},
+    {"gender": None},
+])
+def test_predict_invalid_trip_returns_422(client, change):
+    response = client.post("/predict", json={"trips": [TRIP, {**TRIP, **change}]})
+    assert response.status_code == 422
+
+
+def test_predict_missing_column_returns_422(client):
+    trip = {key: value for key, value in TRIP.items() if key != "starttime"}
+    response = client.post("/predict", json={"trips": [trip]})
+    assert response.status_code == 422
+
+
+def test_predict_uses_one_snapshot_during_swap(trained, monkeypatch):
+    _, usage_tables = trained
+    holder = ProductionModel.from_model(ConstantModel(0.25), version=1, usage_tables=usage_tables)
+    new_snapshot = ModelSnapshot(ConstantModel(0.75), None, "2", "new_run")
+    build_request_features = app_module.build_request_features
+    used_tables = []
+
+    def build_then_swap(trips, usage_tables=None):
+        # 特徴量を作った直後にエイリアスが付け替えられた状況
+        used_tables.append(usage_tables)
+        X = build_request_features(trips, usage_tables)
+        holder.snapshot = new_snapshot
+        return X
+
+    monkeypatch.setattr(app_module, "build_request_features", build_then_swap)
+    with TestClient(create_app(holder)) as client:
+        body = client.post("/predict", json={"trips": [TRIP]}).json()
+
+    assert used_tables == [usage_tables]
+    assert body["model_version"] == "1"
+    assert body["member_probability"] == [0.25]
+    assert holder.version == "2"
+
+
+def test_score_batch_groups_by_snapshot(trained):
+    _, usage_tables = trained
+    X = app_module.build_request_features([TRIP, TRIP], usage_tables)
+    old = ModelSnapshot(ConstantModel(0.25), usage_tables, "1", None)
+    new = ModelSnapshot(ConstantModel(0.75), usage_tables, "2", None)
+
+    results = MicroBatcher.score_batch([(X, old, None), (X.iloc[:1], new, None), (X, old, None)])
+    assert [r.tolist() for r in results] == [[0.25, 0.25], [0.75], [0.25, 0.25]]
@@ -0,0 +1,189 @@
+import os
+import pickle
+import numpy as np
+import pandas as pd
+import pytest
+import lightgbm as lgb
+from lightgbm import LGBMClassifier
+from xgboost import XGBClassifier
+import src.train.binned_dataset as binned_dataset
+from src.train.binned_dataset import (
+    fit_lgbm_binned, fit_xgboost_binned, get_dataset_dir, can_fit_lgbm_binned, reuse_xgboost_matrices,
+)
+from src.utils.io import PROJECT_ROOT_ENV
+
+PARAMS = {"n_estimators": 30, "num_leaves": 7, "min_child_samples": 5, "random_state": 0, "verbose": -1}
+XGB_PARAMS = {"n_estimators": 30, "max_depth": 3, "random_state": 0, "n_jobs": 1}
+# 学習後のLGBMClassifierで、予測・記録・探索（src.train.search）が参照する属性
+FITTED_ATTRIBUTES = [
+    "classes_", "n_classes_", "n_features_", "n_features_in_", "feature_name_", "objective_",
+    "best_iteration_", "best_score_", "evals_result_", "fitted_",
+]
+
+
+@pytest.fixture
+def dataset_root(tmp_path, monkeypatch):
+    monkeypatch.setenv(PROJECT_ROOT_ENV, str(tmp_path))
+    return tmp_path
+
+
+def make_data(n_rows: int, seed: int):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(rng.normal(size=(n_rows, 4)), columns=["a", "b", "c", "d"])
+    y = pd.Series((X["a"] + 0.5 * X["b"] + rng.normal(scale=0.5, size=n_rows) > 0).astype("int64"), name="is_member")
+    return X, y
+
+
+def assert_same_fit(binned, fitted, X):
+    for name in FITTED_ATTRIBUTES:
+        expected, actual = getattr(fitted, name), getattr(binned, name)
+        if isinstance(expected, np.ndarray):
+            np.testing.assert_array_equal(actual, expected)
+        else:
+            assert actual == expected, name
+    assert binned.booster_.num_trees() == fitted.booster_.num_trees()
+    np.testing.assert_array_equal(binned.predict_proba(X), fitted.predict_proba(X))
+    np.testing.assert_array_equal(binned.predict(X), fitted.predict(X))
+    restored = pickle.loads(pickle.dumps(binned))
+    np.testing.assert_array_equal(restored.predict_proba(X), fitted.predict_proba(X))
+
+
+def test_lgbm_version_is_supported():
+    # requirements.txtのLightGBMを更新した場合は、このテストが通ることを確認してSUPPORTED_LGBM_VERSIONを更新する
+    assert lgb.__version__.startswith(binned_dataset.SUPPORTED_LGBM_VERSION)
+
+
+def test_fit_lgbm_binned_matches_fit(dataset_root):
+    X, y = make_data(2_000, seed=0)
+    fitted = LGBMClassifier(**PARAMS).fit(X, y)
+    binned = fit_lgbm_binned(LGBMClassifier(**PARAMS), X, y, "train")
+    assert_same_fit(binned, fitted, X)
+
+    # 2回目は保存済みのDatasetを読み込んで学習する
+    assert len(list(get_dataset_dir().glob("*.bin"))) == 1
+    assert_same_fit(fit_lgbm_binned(LGBMClassifier(**PARAMS), X, y, "train"), fitted, X)
+
+
+def test_fit_lgbm_binned_with_early_stopping_matches_fit(dataset_root):
+    X, y = make_data(2_000, seed=0)
+    X_val, y_val = make_data(500, seed=1)
+    params = {**PARAMS, "n_estimators": 300, "learning_rate": 0.3}
+
+    fitted = LGBMClassifier(**params).fit(
+        X, y, eval_set=[(X_val, y_val)], callbacks=[lgb.early_stopping(5, verbose=False)],
+    )
+    binned = fit_lgbm_binned(
+        LGBMClassifier(**params), X, y, "train", eval_set=[(X_val, y_val)],
+        callbacks=[lgb.early_stopping(5, verbose=False)],
+    )
+    assert fitted.best_iteration_ < params["n_estimators"]
+    assert_same_fit(binned, fitted, X_val)
+
+
+def test_fit_lgbm_binned_falls_back_for_class_weight(dataset_root):
+    X, y = make_data(1_000, seed=0)
+    params = {**PARAMS, "class_weight": "balanced"}
+    assert not can_fit_lgbm_binned(LGBMClassifier(**params))
+
+    fitted = LGBMClassifier(**params).fit(X, y)
+    binned = fit_lgbm_binned(LGBMClassifier(**params), X, y, "train")
+    np.testing.assert_array_equal(binned.predict_proba(X), fitted.predict_proba(X))
+    assert not get_dataset_dir().exists()
+
+
+def test_stale_datasets_are_removed(dataset_root, monkeypatch):
+    X, y = make_data(1_000, seed=0)
+    fit_lgbm_binned(LGBMClassifier(**PARAMS), X, y, "train")
+    old_files = list(get_dataset_dir().glob("*.bin"))
+    assert len(old_files) == 1
+
+    # 前処理コードが変わると、キーが変わり古いファイルは削除される
+    monkeypatch.setattr(binned_dataset, "get_preprocess_hash", lambda: "0123456789ab")
+    fit_lgbm_binned(LGBMClassifier(**PARAMS), X, y, "train")
+    files = list(get_dataset_dir().glob("*.bin"))
+    assert len(files) == 1
+    assert files[0].name.startswith("0123456789ab_")
+    assert not old_files[0].exists()
+
+
+@pytest.mark.parametrize("change", [{"linear_tree": True}, {"linear_trees": True}])
+def test_fit_lgbm_binned_falls_back_for_linear_tree(dataset_root, change):
+    X, y = make_data(1_000, seed=0)
+    params = {**PARAMS, **change}
+    assert not can_fit_lgbm_binned(LGBMClassifier(**params))
+
+    fitted = LGBMClassifier(**params).fit(X, y)
+    binned = fit_lgbm_binned(LGBMClassifier(**params), X, y, "train")
+    np.testing.assert_array_equal(binned.predict_proba(X), fitted.predict_proba(X))
+    assert not get_dataset_dir().exists()
+
+
+def test_fit_lgbm_binned_falls_back_for_init_model(dataset_root):
+    X, y = make_data(1_000, seed=0)
+    base = LGBMClassifier(**PARAMS).fit(X, y)
+    assert not can_fit_lgbm_binned(LGBMClassifier(**PARAMS), init_model=base.booster_)
+
+    fitted = LGBMClassifier(**PARAMS).fit(X, y, init_model=base.booster_)
+    binned = fit_lgbm_binned(LGBMClassifier(**PARAMS), X, y, "train", init_model=base.booster_)
+    assert binned.booster_.num_trees() == 2 * PARAMS["n_estimators"]
+    np.testing.assert_array_equal(binned.predict_proba(X), fitted.predict_proba(X))
+    assert not get_dataset_dir().exists()
+
+
+def assert_same_xgboost_fit(binned, fitted, X):
+    assert binned.get_booster().num_boosted_rounds() == fitted.get_booster().num_boosted_rounds()
+    assert getattr(binned, "best_iteration", None) == getattr(fitted, "best_iteration", None)
+    np.testing.assert_array_equal(binned.predict_proba(X), fitted.predict_proba(X))
+    np.testing.assert_array_equal(binned.predict(X), fitted.predict(X))
+
+
+def test_fit_xgboost_binned_matches_fit():
+    X, y = make_data(2_000, seed=0)
+    fitted = XGBClassifier(**XGB_PARAMS).fit(X, y)
+    binned = fit_xgboost_binned(XGBClassifier(**XGB_PARAMS), X, y, "train")
+    assert_same_xgboost_fit(binned, fitted, X)
+
+
+def test_fit_xgboost_binned_with_early_stopping_matches_fit():
+    X, y = make_data(2_000, seed=0)
+    X_val, y_val = make_data(500, seed=1)
+    params = {**XGB_PARAMS, "n_estimators": 300, "learning_rate": 0.5, "early_stopping_rounds": 5}
+
+    fitted = XGBClassifier(**params).fit(X, y, eval_set=[(X_val, y_val)], verbose=False)
+    binned = fit_xgboost_binned(XGBClassifier(**params), X, y, "train", eval_set=[(X_val, y_val)])
+    assert fitted.best_iteration + 1 < params["n_estimators"]
+    assert_same_xgboost_fit(binned, fitted, X_val)
+
+
+def test_xgboost_matrices_are_kept_only_inside_reuse_block():
+    X, y = make_data(1_000, seed=0)
+    fit_xgboost_binned(XGBClassifier(**XGB_PARAMS), X, y, "train")
+    assert len(binned_dataset._matrix_cache) == 0
+
+    with reuse_xgboost_matrices():
+        fit_xgboost_binned(XGBClassifier(**XGB_PARAMS), X, y, "train")
+        matrices = list(binned_dataset._matrix_cache.values())
+        assert len(matrices) == 1
+        # 同じkeyの学習ではQuantileDMatrixを作り直さない
+        fit_xgboost_binned(XGBClassifier(**XGB_PARAMS), X, y, "train")
+        assert list(binned_dataset._matrix_cache.values()) == matrices
+    assert len(binned_dataset._matrix_cache) == 0
+
+
+def test_least_recently_used_datasets_are_removed(dataset_root, monkeypatch):
+    X, y = make_data(1_000, seed=0)
+    fit_lgbm_binned(LGBMClassifier(**PARAMS), X, y, "first")
+    (first,) = get_dataset_dir().glob("*.bin")
+    # 2つ分は入り、3つ目で最も前に使ったものを削除する上限
+    monkeypatch.setattr(binned_dataset, "MAX_DATASET_BYTES", int(first.stat().st_size * 2.5))
+    fit_lgbm_binned(LGBMClassifier(**PARAMS), X, y, "second")
+    (second,) = [path for path in get_dataset_dir().glob("*.bin") if path != first]
+
+    # firstを後から使うと、secondのほうが古くなる
+    os.utime(first, (0, 0))
+    os.utime(second, (0, 0))
+    fit_lgbm_binned(LGBMClassifier(**PARAMS), X, y, "first")
+    fit_lgbm_binned(LGBMClassifier(**PARAMS), X, y, "third")
+    assert first.exists()
+    assert not second.exists()
+    assert len(list(get_dataset_dir().glob("*.bin"))) == 2
@@ -0,0 +1,27 @@
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+import src.pipelines.retrain_pipeline as retrain_pipeline
+from src.cli import build_parser
+
+
+def test_retrain_passes_max_duration_min(monkeypatch):
+    calls = []
+    monkeypatch.setattr(retrain_pipeline, "retrain_if_needed", lambda *args, **kwargs: calls.append((args, kwargs)))
+
+    args = build_parser().parse_args(["retrain", "2014", "2", "--max-duration-min", "90"])
+    args.func(args)
+    assert calls[0][0] == (2014, 2)
+    assert calls[0][1]["max_duration_min"] == 90
+
+
+@pytest.mark.parametrize("module", ["src.cli", "src.train.search"])
+def test_import_does_not_load_sklearn(module):
+    # CLIの起動や探索モジュールのimportだけでは、sklearnなどの重いライブラリを読み込まない
+    code = f"import sys, {module}; print(','.join(m for m in ('sklearn', 'lightgbm', 'xgboost') if m in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True,
+        cwd=Path(__file__).resolve().parents[1],
+    )
+    assert result.stdout.strip() == ""
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+from lightgbm import LGBMClassifier
+from src.utils.preprocess import preprocess_pipeline
+from src.benchmarks.synthetic import generate_month
+from src.train.experiment import split_dataset
+from src.train.trainer import MODEL_REGISTRY, get_model, train_model_with_early_stopping
+from src.serving.compiled import compile_model, load_compiled
+
+MODEL_PARAMS = {
+    "logistic_regression": {"max_iter": 200},
+    "decision_tree": {"max_depth": 8},
+    "random_forest": {"n_estimators": 10, "max_depth": 6, "n_jobs": 1},
+    "lgbm": {"n_estimators": 30, "verbose": -1},
+    "xgboost": {"n_estimators": 30, "max_depth": 4, "n_jobs": 1},
+}
+
+
+@pytest.fixture(scope="module")
+def split():
+    return split_dataset(preprocess_pipeline(generate_month(2014, 1, 5_000)))
+
+
+def assert_same_proba(model, compiled, X):
+    np.testing.assert_allclose(compiled.predict_proba(X), model.predict_proba(X), rtol=0, atol=1e-6)
+
+
+@pytest.mark.parametrize("model_name", list(MODEL_REGISTRY))
+def test_compiled_matches_native(model_name, split, tmp_path):
+    X_train, X_test, y_train, _ = split
+    model = get_model(model_name, MODEL_PARAMS[model_name]).fit(X_train, y_train)
+    compiled = compile_model(model)
+    assert_same_proba(model, compiled, X_test)
+    # 保存・読み込み後も同じ結果になる
+    assert_same_proba(model, load_compiled(compiled.save(tmp_path / "model.npz")), X_test)
+
+
+@pytest.mark.parametrize("model_name", ["lgbm", "xgboost"])
+def test_compiled_matches_native_after_early_stopping(model_name, split):
+    X_train, X_test, y_train, y_test = split
+    # 検証データのlog lossがすぐ悪化するよう、学習率を大きくする
+    model = get_model(model_name, {**MODEL_PARAMS[model_name], "n_estimators": 300, "learning_rate": 0.5})
+    model, best_iteration = train_model_with_early_stopping(model, X_train, y_train, X_test, y_test, early_stopping_rounds=5)
+    assert best_iteration < 300
+    assert_same_proba(model, compile_model(model), X_test)
+
+
+def test_compiled_matches_native_with_missing_values(split):
+    X_train, X_test, y_train, _ = split
+    X_train = X_train.mask(np.random.default_rng(0).random(X_train.shape) < 0.1)
+    X_test = X_test.mask(np.random.default_rng(1).random(X_test.shape) < 0.1)
+    for model_name in ("lgbm", "xgboost"):
+        model = get_model(model_name, MODEL_PARAMS[model_name]).fit(X_train, y_train)
+        assert_same_proba(model, compile_model(model), X_test)
+
+
+def test_lgbm_linear_tree_is_rejected():
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(500, 3)), columns=["a", "b", "c"])
+    y = (X["a"] + rng.normal(size=500) > 0).astype("int64")
+    model = LGBMClassifier(n_estimators=5, linear_tree=True, verbose=-1).fit(X, y)
+    with pytest.raises(ValueError, match="linear"):
+        compile_model(model)
@@ -0,0 +1,21 @@
+import pytest
+import src.train.experiment as experiment
+import src.utils.feature_store as feature_store
+from src.train.experiment import run_experiment
+from src.train.mlflow_logger import wait_for_pending_logs
+
+
+def test_streaming_run_does_not_use_feature_store(project_root, mlflow_tracking, monkeypatch):
+    # streaming=Trueでは月全体を前処理する特徴量ストア（get_features）を通らない
+    def fail(*args, **kwargs):
+        raise AssertionError("get_features must not be called when streaming")
+
+    monkeypatch.setattr(experiment, "get_features", fail)
+    monkeypatch.setattr(feature_store, "get_features", fail)
+
+    metrics = run_experiment(
+        [2014, 1], "logistic_regression", {"max_iter": 200}, "streaming_experiment", streaming=True,
+    )
+    assert wait_for_pending_logs() == {}
+    assert 0.0 <= metrics["test_f1_score"] <= 1.0
+    assert not feature_store.get_store_dir().exists()
@@ -0,0 +1,75 @@
+import mlflow
+import pandas as pd
+import pytest
+from sklearn.linear_model import LogisticRegression
+from src.train.evaluator import evaluate_model_train_test
+from src.train.experiment import build_dataset_params
+from src.train.trainer import get_model, train_model
+from src.train.mlflow_logger import log_experiment_to_mlflow, wait_for_pending_logs
+from src.pipelines.register_best_model import get_best_run
+
+MODEL_PARAMS = {
+    "logistic_regression": {"max_iter": 100},
+    "decision_tree": {"max_depth": 2},
+    "random_forest": {"n_estimators": 2},
+    "lgbm": {"n_estimators": 2, "verbose": -1},
+    "xgboost": {"n_estimators": 2},
+}
+# MLflowに記録されるモデルのフレーバー
+MODEL_FLAVORS = {"lgbm": "lightgbm", "xgboost": "xgboost"}
+
+
+@pytest.fixture(scope="module")
+def data():
+    X = pd.DataFrame({"a": [float(i % 7) for i in range(40)], "b": [float(i % 3) for i in range(40)]})
+    y = pd.Series([int(i % 7 > 3) for i in range(40)], name="is_member")
+    return X, y
+
+
+def test_failed_upload_is_reported_and_not_selected(tmp_path, mlflow_tracking):
+    # アーティファクトの保存先を通常のファイルにして、記録の送信を途中で失敗させる
+    artifact_location = tmp_path / "not_a_directory"
+    artifact_location.write_text("")
+    experiment_name = "failed_upload"
+    mlflow.create_experiment(experiment_name, artifact_location=artifact_location.as_uri())
+
+    X = pd.DataFrame({"x": [0.0, 1.0, 2.0, 3.0] * 5})
+    y = pd.Series([0, 0, 1, 1] * 5, name="is_member")
+    model = LogisticRegression().fit(X, y)
+    metrics = evaluate_model_train_test(model, X, X, y, y)
+    dataset_info, dataset_params = build_dataset_params([2014, 1], X, X, y, y)
+
+    failed_run_id = log_experiment_to_mlflow(
+        model, None, dataset_params, metrics, {}, dataset_info, X, experiment_name, "logistic_regression",
+    )
+    failures = wait_for_pending_logs()
+    assert list(failures) == [failed_run_id]
+    assert mlflow.get_run(failed_run_id).info.status == "FAILED"
+    # メトリクスは送信済みのため、FAILEDのRunのほうがtest_f1_scoreは高い
+    assert mlflow.get_run(failed_run_id).data.metrics["test_f1_score"] == 1.0
+
+    mlflow.set_experiment(experiment_name)
+    with mlflow.start_run() as finished_run:
+        mlflow.log_metric("test_f1_score", 0.5)
+
+    assert get_best_run(experiment_name) == finished_run.info.run_id
+    assert wait_for_pending_logs() == {}
+
+
+def test_concurrent_uploads(data, mlflow_tracking):
+    X, y = data
+    dataset_info, dataset_params = build_dataset_params([2014, 1], X, X, y, y)
+    run_ids = {}
+    # 送信はバックグラウンドのスレッドで並行して行われ、各スレッドでget_model_familyが呼ばれる
+    for model_name, params in MODEL_PARAMS.items():
+        model = train_model(get_model(model_name, params), X, y)
+        metrics = evaluate_model_train_test(model, X, X, y, y)
+        run_ids[model_name] = log_experiment_to_mlflow(
+            model, None, dataset_params, metrics, params, dataset_info, X, "concurrent_uploads", model_name,
+        )
+
+    assert wait_for_pending_logs() == {}
+    for model_name, run_id in run_ids.items():
+        assert mlflow.get_run(run_id).info.status == "FINISHED"
+        flavors = mlflow.models.get_model_info(f"runs:/{run_id}/model").flavors
+        assert MODEL_FLAVORS.get(model_name, "sklearn") in flavors
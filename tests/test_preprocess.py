@@ -0,0 +1,18 @@
+import numpy as np
+import pandas as pd
+from src.utils.preprocess import TimeOfDay, add_time_features, categorize_time
+
+
+def test_add_time_features_matches_categorize_time():
+    df = pd.DataFrame({"starttime": pd.date_range("2014-01-06", periods=24, freq="h")})
+    df = add_time_features(df)
+    assert df["time_category"].tolist() == [categorize_time(h) for h in range(24)]
+
+
+def test_add_time_features_missing_starttime_is_night():
+    df = pd.DataFrame({"starttime": pd.to_datetime(["2014-01-06 08:00:00", None, "2014-01-06 13:30:00"])})
+    df = add_time_features(df)
+    assert df["time_category"].tolist() == [
+        TimeOfDay.MORNING.value, TimeOfDay.NIGHT.value, TimeOfDay.AFTERNOON.value,
+    ]
+    assert np.isnan(df["start_hour"].iloc[1])
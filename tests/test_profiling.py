@@ -0,0 +1,27 @@
+import threading
+import time
+import numpy as np
+from src.utils.profiling import stage, trace_mark, get_trace, trace_metrics
+
+
+def test_stage_reports_rss_delta_and_thread_cpu():
+    mark = trace_mark()
+    with stage("allocate"):
+        data = np.ones(64 * 1024 ** 2 // 8)  # 64MB
+    with stage("spin_in_other_thread"):
+        # 別スレッドのCPU時間はプロセス全体には含まれるが、ステージのスレッドには含まれない
+        def spin():
+            end = time.process_time() + 0.2
+            while time.process_time() < end:
+                pass
+
+        worker = threading.Thread(target=spin)
+        worker.start()
+        worker.join()
+
+    allocate, spin_stage = get_trace(since=mark)
+    assert allocate["rss_delta_mb"] > 50
+    assert allocate["process_peak_rss_mb"] >= allocate["rss_delta_mb"]
+    assert spin_stage["process_cpu_sec"] > spin_stage["thread_cpu_sec"] + 0.05
+    assert "stage_allocate_rss_delta_mb" in trace_metrics([allocate])
+    del data
@@ -0,0 +1,47 @@
+import mlflow
+import pandas as pd
+import pytest
+from sklearn.linear_model import LogisticRegression
+import src.pipelines.register_best_model as register_best_model
+from src.pipelines.register_best_model import export_compiled_predictor, COMPILED_PREDICTOR_TAG
+from src.pipelines.registry_session import get_session
+from src.utils.io import PROJECT_ROOT_ENV
+
+
+@pytest.fixture
+def model_run_id(tmp_path, mlflow_tracking, monkeypatch):
+    # ダウンロードしたモデルのキャッシュも一時ディレクトリに置く
+    monkeypatch.setenv(PROJECT_ROOT_ENV, str(tmp_path))
+    X = pd.DataFrame({"x": [0.0, 1.0, 2.0, 3.0] * 5})
+    y = pd.Series([0, 0, 1, 1] * 5, name="is_member")
+    mlflow.set_experiment("compiled_export")
+    with mlflow.start_run() as run:
+        mlflow.sklearn.log_model(LogisticRegression().fit(X, y), name="model")
+    return run.info.run_id
+
+
+def get_tags(run_id: str) -> dict:
+    return mlflow.get_run(run_id).data.tags
+
+
+def test_export_tags_run_with_artifact_path(model_run_id):
+    artifact_path = export_compiled_predictor(model_run_id)
+    assert artifact_path is not None
+    assert get_tags(model_run_id)[COMPILED_PREDICTOR_TAG] == artifact_path
+
+
+@pytest.mark.parametrize("error, status", [
+    (ValueError("Unsupported model type"), "unsupported"),
+    (RuntimeError("disk full"), "failed"),
+])
+def test_export_failure_is_tagged_and_not_raised(model_run_id, monkeypatch, error, status):
+    def fail(model):
+        raise error
+
+    monkeypatch.setattr(register_best_model, "compile_model", fail)
+    get_session().get_run(model_run_id)  # キャッシュ済みのRunもタグの記録で破棄される
+
+    assert export_compiled_predictor(model_run_id) is None
+    tags = get_session().get_run(model_run_id).data.tags
+    assert tags[COMPILED_PREDICTOR_TAG] == status
+    assert str(error) in tags[f"{COMPILED_PREDICTOR_TAG}_error"]
@@ -0,0 +1,111 @@
+import math
+import mlflow
+import pytest
+from src.utils.io import load_config
+from src.train.experiment import run_experiment
+from src.train.mlflow_logger import wait_for_pending_logs
+from src.pipelines.register_best_model import register_model_from_run, update_alias
+from src.pipelines.registry_session import get_session
+import src.pipelines.retrain_pipeline as retrain_pipeline
+from src.pipelines.retrain_pipeline import retrain_if_needed, inherit_training_params
+from src.train.experiment import get_features
+
+
+BASE_PARAMS = {"n_estimators": 20, "num_leaves": 7, "verbose": -1}
+INCREMENTAL_ROUNDS = 5
+
+
+def find_run(experiment_name: str, retrain_mode: str):
+    """最後に作られた retrain_mode のRunを返す"""
+    wait_for_pending_logs()
+    experiment = mlflow.get_experiment_by_name(experiment_name)
+    runs = mlflow.search_runs(
+        experiment_ids=[experiment.experiment_id],
+        filter_string=f"tags.retrain_mode = '{retrain_mode}'",
+        order_by=["attributes.start_time DESC"],
+        output_format="list",
+    )
+    return runs[0]
+
+
+def promote(run_id: str):
+    config = load_config()
+    update_alias(config["model_name"], register_model_from_run(run_id, config["model_name"]))
+
+
+def count_trees(run_id: str) -> int:
+    return get_session().load_model(run_id).get_raw_model().booster_.num_trees()
+
+
+def test_full_retrain_after_incremental_inherits_full_params(project_root, mlflow_tracking):
+    experiment_name = load_config()["experiment_name"]
+    run_experiment([2014, 1], "lgbm", BASE_PARAMS, experiment_name, tags={"retrain_mode": "full"})
+    base_run = find_run(experiment_name, "full")
+    promote(base_run.info.run_id)
+
+    # threshold=1.0 で自動登録はさせず、登録はテスト側で行う
+    retrain_if_needed(2014, 2, threshold=1.0, mode="incremental", incremental_rounds=INCREMENTAL_ROUNDS, force=True)
+    incremental_run = find_run(experiment_name, "incremental")
+    assert incremental_run.data.tags["base_run_id"] == base_run.info.run_id
+    assert incremental_run.data.params["n_estimators"] == str(BASE_PARAMS["n_estimators"])
+    assert incremental_run.data.params["incremental_rounds"] == str(INCREMENTAL_ROUNDS)
+    assert count_trees(incremental_run.info.run_id) == BASE_PARAMS["n_estimators"] + INCREMENTAL_ROUNDS
+    promote(incremental_run.info.run_id)
+
+    retrain_if_needed(2014, 2, threshold=1.0, mode="full", force=True)
+    full_run = find_run(experiment_name, "full")
+    assert full_run.info.run_id != base_run.info.run_id
+    assert "incremental_rounds" not in full_run.data.params
+    assert full_run.data.params["n_estimators"] == str(BASE_PARAMS["n_estimators"])
+    assert count_trees(full_run.info.run_id) == BASE_PARAMS["n_estimators"]
+
+
+def test_inherit_training_params_follows_base_run(mlflow_tracking):
+    mlflow.set_experiment("inherit_params")
+    with mlflow.start_run() as base_run:
+        mlflow.log_params(BASE_PARAMS)
+        mlflow.set_tags({"model_type": "lgbm", "retrain_mode": "full"})
+    # 以前の増分再学習のRunは n_estimators に追加した回数だけを記録していた
+    with mlflow.start_run() as incremental_run:
+        mlflow.log_params({**BASE_PARAMS, "n_estimators": INCREMENTAL_ROUNDS})
+        mlflow.set_tags({"model_type": "lgbm", "retrain_mode": "incremental", "base_run_id": base_run.info.run_id})
+    with mlflow.start_run() as second_incremental_run:
+        mlflow.log_params({**BASE_PARAMS, "incremental_rounds": INCREMENTAL_ROUNDS})
+        mlflow.set_tags({"model_type": "lgbm", "retrain_mode": "incremental", "base_run_id": incremental_run.info.run_id})
+
+    model_name, params = inherit_training_params(get_session(), second_incremental_run.info.run_id)
+    assert model_name == "lgbm"
+    assert params == BASE_PARAMS
+
+
+@pytest.mark.parametrize("window_months", [1, 2])
+def test_compare_uses_new_run_test_rows(project_root, mlflow_tracking, monkeypatch, window_months):
+    experiment_name = load_config()["experiment_name"]
+    run_experiment([2014, 1], "lgbm", BASE_PARAMS, experiment_name, tags={"retrain_mode": "full"})
+    promote(find_run(experiment_name, "full").info.run_id)
+
+    compared = []
+    compare_performance = retrain_pipeline.compare_performance
+
+    def record(old_metrics, new_metrics, threshold=0.01):
+        compared.append(old_metrics)
+        return compare_performance(old_metrics, new_metrics, threshold)
+
+    monkeypatch.setattr(retrain_pipeline, "compare_performance", record)
+    retrain_if_needed(2014, 2, threshold=1.0, window_months=window_months, force=True)
+    assert wait_for_pending_logs() == {}
+
+    # Productionモデルは月全体ではなく、新モデルのテスト用の行で評価される
+    n_rows = sum(len(get_features(2014, month)) for month in range(3 - window_months, 3))
+    assert sum(map(sum, compared[0]["confusion_matrix"])) == math.ceil(n_rows * 0.2)
+
+def test_production_eval_features_keep_row_order(project_root, mlflow_tracking):
+    experiment_name = load_config()["experiment_name"]
+    run_experiment([2014, 1], "lgbm", BASE_PARAMS, experiment_name, tags={"retrain_mode": "full"})
+    prod_run_id = find_run(experiment_name, "full").info.run_id
+
+    # 利用回数テーブルが違っても、前処理後の行と正解ラベルの並びは学習時と同じ
+    df_prod = retrain_pipeline.get_production_eval_features(2014, 2, prod_run_id)
+    df_new = get_features(2014, 2)
+    assert df_prod.index.equals(df_new.index)
+    assert df_prod["is_member"].equals(df_new["is_member"])
@@ -0,0 +1,37 @@
+import mlflow
+import src.train.search as search
+from src.train.search import successive_halving
+from src.train.trainer import get_boosted_rounds
+from src.train.mlflow_logger import wait_for_pending_logs
+
+CANDIDATES = [
+    {"num_leaves": 7, "learning_rate": 0.1, "verbose": -1},
+    {"num_leaves": 15, "learning_rate": 0.05, "verbose": -1},
+    {"num_leaves": 3, "learning_rate": 0.2, "verbose": -1},
+]
+
+
+def test_successive_halving_continues_survivors(project_root, mlflow_tracking, monkeypatch):
+    calls = []
+    train_model_with_early_stopping = search.train_model_with_early_stopping
+
+    def record(model, *args, base_model=None, **kwargs):
+        done = get_boosted_rounds(base_model) if base_model is not None else 0
+        calls.append((done, model.get_params()["n_estimators"]))
+        return train_model_with_early_stopping(model, *args, base_model=base_model, **kwargs)
+
+    monkeypatch.setattr(search, "train_model_with_early_stopping", record)
+
+    result = successive_halving(
+        [2014, 1], "lgbm", "search_experiment", candidates=CANDIDATES,
+        min_rounds=5, max_rounds=15, eta=3, early_stopping_rounds=100, max_duration_min=60,
+    )
+    assert wait_for_pending_logs() == {}
+
+    # 初回の段は3候補を5回ずつ、次の段は残った1候補に10回を追加する
+    assert calls == [(0, 5), (0, 5), (0, 5), (5, 10)]
+    assert result["params"]["n_estimators"] <= 15
+
+    parent = mlflow.get_run(mlflow.get_run(result["run_id"]).data.tags["mlflow.parentRunId"])
+    assert parent.data.params["max_duration_min"] == "60"
+    assert parent.data.metrics["total_boosting_rounds"] == 25
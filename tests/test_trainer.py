@@ -0,0 +1,61 @@
+import sys
+import types
+import numpy as np
+import pandas as pd
+import pytest
+from src.train.trainer import MODEL_REGISTRY, get_model, get_model_family, train_model_with_early_stopping, get_boosted_rounds
+
+MODEL_PARAMS = {
+    "logistic_regression": {"max_iter": 100},
+    "decision_tree": {"max_depth": 2},
+    "random_forest": {"n_estimators": 2},
+    "lgbm": {"n_estimators": 2, "verbose": -1},
+    "xgboost": {"n_estimators": 2},
+}
+
+
+@pytest.mark.parametrize("model_name", list(MODEL_REGISTRY))
+def test_get_model_family(model_name):
+    assert get_model_family(get_model(model_name, MODEL_PARAMS[model_name])) == model_name
+
+
+def test_get_model_family_with_half_imported_modules(monkeypatch):
+    models = {name: get_model(name, params) for name, params in MODEL_PARAMS.items()}
+    # 別スレッドでimport中のモジュールは、クラスが定義される前の状態でsys.modulesに入っている
+    for module_name, _ in MODEL_REGISTRY.values():
+        monkeypatch.setitem(sys.modules, module_name, types.ModuleType(module_name))
+
+    for model_name, model in models.items():
+        assert get_model_family(model) == model_name
+
+
+def test_get_model_family_subclass_and_unknown():
+    from lightgbm import LGBMClassifier
+
+    class CustomLGBM(LGBMClassifier):
+        pass
+
+    assert get_model_family(CustomLGBM()) == "lgbm"
+    assert get_model_family(object()) is None
+
+
+@pytest.mark.parametrize("model_name", ["lgbm", "xgboost"])
+def test_train_with_base_model_continues(model_name):
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.normal(size=(400, 2)), columns=["a", "b"])
+    y = pd.Series((X["a"] + rng.normal(scale=1.0, size=400) > 0).astype("int64"), name="is_member")
+    params = {**MODEL_PARAMS[model_name], "learning_rate": 0.3}
+    full, _ = train_model_with_early_stopping(
+        get_model(model_name, {**params, "n_estimators": 6}), X, y, X.copy(), y.copy(), early_stopping_rounds=100,
+    )
+    base, _ = train_model_with_early_stopping(
+        get_model(model_name, {**params, "n_estimators": 2}), X, y, X.copy(), y.copy(), early_stopping_rounds=100,
+    )
+    continued, best_iteration = train_model_with_early_stopping(
+        get_model(model_name, {**params, "n_estimators": 4}), X, y, X.copy(), y.copy(), early_stopping_rounds=100, base_model=base,
+    )
+
+    # 最良の回数とブースティング回数はbase_modelの木を含めた通算
+    assert get_boosted_rounds(continued) == 6
+    assert best_iteration <= 6
+    assert (continued.predict_proba(X) == full.predict_proba(X)).all()